@@ -1,9 +1,11 @@
+import asyncio
 import json
 from interactions import Client
 from utils import logutils
 import interactions
 import os
 from dotenv import load_dotenv
+from database import close_connection_pools
 
 load_dotenv()
 
@@ -28,6 +30,12 @@ async def on_ready():
     logger.info(f"Connected to {len(client.guilds)} guilds")
     logger.info(f"Connected to {client.guilds}")
 
+async def main():
+    try:
+        await client.astart()
+    finally:
+        # The Redis pools are shared by every extension, so they are closed here once the bot stops
+        await close_connection_pools()
 
 if __name__ == '__main__':
     extensions = [
@@ -42,5 +50,5 @@ if __name__ == '__main__':
         except interactions.errors.ExtensionLoadException as e:
             logger.error(f"Failed to load extension {extension}.", exc_info=e)
 
-    client.start()
+    asyncio.run(main())
 
@@ -0,0 +1,83 @@
+"""
+Micro-benchmarks building BlacklistRecord objects against the old per-item dict decoding.
+
+Runs on synthetic HGETALL replies, so no Redis server is needed. Reports the time and
+the peak allocated memory (tracemalloc) per 10k records for reading only the username
+(the search path) and for reading every field.
+
+    python benchmarks/record_benchmark.py --count 10000 --repeat 5
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from database import USER_FIELDS, BlacklistRecord, encode_user_record
+
+
+def make_replies(count):
+    rng = random.Random(count)
+    replies = []
+    for offset in range(count):
+        username = "".join(rng.choices(string.ascii_lowercase + string.digits + "_", k=rng.randint(4, 16)))
+        folder_id = "".join(rng.choices(string.ascii_letters + string.digits, k=33))
+        record = encode_user_record(username, "Member of target server", f"https://drive.google.com/drive/folders/{folder_id}", folder_id)
+        replies.append((str(100000000000000000 + offset), {k.encode('utf-8'): v.encode('utf-8') for k, v in record.items()}))
+    return replies
+
+
+def dict_username(replies):
+    return [{k.decode('utf-8'): v.decode('utf-8') for k, v in raw.items()}.get("username") for _, raw in replies]
+
+
+def dict_all_fields(replies):
+    return [{k.decode('utf-8'): v.decode('utf-8') for k, v in raw.items()} for _, raw in replies]
+
+
+def record_username(replies):
+    return [BlacklistRecord(user_id, raw).username for user_id, raw in replies]
+
+
+def record_all_fields(replies):
+    records = [BlacklistRecord(user_id, raw) for user_id, raw in replies]
+    for record in records:
+        for field in USER_FIELDS:
+            getattr(record, field)
+    return records
+
+
+def measure(func, replies, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(replies)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    result = func(replies)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    replies = make_replies(args.count)
+    scale = 10_000 / args.count
+    print(f"{'strategy':>20} {'ms/10k':>8} {'peak KiB/10k':>13}")
+    for name, func in (("dict, username", dict_username), ("record, username", record_username),
+                       ("dict, all fields", dict_all_fields), ("record, all fields", record_all_fields)):
+        seconds, peak = measure(func, replies, args.repeat)
+        print(f"{name:>20} {seconds * 1000 * scale:>8.2f} {peak / 1024 * scale:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
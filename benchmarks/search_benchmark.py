@@ -0,0 +1,79 @@
+"""
+Benchmarks RedisDB.search_users against the old full-scan search.
+
+Seeds a scratch Redis database with synthetic users and times both strategies at
+10k and 100k users. The scratch database is flushed, so never point --db at a
+database that holds real data.
+
+    python benchmarks/search_benchmark.py --db 15
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from database import USERS_KEY, RedisDB, _queue_search_index_update, user_key
+
+PATTERNS = ["ab", "xyz", "user_12", "qwerty"]
+
+
+def seed(db, count, batch_size=1000):
+    rng = random.Random(count)
+    db.redis.flushdb()
+    for start in range(0, count, batch_size):
+        with db.redis.pipeline(transaction=False) as pipeline:
+            for offset in range(start, min(start + batch_size, count)):
+                user_id = str(100000000000000000 + offset)
+                username = "".join(rng.choices(string.ascii_lowercase + string.digits + "_", k=rng.randint(4, 16)))
+                pipeline.hset(user_key(user_id), mapping={
+                    "username": username,
+                    "reason": "Member of target server",
+                    "proof_link": "https://drive.google.com/drive/folders/benchmark",
+                    "folder_id": "benchmark"
+                })
+                pipeline.sadd(USERS_KEY, user_id)
+                _queue_search_index_update(pipeline, user_id, None, username)
+            pipeline.execute()
+
+
+def scan_search(db, pattern):
+    """
+    The pre-index implementation: one HGET per user, then a get_user per match.
+    """
+    matched_data = []
+    for user_id in db.list_all_users():
+        username = db.redis.hget(user_key(user_id), "username").decode('utf-8')
+        if pattern.lower() in username.lower():
+            matched_data.append((user_id, db.redis.hgetall(user_key(user_id))))
+    return matched_data
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return (time.perf_counter() - start) * 1000, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", type=int, required=True, help="Scratch Redis database index (will be flushed)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--skip-scan", action="store_true", help="Only time the indexed search")
+    args = parser.parse_args()
+
+    db = RedisDB(db=args.db)
+    print(f"{'users':>8} {'pattern':>10} {'matches':>8} {'indexed ms':>11} {'scan ms':>10}")
+    for size in args.sizes:
+        seed(db, size)
+        for pattern in PATTERNS:
+            indexed_ms, matches = timed(db.search_users, pattern)
+            scan_ms = "-" if args.skip_scan else f"{timed(scan_search, db, pattern)[0]:.1f}"
+            print(f"{size:>8} {pattern:>10} {matches:>8} {indexed_ms:>11.1f} {scan_ms:>10}")
+    db.redis.flushdb()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Runs the same RedisDB workloads against the Redis and in-process storage backends.
+
+The memory backend needs no server, so extension-level performance work can be measured
+anywhere; comparing it with a real server shows how much of a workload is round trips.
+The Redis backend uses a scratch database that is flushed, so never point --db at a
+database that holds real data.
+
+    python benchmarks/workload_benchmark.py --backends memory
+    python benchmarks/workload_benchmark.py --backends memory redis --db 15 --users 20000
+"""
+import argparse
+import io
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from database import PROOF_LINK_FORMAT, RedisDB, get_redis_client
+from utils.memory_redis import MemoryRedis
+
+
+def make_records(count):
+    rng = random.Random(count)
+    records = []
+    for offset in range(count):
+        folder_id = "".join(rng.choices(string.ascii_letters + string.digits, k=33))
+        records.append((str(100000000000000000 + offset), {
+            "username": "".join(rng.choices(string.ascii_lowercase + string.digits + "_", k=rng.randint(4, 16))),
+            "reason": "Member of target server",
+            "proof_link": PROOF_LINK_FORMAT.format(folder_id),
+            "folder_id": folder_id,
+        }))
+    return records
+
+
+def workloads(records, sample_size):
+    sample = [user_id for user_id, _ in records[:sample_size]]
+    return [
+        ("bulk_import", lambda db: db.bulk_import(records)),
+        (f"set_user x{sample_size}", lambda db: [db.set_user(user_id, *(info[field] for field in ("username", "reason", "proof_link", "folder_id"))) for user_id, info in records[:sample_size]]),
+        (f"get_user x{sample_size}", lambda db: [db.get_user(user_id) for user_id in sample]),
+        (f"exists x{sample_size}", lambda db: [db.exists(user_id) for user_id in sample]),
+        ("get_users_info", lambda db: db.get_users_info(sample)),
+        ("search_users x4", lambda db: [db.search_users(pattern) for pattern in ("ab", "xyz", "user_1", "qwerty")]),
+        ("iter_users_info", lambda db: sum(1 for _ in db.iter_users_info())),
+        ("export", lambda db: db.export(io.StringIO())),
+        (f"delete_user x{sample_size}", lambda db: [db.delete_user(user_id) for user_id in sample]),
+    ]
+
+
+def run(db, records, sample_size):
+    db.redis.flushdb()
+    timings = []
+    for name, workload in workloads(records, sample_size):
+        start = time.perf_counter()
+        workload(db)
+        timings.append((name, (time.perf_counter() - start) * 1000))
+    db.redis.flushdb()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backends", nargs="+", choices=("memory", "redis"), default=["memory", "redis"])
+    parser.add_argument("--db", type=int, help="Scratch Redis database index (will be flushed); required for the redis backend")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--sample-size", type=int, default=1000)
+    args = parser.parse_args()
+    if "redis" in args.backends and args.db is None:
+        parser.error("--db is required for the redis backend")
+
+    records = make_records(args.users)
+    results = {}
+    for backend in args.backends:
+        # cache_size=0 so that every read reaches the backend
+        client = MemoryRedis() if backend == "memory" else get_redis_client(args.db)
+        results[backend] = run(RedisDB(db=args.db or 0, cache_size=0, client=client), records, args.sample_size)
+
+    print(f"{args.users} users")
+    print(f"{'workload':>20}" + "".join(f" {backend + ' ms':>12}" for backend in args.backends))
+    for index, (name, _) in enumerate(results[args.backends[0]]):
+        print(f"{name:>20}" + "".join(f" {results[backend][index][1]:>12.1f}" for backend in args.backends))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,64 +1,1098 @@
-from functools import lru_cache, wraps
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from functools import wraps
+from typing import NamedTuple, Optional
 from utils import logutils
+from utils.cache import TTLCache
+from utils.keyprefix import AsyncPrefixedRedis, PrefixedRedis, db_key_prefix
+from utils.latency import LatencyTracker, instrument_methods
+from utils.memory_redis import AsyncMemoryRedis, MemoryRedis, get_memory_store, script_implementation
 import redis
+import redis.asyncio as aioredis
+from redis.asyncio.cluster import ClusterNode as AsyncClusterNode
+from redis.cluster import ClusterNode
 
 logger = logutils.CustomLogger(__name__)
+# Call latencies of every RedisDB/AsyncRedisDB method in this process
+LATENCY = LatencyTracker()
+
+_connection_pools = {}
+_cluster_clients = {}
+_cluster_pubsub_clients = {}
+REDIS_MODES = ("standalone", "sentinel", "cluster")
+
+def _pool_settings():
+    """
+    Connection settings shared by every pool, read from the environment:
+    REDIS_HOST, REDIS_PORT, REDIS_PASSWORD, REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT,
+    REDIS_SOCKET_TIMEOUT and REDIS_CONNECT_TIMEOUT (timeouts in seconds).
+    """
+    def optional_float(name):
+        value = os.getenv(name)
+        return float(value) if value else None
+
+    return {
+        "host": os.getenv("REDIS_HOST", "localhost"),
+        "port": int(os.getenv("REDIS_PORT", "6379")),
+        "password": os.getenv("REDIS_PASSWORD") or None,
+        "max_connections": int(os.getenv("REDIS_MAX_CONNECTIONS", "32")),
+        "timeout": float(os.getenv("REDIS_POOL_TIMEOUT", "20")),
+        "socket_timeout": optional_float("REDIS_SOCKET_TIMEOUT"),
+        "socket_connect_timeout": optional_float("REDIS_CONNECT_TIMEOUT"),
+    }
+
+def redis_mode():
+    """
+    Returns the deployment mode selected by REDIS_MODE:
+    - standalone (default): a single server at REDIS_HOST:REDIS_PORT.
+    - sentinel: the master of REDIS_SENTINEL_SERVICE (default mymaster), discovered through
+      the comma-separated host:port list in REDIS_SENTINELS. Connections follow failovers.
+    - cluster: a Redis Cluster reached through REDIS_CLUSTER_NODES (host:port list, defaults to
+      REDIS_HOST:REDIS_PORT). Cluster has no numbered databases, so database N is mapped onto
+      keys prefixed with the {dbN} hash tag (see utils.keyprefix).
+    """
+    mode = os.getenv("REDIS_MODE", "standalone").lower()
+    if mode not in REDIS_MODES:
+        raise ValueError(f"Unknown REDIS_MODE {mode!r}, expected one of {', '.join(REDIS_MODES)}")
+    return mode
+
+def _parse_nodes(value):
+    nodes = []
+    for node in value.split(","):
+        host, _, port = node.strip().rpartition(":")
+        nodes.append((host, int(port)))
+    return nodes
+
+def _sentinel_pool(db, is_async):
+    settings = _pool_settings()
+    sentinel_class = aioredis.Sentinel if is_async else redis.Sentinel
+    sentinel = sentinel_class(
+        _parse_nodes(os.getenv("REDIS_SENTINELS", "localhost:26379")),
+        sentinel_kwargs={
+            "password": os.getenv("REDIS_SENTINEL_PASSWORD") or None,
+            "socket_timeout": settings["socket_timeout"],
+            "socket_connect_timeout": settings["socket_connect_timeout"],
+        },
+    )
+    client = sentinel.master_for(
+        os.getenv("REDIS_SENTINEL_SERVICE", "mymaster"),
+        db=db,
+        password=settings["password"],
+        max_connections=settings["max_connections"],
+        socket_timeout=settings["socket_timeout"],
+        socket_connect_timeout=settings["socket_connect_timeout"],
+    )
+    return client.connection_pool
+
+def get_connection_pool(db=0, is_async=False, mode=None):
+    """
+    Returns the process-wide connection pool for a Redis database, creating it on first use.
+    Standalone pools block (up to REDIS_POOL_TIMEOUT) instead of failing when all connections
+    are busy; sentinel pools resolve the current master on connect.
+    """
+    mode = mode or redis_mode()
+    if mode == "cluster":
+        raise ValueError("Cluster clients manage their own per-node pools; use get_cluster_client")
+    key = (mode, db, is_async)
+    if key not in _connection_pools:
+        if mode == "sentinel":
+            _connection_pools[key] = _sentinel_pool(db, is_async)
+        else:
+            pool_class = aioredis.BlockingConnectionPool if is_async else redis.BlockingConnectionPool
+            _connection_pools[key] = pool_class(db=db, **_pool_settings())
+    return _connection_pools[key]
+
+def get_cluster_client(is_async=False):
+    """
+    Returns the process-wide RedisCluster client, creating it on first use. It is shared by
+    every logical database; get_redis_client wraps it with the database's key prefix.
+    """
+    if is_async not in _cluster_clients:
+        settings = _pool_settings()
+        nodes = _parse_nodes(os.getenv("REDIS_CLUSTER_NODES") or f"{settings['host']}:{settings['port']}")
+        cluster_class, node_class = (aioredis.RedisCluster, AsyncClusterNode) if is_async else (redis.RedisCluster, ClusterNode)
+        _cluster_clients[is_async] = cluster_class(
+            startup_nodes=[node_class(host, port) for host, port in nodes],
+            password=settings["password"],
+            max_connections=settings["max_connections"],
+            socket_timeout=settings["socket_timeout"],
+            socket_connect_timeout=settings["socket_connect_timeout"],
+        )
+    return _cluster_clients[is_async]
+
+def get_cluster_pubsub_client():
+    """
+    Returns the process-wide redis.asyncio client async subscribers use in cluster mode,
+    creating it on first use. redis.asyncio's RedisCluster has no pub/sub; cluster PUBLISH
+    reaches every node, so subscribers connect to the first node of REDIS_CLUSTER_NODES.
+    """
+    settings = _pool_settings()
+    host, port = _parse_nodes(os.getenv("REDIS_CLUSTER_NODES") or f"{settings['host']}:{settings['port']}")[0]
+    if (host, port) not in _cluster_pubsub_clients:
+        _cluster_pubsub_clients[(host, port)] = aioredis.StrictRedis(
+            connection_pool=aioredis.BlockingConnectionPool(**{**settings, "host": host, "port": port})
+        )
+    return _cluster_pubsub_clients[(host, port)]
+
+def storage_backend():
+    """
+    Returns the storage backend selected by REDIS_BACKEND: "redis" (default) for a Redis
+    server, or "memory" for the in-process stand-in from utils.memory_redis, which needs no
+    server and keeps data only for the lifetime of the process.
+    """
+    backend = os.getenv("REDIS_BACKEND", "redis").lower()
+    if backend not in ("redis", "memory"):
+        raise ValueError(f"Unknown REDIS_BACKEND {backend!r}, expected 'redis' or 'memory'")
+    return backend
+
+def get_redis_client(db=0, mode=None):
+    """
+    Returns a synchronous client for db, backed by the shared pool (or cluster client) of
+    the deployment mode, which defaults to REDIS_MODE.
+    """
+    if storage_backend() == "memory":
+        return MemoryRedis(get_memory_store(db))
+    mode = mode or redis_mode()
+    if mode == "cluster":
+        return PrefixedRedis(get_cluster_client(), db_key_prefix(db))
+    return redis.StrictRedis(connection_pool=get_connection_pool(db, mode=mode))
+
+def get_async_redis_client(db=0, mode=None):
+    """
+    Returns a redis.asyncio client for db, backed by the shared pool (or cluster client) of
+    the deployment mode, which defaults to REDIS_MODE.
+    """
+    if storage_backend() == "memory":
+        return AsyncMemoryRedis(get_memory_store(db))
+    mode = mode or redis_mode()
+    if mode == "cluster":
+        return AsyncPrefixedRedis(get_cluster_client(is_async=True), db_key_prefix(db), pubsub_client=get_cluster_pubsub_client())
+    return aioredis.StrictRedis(connection_pool=get_connection_pool(db, is_async=True, mode=mode))
+
+async def close_connection_pools():
+    """
+    Disconnects every shared pool and cluster client, e.g. on shutdown.
+    """
+    for pool in list(_connection_pools.values()):
+        result = pool.disconnect()
+        if asyncio.iscoroutine(result):
+            await result
+    _connection_pools.clear()
+    for is_async, client in list(_cluster_clients.items()):
+        if is_async:
+            await client.aclose()
+        else:
+            client.close()
+    _cluster_clients.clear()
+    for client in list(_cluster_pubsub_clients.values()):
+        await client.aclose(close_connection_pool=True)
+    _cluster_pubsub_clients.clear()
+
+def copy_database(db, source_mode, target_mode, batch_size=500):
+    """
+    Copies every key of database db from one deployment mode to another with DUMP/RESTORE,
+    keeping TTLs and replacing existing keys; e.g. standalone -> cluster moves numbered
+    database db onto its {dbN} key prefix. Returns the number of keys copied.
+    """
+    source = get_redis_client(db, source_mode)
+    target = get_redis_client(db, target_mode)
+    copied = 0
+    batch = []
+
+    def flush(keys):
+        with source.pipeline(transaction=False) as pipeline:
+            for key in keys:
+                pipeline.dump(key)
+                pipeline.pttl(key)
+            replies = pipeline.execute()
+        with target.pipeline(transaction=False) as pipeline:
+            for key, payload, ttl in zip(keys, replies[::2], replies[1::2]):
+                if payload is not None:
+                    pipeline.restore(key, max(ttl, 0), payload, replace=True)
+            pipeline.execute()
+        return sum(payload is not None for payload in replies[::2])
+
+    for key in source.scan_iter(count=batch_size):
+        batch.append(key)
+        if len(batch) >= batch_size:
+            copied += flush(batch)
+            batch = []
+    if batch:
+        copied += flush(batch)
+    return copied
 
 def cache_invalidation_on_user_change(func):
     @wraps(func)
     def wrapper(self, user_id, *args, **kwargs):
         result = func(self, user_id, *args, **kwargs)
-        self.get_user.cache_clear()
+        self.user_cache.invalidate(user_id)
         return result
     return wrapper
 
+def async_cache_invalidation_on_user_change(func):
+    @wraps(func)
+    async def wrapper(self, user_id, *args, **kwargs):
+        result = await func(self, user_id, *args, **kwargs)
+        self.user_cache.invalidate(user_id)
+        return result
+    return wrapper
+
+USER_KEY = "blacklist:user:{}"
+USERS_KEY = "blacklist:users"
+USER_FIELDS = ("username", "reason", "proof_link", "folder_id")
+VERSION_KEY = "blacklist:version"
+EVENTS_CHANNEL = "blacklist:events:{}"
+CHANGELOG_KEY = "blacklist:changelog"
+CHANGELOG_OFFSETS_KEY = "blacklist:changelog:offsets"
+# sha256 of proof image content -> Drive file ID holding it, for deduplicating uploads
+PROOF_FILES_KEY = "blacklist:proof-files"
+CHANGELOG_MAXLEN = 100000
+SEARCH_NGRAM_SIZE = 3
+SEARCH_NGRAM_KEY = "blacklist:search:ngram:{}"
+SEARCH_NAMES_KEY = "blacklist:search:names"
+SEARCH_PREFIX_LIMIT = 100
+PROOF_LINK_FORMAT = "https://drive.google.com/drive/folders/{}"
+# Reasons stored as a reason_id index into this table instead of repeating the text in every
+# record. Only ever append to it: stored records refer to entries by position.
+INTERNED_REASONS = (
+    "Member of target server",
+)
+_REASON_IDS = {reason: str(index) for index, reason in enumerate(INTERNED_REASONS)}
+MEMORY_REPORT_SCRATCH_KEY = "blacklist:memory-report:scratch"
+SYNC_DETAILS_KEY = "sync_details:{}"
+LAST_SYNC_HASH_KEY = "last_sync_hash"
+SYNC_CLAIM_KEY = "sync_claim:{}"
+SYNC_CLAIM_TTL = 900
+# Sorted set of user_id scored by the unix time their blacklist entry expires at
+EXPIRY_KEY = "blacklist:expiry"
+EXPIRY_SWEEP_BATCH = 100
+
+# KEYS: sync_details:{guild_id}, last_sync_hash, sync_claim:{guild_id}
+# ARGV: guild_id, sync_hash, claim token, claim ttl (ms)
+CLAIM_SYNC_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 and redis.call('HGET', KEYS[2], ARGV[1]) == ARGV[2] then
+    return {'synced', redis.call('HGETALL', KEYS[1])}
+end
+if redis.call('SET', KEYS[3], ARGV[3], 'NX', 'PX', ARGV[4]) then
+    return {'claimed'}
+end
+return {'busy'}
+"""
+
+# KEYS: sync_details:{guild_id}, last_sync_hash, sync_claim:{guild_id}
+# ARGV: guild_id, sync_hash, channel_id, count, claim token, synced_at (unix seconds)
+COMMIT_SYNC_SCRIPT = """
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('HSET', KEYS[1], 'channel_id', ARGV[3], 'count', ARGV[4], 'synced_at', ARGV[6])
+if redis.call('GET', KEYS[3]) == ARGV[5] then
+    redis.call('DEL', KEYS[3])
+end
+return 1
+"""
+
+# KEYS: sync_claim:{guild_id}
+# ARGV: claim token, claim ttl (ms)
+RENEW_SYNC_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# KEYS: sync_claim:{guild_id}
+# ARGV: claim token
+RELEASE_SYNC_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# KEYS: blacklist:user:{user_id}, blacklist:users, blacklist:expiry, blacklist:search:names,
+#       blacklist:changelog, blacklist:version, then the n-gram keys to remove the user from
+#       followed by the n-gram keys to add it to
+# ARGV: user_id, 1 if the user is expected to exist, expected username, expires_at ('' for
+#       none), old search names member, new search names member, events channel, changelog
+#       maxlen, ts, number of n-gram keys to remove from, then the record's field/value pairs
+# Returns nil without writing if the stored username is not the expected one.
+SET_USER_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], 'username')
+if (current ~= false) ~= (ARGV[2] == '1') or (current and current ~= ARGV[3]) then
+    return false
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], unpack(ARGV, 11))
+redis.call('SADD', KEYS[2], ARGV[1])
+if ARGV[4] == '' then
+    redis.call('ZREM', KEYS[3], ARGV[1])
+else
+    redis.call('ZADD', KEYS[3], ARGV[4], ARGV[1])
+end
+local removed = tonumber(ARGV[10])
+for i = 7, 6 + removed do
+    redis.call('SREM', KEYS[i], ARGV[1])
+end
+for i = 7 + removed, #KEYS do
+    redis.call('SADD', KEYS[i], ARGV[1])
+end
+if ARGV[5] ~= '' then
+    redis.call('ZREM', KEYS[4], ARGV[5])
+end
+redis.call('ZADD', KEYS[4], 0, ARGV[6])
+redis.call('XADD', KEYS[5], 'MAXLEN', '~', ARGV[8], '*', 'op', current and 'update' or 'add', 'user_id', ARGV[1], 'ts', ARGV[9])
+redis.call('PUBLISH', ARGV[7], 'set:' .. ARGV[1])
+return redis.call('INCR', KEYS[6])
+"""
+
+# KEYS: blacklist:expiry, blacklist:users, blacklist:search:names, blacklist:changelog,
+#       blacklist:version, then per user its blacklist:user:{user_id} key followed by the
+#       n-gram keys of its username
+# ARGV: events channel, changelog maxlen, ts, then per user: user_id, expected username ('' if
+#       no record is expected), search names member, expected expiry score ('' to not check
+#       it) and number of n-gram keys
+# Users whose stored username or expiry score differ from the expected ones are left alone.
+# Returns the blacklist version (bumped if any user was removed) followed by the removed user_ids.
+REMOVE_USERS_SCRIPT = """
+local removed = {}
+local k = 6
+for a = 4, #ARGV, 5 do
+    local user_id, grams = ARGV[a], tonumber(ARGV[a + 4])
+    local current = redis.call('HGET', KEYS[k], 'username')
+    local score = redis.call('ZSCORE', KEYS[1], user_id)
+    if (current or '') == ARGV[a + 1] and (ARGV[a + 3] == '' or (score and tonumber(score) == tonumber(ARGV[a + 3]))) then
+        redis.call('ZREM', KEYS[1], user_id)
+        if current then
+            redis.call('DEL', KEYS[k])
+            redis.call('SREM', KEYS[2], user_id)
+            for i = k + 1, k + grams do
+                redis.call('SREM', KEYS[i], user_id)
+            end
+            redis.call('ZREM', KEYS[3], ARGV[a + 2])
+            redis.call('XADD', KEYS[4], 'MAXLEN', '~', ARGV[2], '*', 'op', 'remove', 'user_id', user_id, 'ts', ARGV[3])
+            redis.call('PUBLISH', ARGV[1], 'del:' .. user_id)
+            removed[#removed + 1] = user_id
+        end
+    end
+    k = k + 1 + grams
+end
+local version = redis.call('GET', KEYS[5]) or '0'
+if #removed > 0 then
+    version = redis.call('INCR', KEYS[5])
+end
+return {version, unpack(removed)}
+"""
+
+# In-process equivalents of the scripts above, used by the memory storage backend
+
+@script_implementation(CLAIM_SYNC_SCRIPT)
+def _claim_sync(client, keys, args):
+    details_key, hashes_key, claim_key = keys
+    guild_id, sync_hash, token, ttl = args
+    if client.exists(details_key) and client.hget(hashes_key, guild_id) == str(sync_hash).encode('utf-8'):
+        return [b"synced", [item for pair in client.hgetall(details_key).items() for item in pair]]
+    if client.set(claim_key, token, nx=True, px=int(ttl)):
+        return [b"claimed"]
+    return [b"busy"]
+
+@script_implementation(COMMIT_SYNC_SCRIPT)
+def _commit_sync(client, keys, args):
+    details_key, hashes_key, claim_key = keys
+    guild_id, sync_hash, channel_id, count, token, synced_at = args
+    client.hset(hashes_key, guild_id, sync_hash)
+    client.hset(details_key, mapping={"channel_id": channel_id, "count": count, "synced_at": synced_at})
+    if client.get(claim_key) == str(token).encode('utf-8'):
+        client.delete(claim_key)
+    return 1
+
+@script_implementation(RENEW_SYNC_SCRIPT)
+def _renew_sync(client, keys, args):
+    if client.get(keys[0]) == str(args[0]).encode('utf-8'):
+        return int(client.pexpire(keys[0], int(args[1])))
+    return 0
+
+@script_implementation(RELEASE_SYNC_SCRIPT)
+def _release_sync(client, keys, args):
+    if client.get(keys[0]) == str(args[0]).encode('utf-8'):
+        return client.delete(keys[0])
+    return 0
+
+@script_implementation(SET_USER_SCRIPT)
+def _set_user(client, keys, args):
+    user_key, users_key, expiry_key, names_key, changelog_key, version_key, *gram_keys = keys
+    user_id, exists, username, expires_at, old_member, new_member, channel, maxlen, ts, removed, *fields = args
+    current = client.hget(user_key, "username")
+    if (current is not None) != (exists == "1") or (current is not None and current != username.encode('utf-8')):
+        return None
+    client.delete(user_key)
+    client.hset(user_key, mapping=dict(zip(fields[::2], fields[1::2])))
+    client.sadd(users_key, user_id)
+    if expires_at == "":
+        client.zrem(expiry_key, user_id)
+    else:
+        client.zadd(expiry_key, {user_id: float(expires_at)})
+    for gram_key in gram_keys[:int(removed)]:
+        client.srem(gram_key, user_id)
+    for gram_key in gram_keys[int(removed):]:
+        client.sadd(gram_key, user_id)
+    if old_member:
+        client.zrem(names_key, old_member)
+    client.zadd(names_key, {new_member: 0})
+    client.xadd(changelog_key, {"op": "add" if current is None else "update", "user_id": user_id, "ts": ts}, maxlen=int(maxlen), approximate=True)
+    client.publish(channel, f"set:{user_id}")
+    return client.incr(version_key)
+
+@script_implementation(REMOVE_USERS_SCRIPT)
+def _remove_users(client, keys, args):
+    expiry_key, users_key, names_key, changelog_key, version_key = keys[:5]
+    channel, maxlen, ts = args[:3]
+    removed = []
+    k = 5
+    for a in range(3, len(args), 5):
+        user_id, username, member, expected_score, grams = args[a:a + 5]
+        grams = int(grams)
+        current = client.hget(keys[k], "username")
+        score = client.zscore(expiry_key, user_id)
+        if (current or b"") == username.encode('utf-8') and (expected_score == "" or (score is not None and score == float(expected_score))):
+            client.zrem(expiry_key, user_id)
+            if current is not None:
+                client.delete(keys[k])
+                client.srem(users_key, user_id)
+                for gram_key in keys[k + 1:k + 1 + grams]:
+                    client.srem(gram_key, user_id)
+                client.zrem(names_key, member)
+                client.xadd(changelog_key, {"op": "remove", "user_id": user_id, "ts": ts}, maxlen=int(maxlen), approximate=True)
+                client.publish(channel, f"del:{user_id}")
+                removed.append(user_id.encode('utf-8'))
+        k += 1 + grams
+    version = client.get(version_key) or b"0"
+    if removed:
+        version = client.incr(version_key)
+    return [version, *removed]
+
+def username_ngrams(username, size=SEARCH_NGRAM_SIZE):
+    """
+    Returns the set of lowercase n-grams of a username, as stored in the search index.
+    """
+    username = username.lower()
+    return {username[i:i + size] for i in range(len(username) - size + 1)}
+
+def user_key(user_id):
+    """
+    Returns the key of the hash holding a blacklisted user's record.
+    """
+    return USER_KEY.format(user_id)
+
+def encode_user_record(username, reason, proof_link, folder_id):
+    """
+    Returns the compact hash mapping stored for a user. The proof link is left out when it is
+    the Drive URL of folder_id, and interned reasons are stored as a reason_id. Dropping the
+    ~70 byte URL keeps typical records under hash-max-listpack-value, so Redis stores them
+    as a listpack instead of a hashtable.
+    """
+    record = {"username": username, "folder_id": folder_id}
+    if reason in _REASON_IDS:
+        record["reason_id"] = _REASON_IDS[reason]
+    else:
+        record["reason"] = reason
+    if proof_link != PROOF_LINK_FORMAT.format(folder_id):
+        record["proof_link"] = proof_link
+    return record
+
+def _queue_user_record(pipeline, user_id, username, reason, proof_link, folder_id):
+    """
+    Queues the commands replacing a user's hash with its compact encoding. The hash is
+    deleted first so that no field of a previous encoding is left behind.
+    """
+    pipeline.delete(user_key(user_id))
+    pipeline.hset(user_key(user_id), mapping=encode_user_record(username, reason, proof_link, folder_id))
+
+def _set_user_script_call(user_id, old_username, username, reason, proof_link, folder_id, expires_at, events_channel):
+    """
+    Returns the keys and args of a SET_USER_SCRIPT call that replaces a user's record and
+    moves it in the search index, provided old_username (None for a new user) is still the
+    stored username.
+    """
+    old_grams = username_ngrams(old_username) if old_username is not None else set()
+    new_grams = username_ngrams(username)
+    removed = sorted(old_grams - new_grams)
+    added = sorted(new_grams - old_grams)
+    keys = [
+        user_key(user_id), USERS_KEY, EXPIRY_KEY, SEARCH_NAMES_KEY, CHANGELOG_KEY, VERSION_KEY,
+        *(SEARCH_NGRAM_KEY.format(gram) for gram in removed + added),
+    ]
+    record = encode_user_record(username, reason, proof_link, folder_id)
+    args = [
+        user_id,
+        "1" if old_username is not None else "0",
+        old_username or "",
+        "" if expires_at is None else str(float(expires_at)),
+        _search_name_member(old_username, user_id) if old_username is not None else "",
+        _search_name_member(username, user_id),
+        events_channel,
+        str(CHANGELOG_MAXLEN),
+        str(int(time.time())),
+        str(len(removed)),
+        *(item for pair in record.items() for item in pair),
+    ]
+    return keys, args
+
+def _remove_users_script_call(users, events_channel):
+    """
+    Returns the keys and args of a REMOVE_USERS_SCRIPT call for (user_id, expected username,
+    expected expiry score) triples. A username of None expects no record, and an expiry
+    score of None skips the expiry check.
+    """
+    keys = [EXPIRY_KEY, USERS_KEY, SEARCH_NAMES_KEY, CHANGELOG_KEY, VERSION_KEY]
+    args = [events_channel, str(CHANGELOG_MAXLEN), str(int(time.time()))]
+    for user_id, username, expires_at in users:
+        grams = sorted(username_ngrams(username)) if username is not None else []
+        keys += [user_key(user_id), *(SEARCH_NGRAM_KEY.format(gram) for gram in grams)]
+        args += [
+            user_id,
+            username or "",
+            _search_name_member(username, user_id) if username is not None else "",
+            "" if expires_at is None else repr(float(expires_at)),
+            str(len(grams)),
+        ]
+    return keys, args
+
+def _import_record_problem(user_info):
+    """
+    Returns why a user_info value read from an import file cannot be imported, or None if
+    it can.
+    """
+    if not isinstance(user_info, dict):
+        return f"expected a JSON object, found {type(user_info).__name__}"
+    expires_at = user_info.get("expires_at")
+    if expires_at is not None and (isinstance(expires_at, bool) or not isinstance(expires_at, (int, float))):
+        return f"expires_at must be a unix time, found {expires_at!r}"
+    return None
+
+def _queue_expiry(pipeline, user_id, expires_at):
+    """
+    Queues the expiry index update for a record write: a record without expires_at is
+    permanent, so any earlier expiry is dropped.
+    """
+    if expires_at is None:
+        pipeline.zrem(EXPIRY_KEY, user_id)
+    else:
+        pipeline.zadd(EXPIRY_KEY, {user_id: float(expires_at)})
+
+class GuildSyncState(NamedTuple):
+    """
+    A guild's sync bookkeeping. Fields are None for guilds that were never synced.
+    """
+    guild_id: str
+    sync_hash: Optional[str]
+    channel_id: Optional[str]
+    count: Optional[int]
+    synced_at: Optional[int]
+
+    def is_current(self, version):
+        return self.channel_id is not None and self.sync_hash == version
+
+def _guild_sync_states(guild_ids, details, sync_hashes):
+    """
+    Builds GuildSyncState rows from pipelined HGETALL sync_details:{guild_id} replies and
+    an HMGET of last_sync_hash for the same guilds.
+    """
+    states = []
+    for guild_id, guild_details, sync_hash in zip(guild_ids, details, sync_hashes):
+        count = guild_details.get(b"count")
+        synced_at = guild_details.get(b"synced_at")
+        channel_id = guild_details.get(b"channel_id")
+        states.append(GuildSyncState(
+            guild_id=guild_id,
+            sync_hash=sync_hash.decode('utf-8') if sync_hash is not None else None,
+            channel_id=channel_id.decode('utf-8') if channel_id is not None else None,
+            count=int(count) if count is not None else None,
+            synced_at=int(synced_at) if synced_at is not None else None,
+        ))
+    return states
+
+def _sync_keys(guild_id):
+    return [SYNC_DETAILS_KEY.format(guild_id), LAST_SYNC_HASH_KEY, SYNC_CLAIM_KEY.format(guild_id)]
+
+def _parse_sync_claim(reply, token):
+    """
+    Turns a CLAIM_SYNC_SCRIPT reply into (status, token, sync_details); see claim_guild_sync.
+    """
+    status = reply[0].decode('utf-8')
+    if status == "synced":
+        fields = iter(value.decode('utf-8') for value in reply[1])
+        return status, None, dict(zip(fields, fields))
+    return status, token if status == "claimed" else None, {}
+
+def _search_name_member(username, user_id):
+    return f"{username.lower()}\x00{user_id}"
+
+def _search_plan(pattern):
+    """
+    Returns the n-gram index keys to intersect for a search pattern, or None if the
+    pattern is too short for the n-gram index and is looked up as a name prefix instead.
+    """
+    grams = username_ngrams(pattern)
+    if not grams:
+        return None
+    return [SEARCH_NGRAM_KEY.format(gram) for gram in grams]
+
+def _search_prefix_range(pattern):
+    """
+    Returns the ZRANGEBYLEX bounds selecting the names set members whose username starts
+    with pattern.
+    """
+    prefix = pattern.lower().encode('utf-8')
+    return b"[" + prefix, b"[" + prefix + b"\xff"
+
+def _queue_search_index_update(pipeline, user_id, old_username, new_username):
+    """
+    Queues the commands that move a user from old_username to new_username in the
+    search index. Either name may be None (user created / user deleted).
+    """
+    old_grams = username_ngrams(old_username) if old_username is not None else set()
+    new_grams = username_ngrams(new_username) if new_username is not None else set()
+    for gram in old_grams - new_grams:
+        pipeline.srem(SEARCH_NGRAM_KEY.format(gram), user_id)
+    for gram in new_grams - old_grams:
+        pipeline.sadd(SEARCH_NGRAM_KEY.format(gram), user_id)
+    if old_username is not None:
+        pipeline.zrem(SEARCH_NAMES_KEY, _search_name_member(old_username, user_id))
+    if new_username is not None:
+        pipeline.zadd(SEARCH_NAMES_KEY, {_search_name_member(new_username, user_id): 0})
+
+def _match_users(pattern, user_ids, results):
+    """
+    Filters pipelined HGETALL results down to the users whose username contains pattern.
+    Only the username of each candidate is decoded.
+    """
+    pattern = pattern.lower()
+    matched_data = []
+    for user_id, user_data in zip(user_ids, results):
+        record = BlacklistRecord(user_id, user_data)
+        if pattern in (record.username or "").lower():
+            matched_data.append((user_id, record))
+    return matched_data
+
+def _queue_changelog_entry(pipeline, op, user_id):
+    """
+    Queues an XADD recording a blacklist mutation (op is add, update or remove).
+    The stream is trimmed to roughly CHANGELOG_MAXLEN entries.
+    """
+    pipeline.xadd(CHANGELOG_KEY, {"op": op, "user_id": user_id, "ts": int(time.time())}, maxlen=CHANGELOG_MAXLEN, approximate=True)
+
+def _parse_changelog_entries(entries):
+    return [
+        {
+            "id": entry_id.decode('utf-8'),
+            "op": fields[b"op"].decode('utf-8'),
+            "user_id": fields[b"user_id"].decode('utf-8'),
+            "ts": int(fields[b"ts"]),
+        }
+        for entry_id, fields in entries
+    ]
+
+def _stream_id(entry_id):
+    milliseconds, _, sequence = entry_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+def _changelog_trimmed_past(info, last_id):
+    """
+    Tells from the changelog's XINFO STREAM reply (or the error it raised) whether entries
+    after last_id have been trimmed. Redis 7 reports the newest deleted entry; older servers
+    do not, so there the changelog only counts as trimmed once it reached CHANGELOG_MAXLEN.
+    """
+    if isinstance(info, Exception):
+        # A changelog that was never written to has nothing to trim
+        return False
+    def entry_id(value):
+        return _stream_id(value.decode('utf-8') if isinstance(value, bytes) else value)
+    max_deleted = info.get("max-deleted-entry-id")
+    if max_deleted is not None:
+        return entry_id(max_deleted) > _stream_id(last_id)
+    first_entry = info.get("first-entry")
+    return (
+        info.get("length", 0) >= CHANGELOG_MAXLEN and first_entry is not None
+        and entry_id(first_entry[0]) > _stream_id(last_id)
+    )
+
+def collapse_changes(changes):
+    """
+    Reduces changelog entries to the net change per user: "add" for users that are
+    blacklisted now but were not at some point in the window (so they still need banning),
+    "update" for users that stayed blacklisted throughout, and "remove" for users that were
+    blacklisted before the window and no longer are. Users added and removed again are dropped.
+    """
+    states = {}
+    for change in changes:
+        op = change["op"]
+        # [blacklisted before the window, absent at some point, blacklisted now]
+        state = states.setdefault(change["user_id"], [op != "add", op == "add", True])
+        if op == "remove":
+            state[1] = True
+        state[2] = op != "remove"
+    net = {}
+    for user_id, (existed_before, was_absent, present_now) in states.items():
+        if present_now:
+            net[user_id] = "add" if was_absent else "update"
+        elif existed_before:
+            net[user_id] = "remove"
+    return net
+
+_UNDECODED = object()
+
+class BlacklistRecord:
+    """
+    A blacklisted user's record, built straight from an HGETALL reply. Each field is decoded
+    on first access, so a caller that only reads username never decodes the rest. Fields
+    missing from the record are None. Reads both compact records (see encode_user_record)
+    and records written before the compact encoding.
+
+    Also supports the read-only dict interface (get, [], in, keys, items) callers used when
+    records were plain dictionaries; to_dict returns an actual dictionary.
+    """
+    __slots__ = ("user_id", "_raw", "_username", "_reason", "_proof_link", "_folder_id")
+
+    def __init__(self, user_id, raw):
+        self.user_id = user_id
+        self._raw = raw
+        self._username = self._reason = self._proof_link = self._folder_id = _UNDECODED
+
+    def _decode(self, field):
+        value = self._raw.get(field)
+        return value.decode('utf-8') if value is not None else None
+
+    @property
+    def username(self):
+        if self._username is _UNDECODED:
+            self._username = self._decode(b"username")
+        return self._username
+
+    @property
+    def reason(self):
+        if self._reason is _UNDECODED:
+            reason_id = self._raw.get(b"reason_id")
+            self._reason = INTERNED_REASONS[int(reason_id)] if reason_id is not None else self._decode(b"reason")
+        return self._reason
+
+    @property
+    def proof_link(self):
+        if self._proof_link is _UNDECODED:
+            self._proof_link = self._decode(b"proof_link")
+            if self._proof_link is None and self.folder_id is not None:
+                self._proof_link = PROOF_LINK_FORMAT.format(self.folder_id)
+        return self._proof_link
+
+    @property
+    def folder_id(self):
+        if self._folder_id is _UNDECODED:
+            self._folder_id = self._decode(b"folder_id")
+        return self._folder_id
+
+    def get(self, field, default=None):
+        value = getattr(self, field, None) if field in USER_FIELDS else None
+        return default if value is None else value
+
+    def __getitem__(self, field):
+        value = self.get(field)
+        if value is None:
+            raise KeyError(field)
+        return value
+
+    def __contains__(self, field):
+        return self.get(field) is not None
+
+    def keys(self):
+        return [field for field in USER_FIELDS if field in self]
+
+    def items(self):
+        return [(field, self[field]) for field in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"BlacklistRecord(user_id={self.user_id!r}, {self.to_dict()!r})"
+
+class BlacklistMembership:
+    """
+    In-process copy of the blacklist membership set, held as a set of int user IDs so that
+    hot paths can test membership without any I/O. Only authoritative while live is True.
+    """
+    def __init__(self):
+        self.user_ids = set()
+        self.live = False
+
+    def load(self, user_ids):
+        self.user_ids = {int(user_id) for user_id in user_ids}
+        self.live = True
+
+    def add(self, user_id):
+        self.user_ids.add(int(user_id))
+
+    def discard(self, user_id):
+        self.user_ids.discard(int(user_id))
+
+    def __contains__(self, user_id):
+        return int(user_id) in self.user_ids
+
+    def __len__(self):
+        return len(self.user_ids)
+
+# The logical stores sharing the Redis deployment, by database index
+DATABASES = {0: "blacklist", 1: "whitelist", 2: "servers", 4: "warns", 5: "warn instances", 122: "embeds"}
+# Key families whose variable part is not numeric, grouped by their fixed prefix
+_KEY_FAMILY_PREFIXES = tuple(template.split("{}")[0] for template in (USER_KEY, SEARCH_NGRAM_KEY, SYNC_DETAILS_KEY, SYNC_CLAIM_KEY))
+
+def key_family(key):
+    """
+    Groups a key with others of the same shape: keys of the known templates collapse to
+    their prefix, and everything from the first numeric segment on becomes *, so
+    embed:123:intro and embed:456:rules both belong to embed:*.
+    """
+    for prefix in _KEY_FAMILY_PREFIXES:
+        if key.startswith(prefix):
+            return prefix + "*"
+    parts = key.split(":")
+    for index, part in enumerate(parts):
+        if part.isdigit():
+            return ":".join(parts[:index] + ["*"])
+    return key
+
+class _KeyspaceSampler:
+    """
+    Counts keys per family during a SCAN and keeps a uniform (reservoir) sample of up to
+    sample_size keys of each family, whose TYPE, OBJECT ENCODING and MEMORY USAGE are then
+    fetched in one pipeline and extrapolated to the family.
+    """
+    def __init__(self, sample_size):
+        self.sample_size = sample_size
+        self.counts = {}
+        self.samples = {}
+        self.rng = random.Random()
+
+    def add(self, key):
+        family = key_family(key.decode('utf-8', 'replace') if isinstance(key, bytes) else key)
+        seen = self.counts[family] = self.counts.get(family, 0) + 1
+        sample = self.samples.setdefault(family, [])
+        if len(sample) < self.sample_size:
+            sample.append(key)
+        else:
+            slot = self.rng.randrange(seen)
+            if slot < self.sample_size:
+                sample[slot] = key
+
+    def queue(self, pipeline):
+        for keys in self.samples.values():
+            for key in keys:
+                pipeline.type(key)
+                pipeline.object("encoding", key)
+                pipeline.memory_usage(key, samples=0)
+
+    def report(self, db, replies):
+        def text(reply):
+            return reply.decode('utf-8') if isinstance(reply, bytes) else "unknown"
+
+        replies = iter(replies)
+        families = []
+        for family, keys in self.samples.items():
+            types, encodings, sampled_bytes = {}, {}, 0
+            for _ in keys:
+                key_type, encoding, usage = next(replies), next(replies), next(replies)
+                types[text(key_type)] = types.get(text(key_type), 0) + 1
+                encodings[text(encoding)] = encodings.get(text(encoding), 0) + 1
+                sampled_bytes += usage if isinstance(usage, int) else 0
+            bytes_per_key = sampled_bytes / len(keys) if keys else 0.0
+            families.append({
+                "family": family,
+                "keys": self.counts[family],
+                "sampled": len(keys),
+                "types": types,
+                "encodings": encodings,
+                "bytes_per_key": bytes_per_key,
+                "estimated_bytes": int(bytes_per_key * self.counts[family]),
+            })
+        families.sort(key=lambda family: family["estimated_bytes"], reverse=True)
+        return {
+            "db": db,
+            "name": DATABASES.get(db, f"db {db}"),
+            "keys": sum(self.counts.values()),
+            "estimated_bytes": sum(family["estimated_bytes"] for family in families),
+            "families": families,
+        }
+
+def keyspace_report(db=0, sample_size=50, mode=None):
+    """
+    Scans database db and returns its key count and, per key family (see key_family), the
+    key count, value types, encodings and the MEMORY USAGE of up to sample_size sampled keys
+    extrapolated to the whole family. Reads every key name once, so it is an admin tool.
+    """
+    client = get_redis_client(db, mode)
+    sampler = _KeyspaceSampler(sample_size)
+    try:
+        for key in client.scan_iter(count=1000):
+            sampler.add(key)
+        with client.pipeline(transaction=False) as pipeline:
+            sampler.queue(pipeline)
+            return sampler.report(db, pipeline.execute(raise_on_error=False))
+    except redis.RedisError as e:
+        logger.error(f"Error building the keyspace report of db {db}: {e}")
+        return {}
+
+async def async_keyspace_report(db=0, sample_size=50, mode=None):
+    """
+    keyspace_report on a redis.asyncio client, for use from the bot.
+    """
+    client = get_async_redis_client(db, mode)
+    sampler = _KeyspaceSampler(sample_size)
+    try:
+        async for key in client.scan_iter(count=1000):
+            sampler.add(key)
+        async with client.pipeline(transaction=False) as pipeline:
+            sampler.queue(pipeline)
+            return sampler.report(db, await pipeline.execute(raise_on_error=False))
+    except redis.RedisError as e:
+        logger.error(f"Error building the keyspace report of db {db}: {e}")
+        return {}
+    finally:
+        await client.aclose()
+
+@instrument_methods(LATENCY)
 class RedisDB:
-    def __init__(self, db=0):
-        self.redis = redis.StrictRedis(connection_pool=redis.ConnectionPool(host='localhost', port=6379, db=db))
+    """
+    Blacklist storage on Redis. client defaults to get_redis_client(db, mode), where mode is
+    standalone, sentinel or cluster (default: REDIS_MODE); pass a
+    utils.memory_redis.MemoryRedis to run against the in-process backend instead.
+    """
+    def __init__(self, db=0, cache_size=128, cache_ttl=300, client=None, mode=None):
+        self.redis = client if client is not None else get_redis_client(db, mode)
+        self.user_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.events_channel = EVENTS_CHANNEL.format(db)
+        self._claim_sync_script = self.redis.register_script(CLAIM_SYNC_SCRIPT)
+        self._commit_sync_script = self.redis.register_script(COMMIT_SYNC_SCRIPT)
+        self._renew_sync_script = self.redis.register_script(RENEW_SYNC_SCRIPT)
+        self._release_sync_script = self.redis.register_script(RELEASE_SYNC_SCRIPT)
+        self._remove_users_script = self.redis.register_script(REMOVE_USERS_SCRIPT)
+        self._set_user_script = self.redis.register_script(SET_USER_SCRIPT)
 
     @cache_invalidation_on_user_change
-    def set_user(self, user_id, username, reason, proof_link, folder_id):
+    def set_user(self, user_id, username, reason, proof_link, folder_id, expires_at=None):
         """
         Sets the user information in a hash with fields for username, reason, proof link, and folder ID.
+        expires_at (unix seconds) makes the entry time-limited; see expire_due_users.
+        Returns the new blacklist version, or None if the write failed.
         """
         try:
-            self.redis.hset(user_id, mapping={
-                "username": username,
-                "reason": reason,
-                "proof_link": proof_link,
-                "folder_id": folder_id
-            })
+            while True:
+                # SET_USER_SCRIPT only writes if the username read here is still stored, so a
+                # concurrent rename cannot leave the search index pointing at a stale name
+                old_username = self.redis.hget(user_key(user_id), "username")
+                keys, args = _set_user_script_call(user_id, old_username and old_username.decode('utf-8'), username, reason, proof_link, folder_id, expires_at, self.events_channel)
+                version = self._set_user_script(keys=keys, args=args)
+                if version is not None:
+                    return str(version)
         except redis.RedisError as e:
             logger.error(f"Error setting user {user_id} in the database: {e}")
+            return None
 
-    @lru_cache(maxsize=128)
     def get_user(self, user_id):
         """
-        Retrieves all fields for a given user_id as a dictionary.
+        Retrieves the BlacklistRecord of a given user_id; it is empty (falsy) if the user does
+        not exist. Reads go through user_cache, which set_user/delete_user invalidate per user.
         """
+        user_data = self.user_cache.get(user_id)
+        if user_data is not None:
+            return user_data
         try:
-            user_data = self.redis.hgetall(user_id)
-            return {k.decode('utf-8'): v.decode('utf-8') for k, v in user_data.items()}
+            user_data = self.redis.hgetall(user_key(user_id))
         except redis.RedisError as e:
             logger.error(f"Error getting user {user_id} from the database: {e}")
-            return {}
+            return BlacklistRecord(user_id, {})
+        user_data = BlacklistRecord(user_id, user_data)
+        self.user_cache.set(user_id, user_data)
+        return user_data
 
     @cache_invalidation_on_user_change
     def delete_user(self, user_id):
         """
         Deletes a user entry by user_id.
+        Returns the new blacklist version, or the current one unchanged if the user is not
+        blacklisted.
         """
         try:
-            self.redis.delete(user_id)
+            while True:
+                # REMOVE_USERS_SCRIPT only removes the record if the username read here is still
+                # stored, so a concurrent rename cannot leave a stale name in the search index
+                old_username = self.redis.hget(user_key(user_id), "username")
+                if old_username is None:
+                    version = self.redis.get(VERSION_KEY)
+                    return version.decode('utf-8') if version is not None else "0"
+                keys, args = _remove_users_script_call([(user_id, old_username.decode('utf-8'), None)], self.events_channel)
+                reply = self._remove_users_script(keys=keys, args=args)
+                if len(reply) > 1:
+                    break
+            return str(reply[0])
         except redis.RedisError as e:
             logger.error(f"Error deleting user {user_id} from the database: {e}")
+            return None
+
+    def get_user_expiry(self, user_id):
+        """
+        Returns the unix time a user's blacklist entry expires at, or None if it is permanent.
+        """
+        try:
+            return self.redis.zscore(EXPIRY_KEY, user_id)
+        except redis.RedisError as e:
+            logger.error(f"Error getting the expiry of user {user_id}: {e}")
+            return None
+
+    def expire_due_users(self, now=None, batch_size=EXPIRY_SWEEP_BATCH):
+        """
+        Deletes up to batch_size users whose entry expired at or before now (default: the
+        current time) and returns their BlacklistRecord objects so the caller can lift the bans.
+        The due entries are read first and then removed by REMOVE_USERS_SCRIPT, which skips any
+        user whose record or expiry changed in between (e.g. re-blacklisted through set_user),
+        so a fresh entry is never deleted and concurrent sweepers never both return a user.
+        Nothing leaves the expiry index before its removal succeeds. Call it until it returns
+        an empty list to drain a backlog.
+        """
+        now = time.time() if now is None else now
+        try:
+            due = self.redis.zrangebyscore(EXPIRY_KEY, "-inf", now, start=0, num=batch_size, withscores=True)
+            if not due:
+                return []
+            user_ids = [user_id.decode('utf-8') for user_id, _ in due]
+            with self.redis.pipeline(transaction=False) as pipeline:
+                for user_id in user_ids:
+                    pipeline.hgetall(user_key(user_id))
+                raws = pipeline.execute()
+            keys, args = _remove_users_script_call(
+                [(user_id, BlacklistRecord(user_id, raw).username if raw else None, score) for user_id, raw, (_, score) in zip(user_ids, raws, due)],
+                self.events_channel
+            )
+            removed = {user_id.decode('utf-8') for user_id in self._remove_users_script(keys=keys, args=args)[1:]}
+        except redis.RedisError as e:
+            logger.error(f"Error expiring due users: {e}")
+            return []
+        for user_id in removed:
+            self.user_cache.invalidate(user_id)
+        return [BlacklistRecord(user_id, raw) for user_id, raw in zip(user_ids, raws) if user_id in removed]
 
     def list_all_users(self):
         """
         Lists all user_ids in the database.
         """
         try:
-            return [key.decode('utf-8') for key in self.redis.scan_iter("*")]
+            return [user_id.decode('utf-8') for user_id in self.redis.smembers(USERS_KEY)]
         except redis.RedisError as e:
             logger.error(f"Error listing all users from the database: {e}")
             return []
@@ -66,52 +1100,297 @@ class RedisDB:
     def list_all_users_info(self):
         """
         Lists all users and their associated information from the database.
+        Prefer iter_users_info when the users can be processed one at a time.
+        """
+        return dict(self.iter_users_info())
+
+    def scan_users_info(self, cursor=0, count=10):
+        """
+        Returns (next_cursor, {user_id: BlacklistRecord}) for a single SSCAN step over the users,
+        for paging through the blacklist across requests; next_cursor is 0 once the scan is
+        complete. count is a hint, so a step may return more or fewer users (even none).
         """
-        users = self.list_all_users()
-        all_user_data = {}
         try:
-            with self.redis.pipeline() as pipeline:
-                for user_id in users:
-                    pipeline.hgetall(user_id)
-                results = pipeline.execute()
-                
-                for user_id, user_data in zip(users, results):
-                    all_user_data[user_id] = {k.decode('utf-8'): v.decode('utf-8') for k, v in user_data.items()}
-        except redis.RedisError as e:
-            logger.error(f"Error listing all users and their information from the database: {e}")
-        return all_user_data
+            cursor, user_ids = self.redis.sscan(USERS_KEY, cursor, count=count)
+        except redis.RedisError as e:
+            logger.error(f"Error scanning users in the database: {e}")
+            return 0, {}
+        return int(cursor), self.get_users_info([user_id.decode('utf-8') for user_id in user_ids])
+
+    def iter_users_info(self, batch_size=500):
+        """
+        Yields (user_id, BlacklistRecord) for every user. The membership set is SSCANned and records
+        are fetched in pipelined batches of batch_size, so memory stays bounded by one batch.
+        Like any SSCAN, a user may be yielded twice if the set is resized mid-iteration.
+        """
+        try:
+            user_ids = []
+            for user_id in self.redis.sscan_iter(USERS_KEY, count=batch_size):
+                user_ids.append(user_id.decode('utf-8'))
+                if len(user_ids) >= batch_size:
+                    yield from self.get_users_info(user_ids).items()
+                    user_ids = []
+            if user_ids:
+                yield from self.get_users_info(user_ids).items()
+        except redis.RedisError as e:
+            logger.error(f"Error iterating over users in the database: {e}")
 
     def search_users(self, pattern):
         """
         Searches for users by matching a pattern in the username field.
         """
-        matched_data = []
         try:
-            users = self.list_all_users()
-            for user_id in users:
-                username = self.redis.hget(user_id, "username").decode('utf-8')
-                if pattern.lower() in username.lower():
-                    user_data = self.get_user(user_id)
-                    matched_data.append((user_id, user_data))
+            user_ids = self._search_candidates(pattern)
+            with self.redis.pipeline(transaction=False) as pipeline:
+                for user_id in user_ids:
+                    pipeline.hgetall(user_key(user_id))
+                return _match_users(pattern, user_ids, pipeline.execute())
         except redis.RedisError as e:
             logger.error(f"Error searching for users in the database: {e}")
-        return matched_data
+            return []
+
+    def _search_candidates(self, pattern):
+        """
+        Returns the user_ids that may match pattern, using the n-gram index for patterns of
+        at least SEARCH_NGRAM_SIZE characters. Shorter patterns match everyone containing
+        them, so they are looked up as a username prefix and capped at SEARCH_PREFIX_LIMIT
+        users instead of scanning the whole names set.
+        """
+        keys = _search_plan(pattern)
+        if keys is not None:
+            return sorted(user_id.decode('utf-8') for user_id in self.redis.sinter(keys))
+        members = self.redis.zrangebylex(SEARCH_NAMES_KEY, *_search_prefix_range(pattern), start=0, num=SEARCH_PREFIX_LIMIT)
+        return sorted(member.decode('utf-8').rsplit("\x00", 1)[1] for member in members)
+
+    def rebuild_search_index(self):
+        """
+        Drops and rebuilds the username search index from the user records.
+        Needed once for records written before the index existed.
+        """
+        try:
+            stale_keys = list(self.redis.scan_iter("blacklist:search:*"))
+            if stale_keys:
+                self.redis.delete(*stale_keys)
+            indexed = 0
+            pipeline = self.redis.pipeline(transaction=False)
+            for user_id, user_data in self.iter_users_info():
+                if "username" in user_data:
+                    _queue_search_index_update(pipeline, user_id, None, user_data["username"])
+                indexed += 1
+                if len(pipeline) >= 5000:
+                    pipeline.execute()
+            pipeline.execute()
+            return indexed
+        except redis.RedisError as e:
+            logger.error(f"Error rebuilding the search index: {e}")
+            return 0
+
+    def bulk_import(self, records, batch_size=1000):
+        """
+        Writes (user_id, user_info) pairs in pipelined batches of batch_size, keeping the
+        membership set, search index and version up to date. records may be any iterable,
+        including a generator streaming from a file. An expires_at (unix seconds) in user_info
+        makes the entry time-limited. Records that are not importable (see
+        _import_record_problem) are logged and skipped. Returns the number of users written.
+        """
+        imported = 0
+        batch = []
+        try:
+            for user_id, user_info in records:
+                problem = _import_record_problem(user_info)
+                if problem:
+                    logger.warning(f"Skipping user {user_id}: {problem}")
+                    continue
+                batch.append((user_id, user_info))
+                if len(batch) >= batch_size:
+                    imported += self._import_batch(batch)
+                    batch = []
+            if batch:
+                imported += self._import_batch(batch)
+        except redis.RedisError as e:
+            logger.error(f"Error importing users after {imported} records: {e}")
+        finally:
+            if imported:
+                self.redis.publish(self.events_channel, "reload")
+        return imported
+
+    def _import_batch(self, batch):
+        with self.redis.pipeline(transaction=False) as pipeline:
+            for user_id, _ in batch:
+                pipeline.hget(user_key(user_id), "username")
+            old_usernames = pipeline.execute()
+        with self.redis.pipeline() as pipeline:
+            for (user_id, user_info), old_username in zip(batch, old_usernames):
+                username = str(user_info.get("username", ""))
+                _queue_user_record(pipeline, user_id, *(str(user_info.get(field, "")) for field in USER_FIELDS))
+                pipeline.sadd(USERS_KEY, user_id)
+                _queue_expiry(pipeline, user_id, user_info.get("expires_at"))
+                _queue_search_index_update(pipeline, user_id, old_username and old_username.decode('utf-8'), username)
+                _queue_changelog_entry(pipeline, "add" if old_username is None else "update", user_id)
+            pipeline.incr(VERSION_KEY)
+            pipeline.execute()
+        for user_id, _ in batch:
+            self.user_cache.invalidate(user_id)
+        return len(batch)
+
+    def export(self, stream, fmt="ndjson", batch_size=1000):
+        """
+        Writes every user to a text stream as NDJSON ({"user_id": ..., fields...} per line) or
+        as a single JSON object keyed by user_id. Time-limited users carry their expires_at, so
+        bulk_import restores them as they were. Users are read in pipelined batches of
+        batch_size and written as they arrive. Returns the number of users exported.
+        """
+        exported = 0
+        if fmt == "json":
+            stream.write("{")
+        for user_id, user_info in self._iter_export_records(batch_size):
+            if fmt == "json":
+                stream.write(f"{',' if exported else ''}\n  {json.dumps(user_id)}: {json.dumps(user_info)}")
+            else:
+                stream.write(json.dumps({"user_id": user_id, **user_info}) + "\n")
+            exported += 1
+        if fmt == "json":
+            stream.write("\n}\n")
+        return exported
+
+    def _iter_export_records(self, batch_size):
+        """
+        Yields (user_id, user_info dict) for every user, reading each batch's records and
+        expiry scores in one pipelined round trip.
+        """
+        try:
+            user_ids = []
+            for user_id in self.redis.sscan_iter(USERS_KEY, count=batch_size):
+                user_ids.append(user_id.decode('utf-8'))
+                if len(user_ids) >= batch_size:
+                    yield from self._export_batch(user_ids)
+                    user_ids = []
+            if user_ids:
+                yield from self._export_batch(user_ids)
+        except redis.RedisError as e:
+            logger.error(f"Error exporting users: {e}")
+
+    def _export_batch(self, user_ids):
+        with self.redis.pipeline(transaction=False) as pipeline:
+            for user_id in user_ids:
+                pipeline.hgetall(user_key(user_id))
+                pipeline.zscore(EXPIRY_KEY, user_id)
+            replies = pipeline.execute()
+        for user_id, raw, expires_at in zip(user_ids, replies[::2], replies[1::2]):
+            if not raw:
+                continue
+            user_info = BlacklistRecord(user_id, raw).to_dict()
+            if expires_at is not None:
+                user_info["expires_at"] = int(expires_at) if float(expires_at).is_integer() else expires_at
+            yield user_id, user_info
+
+    def migrate_legacy_keys(self, batch_size=500):
+        """
+        Moves user hashes stored under bare user_id keys (the old layout) to their
+        blacklist:user:{user_id} key, adds them to the membership set and rebuilds the
+        search index. Safe to re-run; a record already stored under the new key wins.
+        """
+        migrated = 0
+        try:
+            legacy_keys = [key for key in self.redis.scan_iter("*", count=batch_size) if key.isdigit()]
+            for start in range(0, len(legacy_keys), batch_size):
+                batch = legacy_keys[start:start + batch_size]
+                with self.redis.pipeline(transaction=False) as pipeline:
+                    for key in batch:
+                        pipeline.type(key)
+                    key_types = pipeline.execute()
+                with self.redis.pipeline() as pipeline:
+                    for key, key_type in zip(batch, key_types):
+                        if key_type != b"hash":
+                            continue
+                        user_id = key.decode('utf-8')
+                        if isinstance(self.redis, PrefixedRedis):
+                            # Cluster pipelines refuse RENAMENX; both keys share the {dbN} slot,
+                            # so it runs directly, ahead of the queued DEL of the legacy key
+                            self.redis.renamenx(key, user_key(user_id))
+                        else:
+                            pipeline.renamenx(key, user_key(user_id))
+                        pipeline.delete(key)
+                        pipeline.sadd(USERS_KEY, user_id)
+                        migrated += 1
+                    pipeline.incr(VERSION_KEY)
+                    pipeline.execute()
+            self.redis.publish(self.events_channel, "reload")
+        except redis.RedisError as e:
+            logger.error(f"Error migrating legacy user keys: {e}")
+        self.user_cache.clear()
+        self.rebuild_search_index()
+        return migrated
+
+    def compact_records(self, batch_size=500):
+        """
+        Rewrites every user hash in the compact encoding (see encode_user_record). The
+        decoded records are unchanged, so no version bump or changelog entry is written.
+        Safe to re-run. Returns the number of records rewritten.
+        """
+        compacted = 0
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            for user_id, user_info in self.iter_users_info(batch_size=batch_size):
+                _queue_user_record(pipeline, user_id, *(user_info.get(field, "") for field in USER_FIELDS))
+                compacted += 1
+                if len(pipeline) >= batch_size * 2:
+                    pipeline.execute()
+            pipeline.execute()
+        except redis.RedisError as e:
+            logger.error(f"Error compacting user records after {compacted} records: {e}")
+        self.user_cache.clear()
+        return compacted
+
+    def memory_report(self, sample_size=1000):
+        """
+        Samples up to sample_size users and returns their average MEMORY USAGE in bytes, both as
+        stored and as they would be stored in the legacy four-string-field layout (measured by
+        writing each record to a scratch key), along with the user count and estimated totals.
+        """
+        try:
+            user_ids = [user_id.decode('utf-8') for user_id in self.redis.srandmember(USERS_KEY, sample_size)]
+            stored = legacy = 0
+            for user_id, user_info in self.get_users_info(user_ids).items():
+                stored += self.redis.memory_usage(user_key(user_id), samples=0) or 0
+                with self.redis.pipeline() as pipeline:
+                    pipeline.delete(MEMORY_REPORT_SCRATCH_KEY)
+                    pipeline.hset(MEMORY_REPORT_SCRATCH_KEY, mapping={field: user_info.get(field, "") for field in USER_FIELDS})
+                    pipeline.memory_usage(MEMORY_REPORT_SCRATCH_KEY, samples=0)
+                    pipeline.delete(MEMORY_REPORT_SCRATCH_KEY)
+                    legacy += pipeline.execute()[2] or 0
+            users = self.redis.scard(USERS_KEY)
+        except redis.RedisError as e:
+            logger.error(f"Error building the memory report: {e}")
+            return {}
+        sampled = len(user_ids)
+        stored_per_user = stored / sampled if sampled else 0.0
+        legacy_per_user = legacy / sampled if sampled else 0.0
+        return {
+            "users": users,
+            "sampled": sampled,
+            "bytes_per_user": stored_per_user,
+            "legacy_bytes_per_user": legacy_per_user,
+            "estimated_total_bytes": int(stored_per_user * users),
+            "estimated_legacy_total_bytes": int(legacy_per_user * users),
+        }
     
     def record_sync_details(self, guild_id, channel_id, count):
         """
         Records details of a sync operation to a guild channel.
         """
         try:
-            self.redis.hset(f"sync_details:{guild_id}", mapping={
+            self.redis.hset(SYNC_DETAILS_KEY.format(guild_id), mapping={
                 "channel_id": channel_id,
-                "count": count
+                "count": count,
+                "synced_at": int(time.time())
             })
         except redis.RedisError as e:
             logger.error(f"Error recording sync details for guild {guild_id} in the database: {e}")
             
     def get_sync_details(self, guild_id):
         try:
-            details = self.redis.hgetall(f"sync_details:{guild_id}")
+            details = self.redis.hgetall(SYNC_DETAILS_KEY.format(guild_id))
             if details:
                 return {k.decode('utf-8'): v.decode('utf-8') for k, v in details.items()}
             return {}
@@ -124,7 +1403,7 @@ class RedisDB:
         Records the last sync hash for a guild.
         """
         try:
-            self.redis.hset("last_sync_hash", guild_id, sync_hash)
+            self.redis.hset(LAST_SYNC_HASH_KEY, guild_id, sync_hash)
         except redis.RedisError as e:
             logger.error(f"Error setting last sync hash for guild {guild_id}: {e}")
 
@@ -133,7 +1412,7 @@ class RedisDB:
         Retrieves the last sync hash for a guild.
         """
         try:
-            hash_bytes = self.redis.hget("last_sync_hash", guild_id)
+            hash_bytes = self.redis.hget(LAST_SYNC_HASH_KEY, guild_id)
             if hash_bytes is not None:
                 return hash_bytes.decode('utf-8')
             return None
@@ -146,37 +1425,252 @@ class RedisDB:
         Lists all guilds and their last sync hashes.
         """
         try:
-            return {k.decode('utf-8'): v.decode('utf-8') for k, v in self.redis.hgetall("last_sync_hash").items()}
+            return {k.decode('utf-8'): v.decode('utf-8') for k, v in self.redis.hgetall(LAST_SYNC_HASH_KEY).items()}
         except redis.RedisError as e:
             logger.error(f"Error listing all sync hashes from the database: {e}")
             return {}
         
     def list_all_sync_details(self):
         """
-        Lists all guilds and their sync details.
+        Lists all guilds and their sync details, found by scanning the sync_details:{guild_id} keys.
         """
         try:
-            return {k.decode('utf-8'): {k.decode('utf-8'): v.decode('utf-8') for k, v in v.items()} for k, v in self.redis.hgetall("sync_details").items()}
+            keys = list(self.redis.scan_iter(SYNC_DETAILS_KEY.format("*"), count=1000))
+            with self.redis.pipeline(transaction=False) as pipeline:
+                for key in keys:
+                    pipeline.hgetall(key)
+                return {
+                    key.decode('utf-8').split(":", 1)[1]: {k.decode('utf-8'): v.decode('utf-8') for k, v in details.items()}
+                    for key, details in zip(keys, pipeline.execute())
+                }
         except redis.RedisError as e:
             logger.error(f"Error listing all sync details from the database: {e}")
             return {}
+
+    def get_guild_sync_states(self, guild_ids):
+        """
+        Returns a GuildSyncState for each of guild_ids, in order, in one pipelined round trip.
+        """
+        guild_ids = [str(guild_id) for guild_id in guild_ids]
+        if not guild_ids:
+            return []
+        try:
+            with self.redis.pipeline(transaction=False) as pipeline:
+                pipeline.hmget(LAST_SYNC_HASH_KEY, guild_ids)
+                for guild_id in guild_ids:
+                    pipeline.hgetall(SYNC_DETAILS_KEY.format(guild_id))
+                sync_hashes, *details = pipeline.execute()
+        except redis.RedisError as e:
+            logger.error(f"Error getting the sync state of {len(guild_ids)} guilds: {e}")
+            return []
+        return _guild_sync_states(guild_ids, details, sync_hashes)
         
+    def count_users(self):
+        """
+        Returns the number of blacklisted users.
+        """
+        try:
+            return self.redis.scard(USERS_KEY)
+        except redis.RedisError as e:
+            logger.error(f"Error counting users in the database: {e}")
+            return 0
+
+    def get_users_info(self, user_ids):
+        """
+        Returns a dictionary of user_id -> BlacklistRecord for the given users, built straight
+        from one pipelined round trip. Users that no longer exist are left out.
+        """
+        all_user_data = {}
+        try:
+            with self.redis.pipeline(transaction=False) as pipeline:
+                for user_id in user_ids:
+                    pipeline.hgetall(user_key(user_id))
+                for user_id, user_data in zip(user_ids, pipeline.execute()):
+                    if user_data:
+                        all_user_data[user_id] = BlacklistRecord(user_id, user_data)
+        except redis.RedisError as e:
+            logger.error(f"Error getting information for {len(user_ids)} users from the database: {e}")
+        return all_user_data
+
+    def get_changelog_head(self):
+        """
+        Returns the ID of the newest changelog entry, or "0-0" if the changelog is empty.
+        """
+        try:
+            entries = self.redis.xrevrange(CHANGELOG_KEY, count=1)
+            return entries[0][0].decode('utf-8') if entries else "0-0"
+        except redis.RedisError as e:
+            logger.error(f"Error getting the changelog head: {e}")
+            return "0-0"
+
+    def get_changes_since(self, last_id, until="+"):
+        """
+        Returns the changelog entries after last_id, up to and including until, oldest first.
+        last_id "0-0" reads from the start. Returns None if entries after last_id have been
+        trimmed; the caller then has to fall back to reading the full blacklist.
+        """
+        try:
+            with self.redis.pipeline(transaction=False) as pipeline:
+                pipeline.xinfo_stream(CHANGELOG_KEY)
+                pipeline.xrange(CHANGELOG_KEY, min=f"({last_id}", max=until)
+                info, entries = pipeline.execute(raise_on_error=False)
+            if isinstance(entries, Exception):
+                raise entries
+        except redis.RedisError as e:
+            logger.error(f"Error reading the changelog since {last_id}: {e}")
+            return None
+        if _changelog_trimmed_past(info, last_id):
+            return None
+        return _parse_changelog_entries(entries)
+
+    def get_changelog_offset(self, consumer):
+        """
+        Returns the last changelog entry ID a consumer (e.g. a guild sync) has processed.
+        """
+        try:
+            offset = self.redis.hget(CHANGELOG_OFFSETS_KEY, consumer)
+            return offset.decode('utf-8') if offset is not None else None
+        except redis.RedisError as e:
+            logger.error(f"Error getting the changelog offset of {consumer}: {e}")
+            return None
+
+    def set_changelog_offset(self, consumer, entry_id):
+        """
+        Records that a consumer has processed the changelog up to and including entry_id.
+        """
+        try:
+            self.redis.hset(CHANGELOG_OFFSETS_KEY, consumer, entry_id)
+        except redis.RedisError as e:
+            logger.error(f"Error setting the changelog offset of {consumer}: {e}")
+
+    def get_proof_file(self, sha256):
+        """
+        Returns the Drive file ID of proof content with this sha256 hex digest, or None if
+        it was never uploaded.
+        """
+        try:
+            file_id = self.redis.hget(PROOF_FILES_KEY, sha256)
+            return file_id.decode('utf-8') if file_id is not None else None
+        except redis.RedisError as e:
+            logger.error(f"Error looking up proof {sha256}: {e}")
+            return None
+
+    def set_proof_file(self, sha256, file_id):
+        """
+        Records the Drive file holding proof content with this sha256 digest unless another
+        file already does (concurrent uploads of the same content keep the first). Returns
+        the file ID on record.
+        """
+        try:
+            with self.redis.pipeline() as pipeline:
+                pipeline.hsetnx(PROOF_FILES_KEY, sha256, file_id)
+                pipeline.hget(PROOF_FILES_KEY, sha256)
+                return pipeline.execute()[-1].decode('utf-8')
+        except redis.RedisError as e:
+            logger.error(f"Error recording proof {sha256}: {e}")
+            return file_id
+
+    def forget_proof_file(self, sha256, file_id):
+        """
+        Drops the record of proof content if it still points at file_id, e.g. once that
+        Drive file turned out to be deleted.
+        """
+        try:
+            if self.get_proof_file(sha256) == file_id:
+                self.redis.hdel(PROOF_FILES_KEY, sha256)
+        except redis.RedisError as e:
+            logger.error(f"Error forgetting proof {sha256}: {e}")
+
+    def get_blacklist_version(self):
+        """
+        Returns the blacklist version, a counter bumped by every blacklist mutation.
+        Compare it against a guild's last sync hash instead of hashing the full blacklist.
+        """
+        try:
+            version = self.redis.get(VERSION_KEY)
+            return version.decode('utf-8') if version is not None else "0"
+        except redis.RedisError as e:
+            logger.error(f"Error getting the blacklist version: {e}")
+            return None
+
     def check_if_guild_synced(self, guild_id, current_sync_hash):
         """
-        Checks if a guild has already been synced with the current sync hash.
+        Checks if a guild has already been synced with the current sync hash, in one round trip.
         """
-        # Check if guild_id is in the database as an entry (sync_details:guild_id)
-        if not self.redis.exists(f"sync_details:{guild_id}"):
+        try:
+            with self.redis.pipeline() as pipeline:
+                pipeline.exists(SYNC_DETAILS_KEY.format(guild_id))
+                pipeline.hget(LAST_SYNC_HASH_KEY, guild_id)
+                has_details, last_sync_hash = pipeline.execute()
+        except redis.RedisError as e:
+            logger.error(f"Error checking if guild {guild_id} is synced: {e}")
             return False
-        last_sync_hash = self.get_last_sync_hash(guild_id)
-        return last_sync_hash == current_sync_hash
+        return bool(has_details) and last_sync_hash is not None and last_sync_hash.decode('utf-8') == current_sync_hash
+
+    def claim_guild_sync(self, guild_id, sync_hash, ttl=SYNC_CLAIM_TTL):
+        """
+        Atomically checks whether a guild is synced with sync_hash and, if not, claims its sync
+        for ttl seconds so that concurrent syncs of the same guild back off.
+        Returns (status, token, sync_details): ("synced", None, details) if the guild is up to
+        date, ("claimed", token, {}) if the caller now owns the sync and must finish it with
+        commit_guild_sync or release_guild_sync, or ("busy", None, {}) if another sync holds it.
+        """
+        token = uuid.uuid4().hex
+        try:
+            reply = self._claim_sync_script(keys=_sync_keys(guild_id), args=[guild_id, sync_hash, token, int(ttl * 1000)])
+        except redis.RedisError as e:
+            logger.error(f"Error claiming the sync of guild {guild_id}: {e}")
+            return "busy", None, {}
+        return _parse_sync_claim(reply, token)
+
+    def commit_guild_sync(self, guild_id, sync_hash, channel_id, count, token=None):
+        """
+        Records the sync hash, channel and count of a finished guild sync in one atomic step and
+        releases the claim held under token.
+        """
+        try:
+            self._commit_sync_script(keys=_sync_keys(guild_id), args=[guild_id, sync_hash, channel_id, count, token or "", int(time.time())])
+        except redis.RedisError as e:
+            logger.error(f"Error committing the sync of guild {guild_id}: {e}")
+
+    def renew_guild_sync(self, guild_id, token, ttl=SYNC_CLAIM_TTL):
+        """
+        Extends a claim taken by claim_guild_sync to ttl seconds from now, for syncs that run
+        longer than the claim. Returns False if the claim expired or was taken over.
+        """
+        try:
+            return bool(self._renew_sync_script(keys=[SYNC_CLAIM_KEY.format(guild_id)], args=[token, int(ttl * 1000)]))
+        except redis.RedisError as e:
+            logger.error(f"Error renewing the sync claim of guild {guild_id}: {e}")
+            return False
+
+    def release_guild_sync(self, guild_id, token):
+        """
+        Releases a claim taken by claim_guild_sync without recording a sync. A claim that
+        was already committed, expired or taken over is left alone.
+        """
+        try:
+            self._release_sync_script(keys=[SYNC_CLAIM_KEY.format(guild_id)], args=[token])
+        except redis.RedisError as e:
+            logger.error(f"Error releasing the sync claim of guild {guild_id}: {e}")
+
+    def set_last_sync_hashes(self, guild_ids, sync_hash):
+        """
+        Records the same last sync hash for several guilds with a single HSET.
+        """
+        if not guild_ids:
+            return
+        try:
+            self.redis.hset(LAST_SYNC_HASH_KEY, mapping={guild_id: sync_hash for guild_id in guild_ids})
+        except redis.RedisError as e:
+            logger.error(f"Error setting the last sync hash of {len(guild_ids)} guilds: {e}")
 
     def exists(self, user_id):
         """
         Checks if a user entry exists in the database.
         """
         try:
-            return self.redis.exists(user_id)
+            return self.redis.sismember(USERS_KEY, user_id)
         except redis.RedisError as e:
             logger.error(f"Error checking if user {user_id} exists in the database: {e}")
             return False
@@ -184,36 +1678,680 @@ class RedisDB:
     def flush_db(self):
         """
         Clears the entire database, removing all keys and data.
+        The blacklist version survives the flush so that it keeps increasing.
         """
         try:
+            version = self.redis.get(VERSION_KEY)
             self.redis.flushdb()
+            self.user_cache.clear()
+            if version is not None:
+                self.redis.set(VERSION_KEY, version)
+            self.redis.publish(self.events_channel, "reload")
         except redis.RedisError as e:
             logger.error(f"Error flushing the database: {e}")
 
 
-# db_0 = RedisDB(db=0)
-# db_1 = RedisDB(db=1)
-# db_2 = RedisDB(db=69)
-# print(db_2.check_if_guild_synced('1213097209738960896', '99284ec6e103691c51ad89b101085ebdd9915e13efdef2a691886763d24a34ad'))
-# print(f"All sync hashes: {db_2.list_all_sync_hashes()}")
-# print(f"All sync details: {db_2.list_all_sync_details()}")
-# db_0.flush_db()
-# db_1.flush_db()
-# db_2.flush_db()
-
-# json_file_path = 'users.json'
-
-# with open(json_file_path, 'r') as file:
-#     users_data = json.load(file)
-
-# for user_id, user_info in users_data.items():
-#     db_0.set_user(
-#         user_id,
-#         user_info['username'],
-#         user_info['reason'],
-#         user_info['proof_link'],
-#         user_info['folder_id']
-#     )
-    
-# print(db_0.list_all_users_info())
-# print(db_0.search_users('x'))
\ No newline at end of file
+@instrument_methods(LATENCY, exclude=("watch_blacklist",))
+class AsyncRedisDB:
+    """
+    Same API as RedisDB, but built on redis.asyncio so that every call is awaitable
+    and never blocks the interactions event loop.
+    """
+    def __init__(self, db=0, cache_size=128, cache_ttl=300, client=None, mode=None):
+        self.redis = client if client is not None else get_async_redis_client(db, mode)
+        self.user_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.events_channel = EVENTS_CHANNEL.format(db)
+        self._claim_sync_script = self.redis.register_script(CLAIM_SYNC_SCRIPT)
+        self._commit_sync_script = self.redis.register_script(COMMIT_SYNC_SCRIPT)
+        self._renew_sync_script = self.redis.register_script(RENEW_SYNC_SCRIPT)
+        self._release_sync_script = self.redis.register_script(RELEASE_SYNC_SCRIPT)
+        self._remove_users_script = self.redis.register_script(REMOVE_USERS_SCRIPT)
+        self._set_user_script = self.redis.register_script(SET_USER_SCRIPT)
+        self.membership = BlacklistMembership()
+
+    @async_cache_invalidation_on_user_change
+    async def set_user(self, user_id, username, reason, proof_link, folder_id, expires_at=None):
+        """
+        Sets the user information in a hash with fields for username, reason, proof link, and folder ID.
+        expires_at (unix seconds) makes the entry time-limited; see expire_due_users.
+        Returns the new blacklist version, or None if the write failed.
+        """
+        try:
+            version = None
+            while version is None:
+                # See RedisDB.set_user: the script only writes if old_username is still stored
+                old_username = await self.redis.hget(user_key(user_id), "username")
+                keys, args = _set_user_script_call(user_id, old_username and old_username.decode('utf-8'), username, reason, proof_link, folder_id, expires_at, self.events_channel)
+                version = await self._set_user_script(keys=keys, args=args)
+            version = str(version)
+            if self.membership.live:
+                self.membership.add(user_id)
+            return version
+        except redis.RedisError as e:
+            logger.error(f"Error setting user {user_id} in the database: {e}")
+            return None
+
+    async def get_user(self, user_id):
+        """
+        Retrieves the BlacklistRecord of a given user_id; it is empty (falsy) if the user does
+        not exist. Reads go through user_cache, which set_user/delete_user invalidate per user.
+        """
+        user_data = self.user_cache.get(user_id)
+        if user_data is not None:
+            return user_data
+        try:
+            user_data = await self.redis.hgetall(user_key(user_id))
+        except redis.RedisError as e:
+            logger.error(f"Error getting user {user_id} from the database: {e}")
+            return BlacklistRecord(user_id, {})
+        user_data = BlacklistRecord(user_id, user_data)
+        self.user_cache.set(user_id, user_data)
+        return user_data
+
+    @async_cache_invalidation_on_user_change
+    async def delete_user(self, user_id):
+        """
+        Deletes a user entry by user_id.
+        Returns the new blacklist version, or the current one unchanged if the user is not
+        blacklisted.
+        """
+        try:
+            while True:
+                # REMOVE_USERS_SCRIPT only removes the record if the username read here is still
+                # stored, so a concurrent rename cannot leave a stale name in the search index
+                old_username = await self.redis.hget(user_key(user_id), "username")
+                if old_username is None:
+                    version = await self.redis.get(VERSION_KEY)
+                    return version.decode('utf-8') if version is not None else "0"
+                keys, args = _remove_users_script_call([(user_id, old_username.decode('utf-8'), None)], self.events_channel)
+                reply = await self._remove_users_script(keys=keys, args=args)
+                if len(reply) > 1:
+                    break
+            if self.membership.live:
+                self.membership.discard(user_id)
+            return str(reply[0])
+        except redis.RedisError as e:
+            logger.error(f"Error deleting user {user_id} from the database: {e}")
+            return None
+
+    async def get_user_expiry(self, user_id):
+        """
+        Returns the unix time a user's blacklist entry expires at, or None if it is permanent.
+        """
+        try:
+            return await self.redis.zscore(EXPIRY_KEY, user_id)
+        except redis.RedisError as e:
+            logger.error(f"Error getting the expiry of user {user_id}: {e}")
+            return None
+
+    async def expire_due_users(self, now=None, batch_size=EXPIRY_SWEEP_BATCH):
+        """
+        Deletes up to batch_size users whose entry expired at or before now (default: the
+        current time) and returns their BlacklistRecord objects so the caller can lift the bans.
+        See RedisDB.expire_due_users.
+        """
+        now = time.time() if now is None else now
+        try:
+            due = await self.redis.zrangebyscore(EXPIRY_KEY, "-inf", now, start=0, num=batch_size, withscores=True)
+            if not due:
+                return []
+            user_ids = [user_id.decode('utf-8') for user_id, _ in due]
+            async with self.redis.pipeline(transaction=False) as pipeline:
+                for user_id in user_ids:
+                    pipeline.hgetall(user_key(user_id))
+                raws = await pipeline.execute()
+            keys, args = _remove_users_script_call(
+                [(user_id, BlacklistRecord(user_id, raw).username if raw else None, score) for user_id, raw, (_, score) in zip(user_ids, raws, due)],
+                self.events_channel
+            )
+            removed = {user_id.decode('utf-8') for user_id in (await self._remove_users_script(keys=keys, args=args))[1:]}
+        except redis.RedisError as e:
+            logger.error(f"Error expiring due users: {e}")
+            return []
+        for user_id in removed:
+            self.user_cache.invalidate(user_id)
+            if self.membership.live:
+                self.membership.discard(user_id)
+        return [BlacklistRecord(user_id, raw) for user_id, raw in zip(user_ids, raws) if user_id in removed]
+
+    async def list_all_users(self):
+        """
+        Lists all user_ids in the database.
+        """
+        try:
+            return [user_id.decode('utf-8') for user_id in await self.redis.smembers(USERS_KEY)]
+        except redis.RedisError as e:
+            logger.error(f"Error listing all users from the database: {e}")
+            return []
+
+    async def list_all_users_info(self):
+        """
+        Lists all users and their associated information from the database.
+        Prefer iter_users_info when the users can be processed one at a time.
+        """
+        return {user_id: user_info async for user_id, user_info in self.iter_users_info()}
+
+    async def scan_users_info(self, cursor=0, count=10):
+        """
+        Returns (next_cursor, {user_id: BlacklistRecord}) for a single SSCAN step over the users,
+        for paging through the blacklist across requests; next_cursor is 0 once the scan is
+        complete. count is a hint, so a step may return more or fewer users (even none).
+        """
+        try:
+            cursor, user_ids = await self.redis.sscan(USERS_KEY, cursor, count=count)
+        except redis.RedisError as e:
+            logger.error(f"Error scanning users in the database: {e}")
+            return 0, {}
+        return int(cursor), await self.get_users_info([user_id.decode('utf-8') for user_id in user_ids])
+
+    async def iter_users_info(self, batch_size=500):
+        """
+        Yields (user_id, BlacklistRecord) for every user. The membership set is SSCANned and records
+        are fetched in pipelined batches of batch_size, so memory stays bounded by one batch.
+        Like any SSCAN, a user may be yielded twice if the set is resized mid-iteration.
+        """
+        try:
+            user_ids = []
+            async for user_id in self.redis.sscan_iter(USERS_KEY, count=batch_size):
+                user_ids.append(user_id.decode('utf-8'))
+                if len(user_ids) >= batch_size:
+                    for item in (await self.get_users_info(user_ids)).items():
+                        yield item
+                    user_ids = []
+            if user_ids:
+                for item in (await self.get_users_info(user_ids)).items():
+                    yield item
+        except redis.RedisError as e:
+            logger.error(f"Error iterating over users in the database: {e}")
+
+    async def search_users(self, pattern):
+        """
+        Searches for users by matching a pattern in the username field.
+        """
+        try:
+            user_ids = await self._search_candidates(pattern)
+            async with self.redis.pipeline(transaction=False) as pipeline:
+                for user_id in user_ids:
+                    pipeline.hgetall(user_key(user_id))
+                return _match_users(pattern, user_ids, await pipeline.execute())
+        except redis.RedisError as e:
+            logger.error(f"Error searching for users in the database: {e}")
+            return []
+
+    async def _search_candidates(self, pattern):
+        """
+        Returns the user_ids that may match pattern, using the n-gram index for patterns of
+        at least SEARCH_NGRAM_SIZE characters. Shorter patterns match everyone containing
+        them, so they are looked up as a username prefix and capped at SEARCH_PREFIX_LIMIT
+        users instead of scanning the whole names set.
+        """
+        keys = _search_plan(pattern)
+        if keys is not None:
+            return sorted(user_id.decode('utf-8') for user_id in await self.redis.sinter(keys))
+        members = await self.redis.zrangebylex(SEARCH_NAMES_KEY, *_search_prefix_range(pattern), start=0, num=SEARCH_PREFIX_LIMIT)
+        return sorted(member.decode('utf-8').rsplit("\x00", 1)[1] for member in members)
+
+    async def record_sync_details(self, guild_id, channel_id, count):
+        """
+        Records details of a sync operation to a guild channel.
+        """
+        try:
+            await self.redis.hset(SYNC_DETAILS_KEY.format(guild_id), mapping={
+                "channel_id": channel_id,
+                "count": count,
+                "synced_at": int(time.time())
+            })
+        except redis.RedisError as e:
+            logger.error(f"Error recording sync details for guild {guild_id} in the database: {e}")
+
+    async def get_sync_details(self, guild_id):
+        try:
+            details = await self.redis.hgetall(SYNC_DETAILS_KEY.format(guild_id))
+            if details:
+                return {k.decode('utf-8'): v.decode('utf-8') for k, v in details.items()}
+            return {}
+        except redis.RedisError as e:
+            logger.error(f"Error getting sync details for guild {guild_id} from the database: {e}")
+            return {}
+
+    async def set_last_sync_details(self, guild_id, sync_hash):
+        """
+        Records the last sync hash for a guild.
+        """
+        try:
+            await self.redis.hset(LAST_SYNC_HASH_KEY, guild_id, sync_hash)
+        except redis.RedisError as e:
+            logger.error(f"Error setting last sync hash for guild {guild_id}: {e}")
+
+    async def get_last_sync_hash(self, guild_id):
+        """
+        Retrieves the last sync hash for a guild.
+        """
+        try:
+            hash_bytes = await self.redis.hget(LAST_SYNC_HASH_KEY, guild_id)
+            if hash_bytes is not None:
+                return hash_bytes.decode('utf-8')
+            return None
+        except redis.RedisError as e:
+            logger.error(f"Error getting last sync hash for guild {guild_id}: {e}")
+            return None
+
+    async def list_all_sync_hashes(self):
+        """
+        Lists all guilds and their last sync hashes.
+        """
+        try:
+            return {k.decode('utf-8'): v.decode('utf-8') for k, v in (await self.redis.hgetall(LAST_SYNC_HASH_KEY)).items()}
+        except redis.RedisError as e:
+            logger.error(f"Error listing all sync hashes from the database: {e}")
+            return {}
+
+    async def list_all_sync_details(self):
+        """
+        Lists all guilds and their sync details, found by scanning the sync_details:{guild_id} keys.
+        """
+        try:
+            keys = [key async for key in self.redis.scan_iter(SYNC_DETAILS_KEY.format("*"), count=1000)]
+            async with self.redis.pipeline(transaction=False) as pipeline:
+                for key in keys:
+                    pipeline.hgetall(key)
+                return {
+                    key.decode('utf-8').split(":", 1)[1]: {k.decode('utf-8'): v.decode('utf-8') for k, v in details.items()}
+                    for key, details in zip(keys, await pipeline.execute())
+                }
+        except redis.RedisError as e:
+            logger.error(f"Error listing all sync details from the database: {e}")
+            return {}
+
+    async def get_guild_sync_states(self, guild_ids):
+        """
+        Returns a GuildSyncState for each of guild_ids, in order, in one pipelined round trip.
+        """
+        guild_ids = [str(guild_id) for guild_id in guild_ids]
+        if not guild_ids:
+            return []
+        try:
+            async with self.redis.pipeline(transaction=False) as pipeline:
+                pipeline.hmget(LAST_SYNC_HASH_KEY, guild_ids)
+                for guild_id in guild_ids:
+                    pipeline.hgetall(SYNC_DETAILS_KEY.format(guild_id))
+                sync_hashes, *details = await pipeline.execute()
+        except redis.RedisError as e:
+            logger.error(f"Error getting the sync state of {len(guild_ids)} guilds: {e}")
+            return []
+        return _guild_sync_states(guild_ids, details, sync_hashes)
+
+    async def count_users(self):
+        """
+        Returns the number of blacklisted users.
+        """
+        try:
+            return await self.redis.scard(USERS_KEY)
+        except redis.RedisError as e:
+            logger.error(f"Error counting users in the database: {e}")
+            return 0
+
+    async def get_users_info(self, user_ids):
+        """
+        Returns a dictionary of user_id -> BlacklistRecord for the given users, built straight
+        from one pipelined round trip. Users that no longer exist are left out.
+        """
+        all_user_data = {}
+        try:
+            async with self.redis.pipeline(transaction=False) as pipeline:
+                for user_id in user_ids:
+                    pipeline.hgetall(user_key(user_id))
+                for user_id, user_data in zip(user_ids, await pipeline.execute()):
+                    if user_data:
+                        all_user_data[user_id] = BlacklistRecord(user_id, user_data)
+        except redis.RedisError as e:
+            logger.error(f"Error getting information for {len(user_ids)} users from the database: {e}")
+        return all_user_data
+
+    async def get_changelog_head(self):
+        """
+        Returns the ID of the newest changelog entry, or "0-0" if the changelog is empty.
+        """
+        try:
+            entries = await self.redis.xrevrange(CHANGELOG_KEY, count=1)
+            return entries[0][0].decode('utf-8') if entries else "0-0"
+        except redis.RedisError as e:
+            logger.error(f"Error getting the changelog head: {e}")
+            return "0-0"
+
+    async def get_changes_since(self, last_id, until="+"):
+        """
+        Returns the changelog entries after last_id, up to and including until, oldest first.
+        last_id "0-0" reads from the start. Returns None if entries after last_id have been
+        trimmed; the caller then has to fall back to reading the full blacklist.
+        """
+        try:
+            async with self.redis.pipeline(transaction=False) as pipeline:
+                pipeline.xinfo_stream(CHANGELOG_KEY)
+                pipeline.xrange(CHANGELOG_KEY, min=f"({last_id}", max=until)
+                info, entries = await pipeline.execute(raise_on_error=False)
+            if isinstance(entries, Exception):
+                raise entries
+        except redis.RedisError as e:
+            logger.error(f"Error reading the changelog since {last_id}: {e}")
+            return None
+        if _changelog_trimmed_past(info, last_id):
+            return None
+        return _parse_changelog_entries(entries)
+
+    async def get_changelog_offset(self, consumer):
+        """
+        Returns the last changelog entry ID a consumer (e.g. a guild sync) has processed.
+        """
+        try:
+            offset = await self.redis.hget(CHANGELOG_OFFSETS_KEY, consumer)
+            return offset.decode('utf-8') if offset is not None else None
+        except redis.RedisError as e:
+            logger.error(f"Error getting the changelog offset of {consumer}: {e}")
+            return None
+
+    async def set_changelog_offset(self, consumer, entry_id):
+        """
+        Records that a consumer has processed the changelog up to and including entry_id.
+        """
+        try:
+            await self.redis.hset(CHANGELOG_OFFSETS_KEY, consumer, entry_id)
+        except redis.RedisError as e:
+            logger.error(f"Error setting the changelog offset of {consumer}: {e}")
+
+    async def get_proof_file(self, sha256):
+        """
+        Returns the Drive file ID of proof content with this sha256 hex digest, or None if
+        it was never uploaded.
+        """
+        try:
+            file_id = await self.redis.hget(PROOF_FILES_KEY, sha256)
+            return file_id.decode('utf-8') if file_id is not None else None
+        except redis.RedisError as e:
+            logger.error(f"Error looking up proof {sha256}: {e}")
+            return None
+
+    async def set_proof_file(self, sha256, file_id):
+        """
+        Records the Drive file holding proof content with this sha256 digest unless another
+        file already does (concurrent uploads of the same content keep the first). Returns
+        the file ID on record.
+        """
+        try:
+            async with self.redis.pipeline() as pipeline:
+                pipeline.hsetnx(PROOF_FILES_KEY, sha256, file_id)
+                pipeline.hget(PROOF_FILES_KEY, sha256)
+                return (await pipeline.execute())[-1].decode('utf-8')
+        except redis.RedisError as e:
+            logger.error(f"Error recording proof {sha256}: {e}")
+            return file_id
+
+    async def forget_proof_file(self, sha256, file_id):
+        """
+        Drops the record of proof content if it still points at file_id, e.g. once that
+        Drive file turned out to be deleted.
+        """
+        try:
+            if await self.get_proof_file(sha256) == file_id:
+                await self.redis.hdel(PROOF_FILES_KEY, sha256)
+        except redis.RedisError as e:
+            logger.error(f"Error forgetting proof {sha256}: {e}")
+
+    async def get_blacklist_version(self):
+        """
+        Returns the blacklist version, a counter bumped by every blacklist mutation.
+        Compare it against a guild's last sync hash instead of hashing the full blacklist.
+        """
+        try:
+            version = await self.redis.get(VERSION_KEY)
+            return version.decode('utf-8') if version is not None else "0"
+        except redis.RedisError as e:
+            logger.error(f"Error getting the blacklist version: {e}")
+            return None
+
+    async def check_if_guild_synced(self, guild_id, current_sync_hash):
+        """
+        Checks if a guild has already been synced with the current sync hash, in one round trip.
+        """
+        try:
+            async with self.redis.pipeline() as pipeline:
+                pipeline.exists(SYNC_DETAILS_KEY.format(guild_id))
+                pipeline.hget(LAST_SYNC_HASH_KEY, guild_id)
+                has_details, last_sync_hash = await pipeline.execute()
+        except redis.RedisError as e:
+            logger.error(f"Error checking if guild {guild_id} is synced: {e}")
+            return False
+        return bool(has_details) and last_sync_hash is not None and last_sync_hash.decode('utf-8') == current_sync_hash
+
+    async def claim_guild_sync(self, guild_id, sync_hash, ttl=SYNC_CLAIM_TTL):
+        """
+        Atomically checks whether a guild is synced with sync_hash and, if not, claims its sync
+        for ttl seconds so that concurrent syncs of the same guild back off.
+        Returns (status, token, sync_details): ("synced", None, details) if the guild is up to
+        date, ("claimed", token, {}) if the caller now owns the sync and must finish it with
+        commit_guild_sync or release_guild_sync, or ("busy", None, {}) if another sync holds it.
+        """
+        token = uuid.uuid4().hex
+        try:
+            reply = await self._claim_sync_script(keys=_sync_keys(guild_id), args=[guild_id, sync_hash, token, int(ttl * 1000)])
+        except redis.RedisError as e:
+            logger.error(f"Error claiming the sync of guild {guild_id}: {e}")
+            return "busy", None, {}
+        return _parse_sync_claim(reply, token)
+
+    async def commit_guild_sync(self, guild_id, sync_hash, channel_id, count, token=None):
+        """
+        Records the sync hash, channel and count of a finished guild sync in one atomic step and
+        releases the claim held under token.
+        """
+        try:
+            await self._commit_sync_script(keys=_sync_keys(guild_id), args=[guild_id, sync_hash, channel_id, count, token or "", int(time.time())])
+        except redis.RedisError as e:
+            logger.error(f"Error committing the sync of guild {guild_id}: {e}")
+
+    async def renew_guild_sync(self, guild_id, token, ttl=SYNC_CLAIM_TTL):
+        """
+        Extends a claim taken by claim_guild_sync to ttl seconds from now, for syncs that run
+        longer than the claim. Returns False if the claim expired or was taken over.
+        """
+        try:
+            return bool(await self._renew_sync_script(keys=[SYNC_CLAIM_KEY.format(guild_id)], args=[token, int(ttl * 1000)]))
+        except redis.RedisError as e:
+            logger.error(f"Error renewing the sync claim of guild {guild_id}: {e}")
+            return False
+
+    async def release_guild_sync(self, guild_id, token):
+        """
+        Releases a claim taken by claim_guild_sync without recording a sync. A claim that
+        was already committed, expired or taken over is left alone.
+        """
+        try:
+            await self._release_sync_script(keys=[SYNC_CLAIM_KEY.format(guild_id)], args=[token])
+        except redis.RedisError as e:
+            logger.error(f"Error releasing the sync claim of guild {guild_id}: {e}")
+
+    async def set_last_sync_hashes(self, guild_ids, sync_hash):
+        """
+        Records the same last sync hash for several guilds with a single HSET.
+        """
+        if not guild_ids:
+            return
+        try:
+            await self.redis.hset(LAST_SYNC_HASH_KEY, mapping={guild_id: sync_hash for guild_id in guild_ids})
+        except redis.RedisError as e:
+            logger.error(f"Error setting the last sync hash of {len(guild_ids)} guilds: {e}")
+
+    async def exists(self, user_id):
+        """
+        Checks if a user entry exists in the database.
+        Answered from the in-process membership set, without I/O, while watch_blacklist runs.
+        """
+        if self.membership.live:
+            return user_id in self.membership
+        try:
+            return await self.redis.sismember(USERS_KEY, user_id)
+        except redis.RedisError as e:
+            logger.error(f"Error checking if user {user_id} exists in the database: {e}")
+            return False
+
+    async def flush_db(self):
+        """
+        Clears the entire database, removing all keys and data.
+        The blacklist version survives the flush so that it keeps increasing.
+        """
+        try:
+            version = await self.redis.get(VERSION_KEY)
+            await self.redis.flushdb()
+            self.user_cache.clear()
+            if version is not None:
+                await self.redis.set(VERSION_KEY, version)
+            await self.redis.publish(self.events_channel, "reload")
+        except redis.RedisError as e:
+            logger.error(f"Error flushing the database: {e}")
+
+    async def watch_blacklist(self, reconnect_delay=5):
+        """
+        Loads the blacklist membership set into memory and keeps it current by listening to
+        the blacklist events channel. Entries changed by other processes are also dropped from
+        user_cache. Runs until cancelled, so start it as a background task.
+        """
+        try:
+            while True:
+                try:
+                    async with self.redis.pubsub() as pubsub:
+                        # Subscribe before loading so that no change between the two is missed.
+                        await pubsub.subscribe(self.events_channel)
+                        await self._load_membership()
+                        async for message in pubsub.listen():
+                            if message["type"] == "message":
+                                await self._apply_blacklist_event(message["data"].decode('utf-8'))
+                except redis.RedisError as e:
+                    self.membership.live = False
+                    logger.error(f"Blacklist watcher lost its connection, retrying in {reconnect_delay}s: {e}")
+                    await asyncio.sleep(reconnect_delay)
+        finally:
+            self.membership.live = False
+
+    async def _load_membership(self):
+        self.membership.load(user_id.decode('utf-8') for user_id in await self.redis.smembers(USERS_KEY))
+        logger.info(f"Loaded {len(self.membership)} blacklisted users into memory")
+
+    async def _apply_blacklist_event(self, event):
+        if event == "reload":
+            self.user_cache.clear()
+            await self._load_membership()
+            return
+        action, user_id = event.split(":", 1)
+        self.user_cache.invalidate(user_id)
+        if action == "set":
+            self.membership.add(user_id)
+        elif action == "del":
+            self.membership.discard(user_id)
+
+    async def close(self):
+        """
+        Closes the client. The shared connection pool stays open for other users;
+        app.py closes it through close_connection_pools when the bot stops.
+        """
+        await self.redis.aclose()
+
+
+def _ndjson_user_records(fp):
+    """
+    Yields (user_id, record) from NDJSON user lines as written by export. Lines that are
+    not importable (see _import_record_problem) or have no user_id are logged with their
+    line number and skipped.
+    """
+    from utils.jsonstream import iter_ndjson_lines
+
+    for line_number, record in iter_ndjson_lines(fp):
+        problem = _import_record_problem(record) or (None if "user_id" in record else "no user_id")
+        if problem:
+            logger.warning(f"Skipping line {line_number}: {problem}")
+            continue
+        user_id = record.pop("user_id")
+        yield str(user_id), record
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Blacklist database maintenance")
+    parser.add_argument("--db", type=int, default=0, help="Redis database index (default: 0)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("reindex", help="Rebuild the username search index")
+    subparsers.add_parser("migrate", help="Move user records from bare user_id keys to the blacklist:user: namespace")
+    subparsers.add_parser("compact", help="Rewrite every user record in the compact encoding")
+    copy_parser = subparsers.add_parser("copy", help="Copy database --db between deployment modes, e.g. standalone to cluster")
+    copy_parser.add_argument("--from", dest="source_mode", choices=REDIS_MODES, required=True)
+    copy_parser.add_argument("--to", dest="target_mode", choices=REDIS_MODES, required=True)
+    memory_parser = subparsers.add_parser("memory", help="Report the memory used per user record, compact vs legacy layout")
+    memory_parser.add_argument("--sample-size", type=int, default=1000)
+    stats_parser = subparsers.add_parser("stats", help="Report key counts, memory and encodings per key family, and RedisDB latencies")
+    stats_parser.add_argument("--dbs", type=int, nargs="+", default=list(DATABASES), help="Databases to report (default: every known store)")
+    stats_parser.add_argument("--sample-size", type=int, default=50, help="Keys sampled per key family")
+    stats_parser.add_argument("--probe", type=int, default=0, help="Time this many rounds of read-only RedisDB calls on --db")
+    for name, help_text in (("import", "Import users from an NDJSON or JSON file"), ("export", "Export all users to an NDJSON or JSON file")):
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument("path", help="File path, or - for stdin/stdout")
+        subparser.add_argument("--format", choices=("ndjson", "json"), help="Defaults to json for .json files, ndjson otherwise")
+        subparser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.command == "copy":
+        print(f"Copied {copy_database(args.db, args.source_mode, args.target_mode)} keys")
+        raise SystemExit
+    if args.command == "stats":
+        for index in args.dbs:
+            report = keyspace_report(index, sample_size=args.sample_size)
+            if not report:
+                continue
+            print(f"db {index} ({report['name']}): {report['keys']} keys, ~{report['estimated_bytes'] / 1024:.1f} KiB")
+            for family in report["families"]:
+                encodings = ", ".join(f"{encoding} {count}" for encoding, count in family["encodings"].items())
+                print(f"  {family['family']:<32} {family['keys']:>9} keys {family['bytes_per_key']:>9.1f} B/key ~{family['estimated_bytes'] / 1024:>10.1f} KiB  {'/'.join(family['types'])} ({encodings})")
+        if args.probe:
+            probe_db = RedisDB(db=args.db, cache_size=0)
+            sample = [user_id.decode('utf-8') for user_id in probe_db.redis.srandmember(USERS_KEY, 20)]
+            for round_index in range(args.probe):
+                user_id = sample[round_index % len(sample)] if sample else "0"
+                probe_db.get_user(user_id)
+                probe_db.exists(user_id)
+                probe_db.get_users_info(sample)
+                probe_db.count_users()
+                probe_db.get_blacklist_version()
+            print(f"{'method':>32} {'calls':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+            for name, entry in LATENCY.stats().items():
+                print(f"{name:>32} {entry['calls']:>7} {entry['p50']:>8.2f} {entry['p95']:>8.2f} {entry['p99']:>8.2f} {entry['max']:>8.2f}")
+        raise SystemExit
+    db = RedisDB(db=args.db)
+    if args.command == "reindex":
+        print(f"Indexed {db.rebuild_search_index()} users")
+    elif args.command == "migrate":
+        print(f"Migrated {db.migrate_legacy_keys()} users")
+    elif args.command == "compact":
+        print(f"Compacted {db.compact_records()} users")
+    elif args.command == "memory":
+        report = db.memory_report(sample_size=args.sample_size)
+        if report.get("sampled"):
+            print(f"Sampled {report['sampled']} of {report['users']} users")
+            print(f"Compact: {report['bytes_per_user']:.1f} bytes/user, ~{report['estimated_total_bytes'] / 1024 / 1024:.1f} MiB total")
+            print(f"Legacy:  {report['legacy_bytes_per_user']:.1f} bytes/user, ~{report['estimated_legacy_total_bytes'] / 1024 / 1024:.1f} MiB total")
+        else:
+            print("No users to sample")
+    elif args.command in ("import", "export"):
+        import sys
+        from utils.jsonstream import iter_json_object_items
+
+        fmt = args.format or ("json" if args.path.endswith(".json") else "ndjson")
+        start = time.perf_counter()
+        if args.command == "import":
+            with (sys.stdin if args.path == "-" else open(args.path, "r", encoding="utf-8")) as fp:
+                if fmt == "json":
+                    records = iter_json_object_items(fp)
+                else:
+                    records = _ndjson_user_records(fp)
+                count = db.bulk_import(records, batch_size=args.batch_size)
+        else:
+            with (sys.stdout if args.path == "-" else open(args.path, "w", encoding="utf-8")) as fp:
+                count = db.export(fp, fmt=fmt, batch_size=args.batch_size)
+        print(f"{args.command.capitalize()}ed {count} users in {time.perf_counter() - start:.2f}s", file=sys.stderr)
@@ -2,26 +2,208 @@
 
 CREDENTIALS = 'credentials/credentials.json'
 
+import asyncio
+import functools
+import hashlib
+import io
+import json
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import google_auth_oauthlib
 from googleapiclient.errors import HttpError
 from googleapiclient.discovery import build
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload
 import os
 import pickle
 from googleapiclient.http import MediaIoBaseDownload
+from utils.drive_index import FOLDER_MIME_TYPE, INDEX_FILE_FIELDS, SHORTCUT_MIME_TYPE, DriveIndex
+
+# Drive calls AsyncDrive runs at once; further calls queue for a free worker thread
+DRIVE_MAX_WORKERS = 4
+# Sub-requests the Drive batch endpoint accepts per HTTP call
+DRIVE_BATCH_LIMIT = 100
+# Smaller files are sent in a single multipart request instead of a resumable session
+RESUMABLE_UPLOAD_THRESHOLD = 5 * 1024 * 1024
+ANYONE_READER_PERMISSION = {'type': 'anyone', 'role': 'reader'}
+# files().list page size; 1000 is the Drive API maximum
+DRIVE_PAGE_SIZE = 1000
+FILE_FIELDS = 'id, name, mimeType, modifiedTime, size'
+# Local metadata index used by the bot (see Drive.sync_index) and how often it catches up
+DRIVE_INDEX_PATH = os.getenv('DRIVE_INDEX_PATH', 'drive_index.sqlite3')
+DRIVE_INDEX_SYNC_INTERVAL = 60
+# Mirror settings: worker threads, folders listed per files().list query and the fields
+# the manifest compares to decide whether a local copy is current
+MIRROR_WORKERS = 8
+MIRROR_PARENTS_PER_QUERY = 40
+MIRROR_FILE_FIELDS = 'id, name, md5Checksum, modifiedTime, size, parents'
+MIRROR_MANIFEST = '.mirror-manifest.json'
+MIRROR_MANIFEST_SAVE_EVERY = 50
+
+def quote_query_value(value):
+    """
+    Quotes a string for use in a Drive search query.
+    """
+    escaped = str(value).replace('\\', '\\\\').replace("'", "\\'")
+    return f"'{escaped}'"
+
+def resolve_shortcuts(files):
+    """
+    Replaces shortcuts in a listing by their target: id and mimeType become the target's
+    (the shortcut's own ID moves to shortcutId) so the content can be fetched or linked.
+    """
+    resolved = []
+    for file in files:
+        details = file.get('shortcutDetails')
+        if file.get('mimeType') == SHORTCUT_MIME_TYPE and details:
+            shortcut_id = file['id']
+            file = {key: value for key, value in file.items() if key != 'shortcutDetails'}
+            file.update(id=details['targetId'], mimeType=details.get('targetMimeType', ''), shortcutId=shortcut_id)
+        resolved.append(file)
+    return resolved
+
+def _safe_name(name):
+    return name.replace(os.sep, '_').replace('\0', '_') or '_'
+
+def _file_md5(path):
+    digest = hashlib.md5()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class MirrorManifest:
+    """
+    The local record of a mirror: file ID -> relative path, md5Checksum and modifiedTime of
+    the copy on disk. Thread-safe; saved atomically every MIRROR_MANIFEST_SAVE_EVERY
+    records and on save(), so an interrupted mirror loses at most that much bookkeeping.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pending = 0
+        try:
+            with open(path, 'r', encoding='utf-8') as fh:
+                self.entries = json.load(fh)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+
+    def is_current(self, file, relative_path, base_path):
+        with self.lock:
+            entry = self.entries.get(file['id'])
+        return (
+            entry is not None
+            and entry['path'] == relative_path
+            and entry['md5'] == file.get('md5Checksum')
+            and entry['modified'] == file.get('modifiedTime')
+            and os.path.exists(os.path.join(base_path, relative_path))
+        )
+
+    def record(self, file, relative_path):
+        with self.lock:
+            self.entries[file['id']] = {'path': relative_path, 'md5': file.get('md5Checksum'), 'modified': file.get('modifiedTime')}
+            self.pending += 1
+            if self.pending >= MIRROR_MANIFEST_SAVE_EVERY:
+                self._save()
+
+    def save(self):
+        with self.lock:
+            self._save()
+
+    def _save(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as fh:
+            json.dump(self.entries, fh)
+        os.replace(temp_path, self.path)
+        self.pending = 0
 
 class Drive:
-    def __init__(self):
+    def __init__(self, index_path=None):
         self.SCOPES = ['https://www.googleapis.com/auth/drive']
         self.creds = self._load_credentials()
+        # Folders known to be shared with anyone; files inside inherit the permission
+        self.public_folders = set()
+        # With an index, metadata reads are answered locally and only misses hit the network
+        self.index = DriveIndex(index_path) if index_path else None
         if self.creds:
-            self.service = build('drive', 'v3', credentials=self.creds)
+            self._local = threading.local()
+            self._local.service = build('drive', 'v3', credentials=self.creds)
         else:
             print('Failed to initialize Drive service.')
             sys.exit(1)
+
+    @property
+    def service(self):
+        """
+        The Drive service of the calling thread. A service shares one httplib2 connection,
+        which is not thread-safe, so every thread (see AsyncDrive) builds its own.
+        """
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = self._local.service = build('drive', 'v3', credentials=self.creds)
+        return service
+
+    def _index_files(self, files=(), removed_ids=()):
+        if self.index is not None:
+            self.index.apply(files, removed_ids)
+
+    def sync_index(self):
+        """
+        Brings the metadata index up to date. The first run records a changes() start page
+        token and then loads a full listing; later runs replay changes().list from the
+        stored token, so they cost one call when nothing changed. Returns the number of
+        files loaded or changes applied, or 0 if this Drive has no index.
+        """
+        if self.index is None:
+            return 0
+        page_token = self.index.page_token
+        if page_token is None:
+            # Taken before the listing, so changes made during it are replayed next time
+            start_token = self.service.changes().getStartPageToken().execute()['startPageToken']
+            files = list(self.iter_files("trashed = false", fields=INDEX_FILE_FIELDS))
+            self.index.clear()
+            self.index.apply(files, page_token=start_token)
+            return len(files)
+        applied = 0
+        while page_token:
+            response = self.service.changes().list(
+                pageToken=page_token,
+                pageSize=DRIVE_PAGE_SIZE,
+                spaces='drive',
+                includeRemoved=True,
+                fields=f'nextPageToken, newStartPageToken, changes(changeType, fileId, removed, file({INDEX_FILE_FIELDS}))'
+            ).execute()
+            changes = [change for change in response.get('changes', []) if change.get('changeType', 'file') == 'file']
+            page_token = response.get('nextPageToken')
+            self.index.apply(
+                [change['file'] for change in changes if not change.get('removed') and 'file' in change],
+                [change['fileId'] for change in changes if change.get('removed')],
+                page_token=page_token or response.get('newStartPageToken')
+            )
+            applied += len(changes)
+        return applied
+
+    def execute_batch(self, requests):
+        """
+        Executes googleapiclient requests (built on this thread) through the Drive batch
+        endpoint, DRIVE_BATCH_LIMIT sub-requests per HTTP call. Returns the responses in
+        request order; a failed sub-request's slot holds its HttpError instead of raising,
+        so one bad item does not abort a bulk operation.
+        """
+        requests = list(requests)
+        results = [None] * len(requests)
+
+        def store(request_id, response, exception):
+            results[int(request_id)] = exception if exception is not None else response
+
+        for start in range(0, len(requests), DRIVE_BATCH_LIMIT):
+            batch = self.service.new_batch_http_request(callback=store)
+            for index in range(start, min(start + DRIVE_BATCH_LIMIT, len(requests))):
+                batch.add(requests[index], request_id=str(index))
+            batch.execute()
+        return results
         
     def _load_credentials(self):
         creds = None
@@ -71,23 +253,60 @@ class Drive:
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File {file_path} not found")
         
-        file_name = os.path.basename(file_path)
+        media = MediaFileUpload(file_path, resumable=os.path.getsize(file_path) > RESUMABLE_UPLOAD_THRESHOLD)
+        return self._upload_media(media, os.path.basename(file_path), folder_id)
+
+    def upload_bytes(self, data, file_name, folder_id, mime_type='application/octet-stream', app_properties=None):
+        """
+        Uploads in-memory content (e.g. an attachment just downloaded) as file_name in the
+        folder, without writing it to disk. app_properties are stored on the file as private
+        key/value metadata. Returns the file ID, or None on an API error.
+        """
+        media = MediaIoBaseUpload(io.BytesIO(data), mimetype=mime_type, resumable=len(data) > RESUMABLE_UPLOAD_THRESHOLD)
+        return self._upload_media(media, file_name, folder_id, app_properties)
+
+    def create_shortcut(self, target_id, folder_id, name):
+        """
+        Creates a shortcut named name in the folder pointing at target_id, so existing
+        content can appear in another folder without a copy. Returns the shortcut ID, or
+        None if the API call fails. Raises FileNotFoundError if the target was deleted or
+        is in the trash.
+        """
+        file_metadata = {
+            'name': name,
+            'mimeType': SHORTCUT_MIME_TYPE,
+            'shortcutDetails': {'targetId': target_id},
+            'parents': [folder_id]
+        }
+        try:
+            target = self.service.files().get(fileId=target_id, fields='id, trashed').execute()
+            if target.get('trashed'):
+                raise FileNotFoundError(f"File with ID '{target_id}' is in the trash.")
+            file = self.service.files().create(body=file_metadata, fields=INDEX_FILE_FIELDS).execute()
+            self._index_files([file])
+            return file.get('id')
+        except HttpError as httpexc:
+            if httpexc.resp.status == 404:
+                raise FileNotFoundError(f"File with ID '{target_id}' not found.")
+            print(f'Failed to create a shortcut to {target_id}: {httpexc}')
+            return None
+
+    def _upload_media(self, media, file_name, folder_id, app_properties=None):
         file_metadata = {
             'name': file_name,
             'parents': [folder_id]
         }
-        
+        if app_properties:
+            file_metadata['appProperties'] = app_properties
         try:
-            media = MediaFileUpload(file_path, resumable=True)
-            file = self.service.files().create(body=file_metadata, media_body=media, fields='id').execute()
+            file = self.service.files().create(body=file_metadata, media_body=media, fields=INDEX_FILE_FIELDS).execute()
             file_id = file.get('id')
             if not file_id:
                 raise Exception(f"Failed to upload file {file_name}")
-            permission = {
-                'type': 'anyone',
-                'role': 'reader'
-            }
-            self.service.permissions().create(fileId=file_id, body=permission).execute()
+            self._index_files([file])
+            # Files in a public folder inherit its permission, so only grant one otherwise
+            if folder_id not in self.public_folders:
+                self.service.permissions().create(fileId=file_id, body=ANYONE_READER_PERMISSION).execute()
             return file_id
         except HttpError as httpexc:
             print(f'An error occurred: {httpexc}')
@@ -100,18 +319,16 @@ class Drive:
         """
         file_metadata = {
             'name': folder_name,
-            'mimeType': 'application/vnd.google-apps.folder'
+            'mimeType': FOLDER_MIME_TYPE
         }
         try:
-            file = self.service.files().create(body=file_metadata, fields='id').execute()
+            file = self.service.files().create(body=file_metadata, fields=INDEX_FILE_FIELDS).execute()
             folder_id = file.get('id')
             if not folder_id:
                 raise Exception(f"Failed to create folder '{folder_name}'")
-            permission = {
-                'type': 'anyone',
-                'role': 'reader'
-            }
-            self.service.permissions().create(fileId=folder_id, body=permission).execute()
+            self._index_files([file])
+            self.service.permissions().create(fileId=folder_id, body=ANYONE_READER_PERMISSION).execute()
+            self.public_folders.add(folder_id)
             print(f"Folder '{folder_name}' created with ID: {folder_id}")
             return folder_id
         except HttpError as e:
@@ -121,23 +338,57 @@ class Drive:
         cleaned_user_id = user_id.strip("`")
         return str(cleaned_user_id)
     
-    def list_files(self, folder_id, images_only: bool = False):
+    def list_files_page(self, query, fields=FILE_FIELDS, page_size=DRIVE_PAGE_SIZE, page_token=None):
+        """
+        Runs one files().list call and returns (files, next_page_token); next_page_token is
+        None on the last page. Only the given per-file fields are requested.
+        """
+        response = self.service.files().list(
+            q=query,
+            pageSize=page_size,
+            pageToken=page_token,
+            fields=f'nextPageToken, files({fields})'
+        ).execute()
+        return response.get('files', []), response.get('nextPageToken')
+
+    def iter_files(self, query, fields=FILE_FIELDS, page_size=DRIVE_PAGE_SIZE):
+        """
+        Yields every file matching the Drive search query, following page tokens so that
+        listings past the first page are complete.
+        """
+        page_token = None
+        while True:
+            files, page_token = self.list_files_page(query, fields, page_size, page_token)
+            yield from files
+            if not page_token:
+                return
+
+    def list_files(self, folder_id, images_only: bool = False, fields=FILE_FIELDS):
         """
         Lists files in the given folder ID.
-        If images_only is True, only files with MIME type containing 'image/' are returned.
+        If images_only is True, only files with MIME type containing 'image/' are returned,
+        including shortcuts to images, which are resolved to their target (see resolve_shortcuts).
         Returns a list of dictionaries containing file metadata.
         """
         try:
             folder_id = self.clean_user_id(folder_id)
-            query = f"'{folder_id}' in parents"
+            files = None
+            if self.index is not None and fields == FILE_FIELDS:
+                files = self.index.list_children(folder_id, images_only)
+            if files is None:
+                # The index drops trashed files, so the network path must not return them either
+                query = f"{quote_query_value(folder_id)} in parents and trashed = false"
+                if images_only:
+                    query += f" and (mimeType contains 'image/' or mimeType = '{SHORTCUT_MIME_TYPE}')"
+                    fields = f"{fields}, shortcutDetails(targetId, targetMimeType)"
+                files = list(self.iter_files(query, fields))
             if images_only:
-                query += " and mimeType contains 'image/'"
-            results = self.service.files().list(q=query, fields='files(id, name, mimeType, modifiedTime, size)').execute()
-            return results.get('files', [])
+                files = [file for file in resolve_shortcuts(files) if file['mimeType'].startswith('image/')]
+            return files
         except HttpError as e:
             raise Exception(f"Error listing files in folder '{folder_id}': {e}")
     
-    def download_file(self, file_id, file_path):
+    def download_file(self, file_id, file_path, verbose=True):
         """
         Downloads the file with the given file_id to the specified file_path.
         """
@@ -148,7 +399,8 @@ class Drive:
                 done = False
                 while not done:
                     status, done = downloader.next_chunk()
-                    print(f'Download progress: {int(status.progress() * 100)}%')
+                    if verbose:
+                        print(f'Download progress: {int(status.progress() * 100)}%')
         except HttpError as e:
             if e.resp.status == 404:
                 raise FileNotFoundError(f"File with ID '{file_id}' not found.")
@@ -159,22 +411,26 @@ class Drive:
 
     def delete_file(self, file_id):
         self.service.files().delete(fileId=file_id).execute()
+        self._index_files(removed_ids=[file_id])
         print(f'File ID: {file_id} deleted')
         
     def delete_folder(self, folder_id):
         self.service.files().delete(fileId=folder_id).execute()
+        self._index_files(removed_ids=[folder_id])
         print(f'Folder ID: {folder_id} deleted')
         
     def get_folder_id(self, folder_name):
-        results = self.service.files().list(q=f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder'", fields='files(id)').execute()
-        items = results.get('files', [])
+        if self.index is not None and (folder_id := self.index.find_id(folder_name, mime_type=FOLDER_MIME_TYPE)):
+            return folder_id
+        items, _ = self.list_files_page(f"name={quote_query_value(folder_name)} and mimeType='{FOLDER_MIME_TYPE}' and trashed = false", fields='id', page_size=1)
         if not items:
             return None
         return items[0].get('id')
     
     def get_file_id(self, file_name, folder_id):
-        results = self.service.files().list(q=f"name='{file_name}' and '{folder_id}' in parents", fields='files(id)').execute()
-        items = results.get('files', [])
+        if self.index is not None and (file_id := self.index.find_id(file_name, parent_id=folder_id)):
+            return file_id
+        items, _ = self.list_files_page(f"name={quote_query_value(file_name)} and {quote_query_value(folder_id)} in parents and trashed = false", fields='id', page_size=1)
         if not items:
             return None
         return items[0].get('id')
@@ -186,22 +442,31 @@ class Drive:
         return f'https://drive.google.com/drive/folders/{folder_id}'
     
     def get_file_info(self, file_id):
-        return self.service.files().get(fileId=file_id, fields='id, name, mimeType, modifiedTime, size').execute()
+        if self.index is not None and (file_info := self.index.get_file(file_id)):
+            return file_info
+        file_info = self.service.files().get(fileId=file_id, fields=f'{FILE_FIELDS}, trashed').execute()
+        # Like the index, which drops trashed files, treat a trashed file as gone
+        if file_info.pop('trashed', False):
+            raise FileNotFoundError(f"File with ID '{file_id}' is in the trash.")
+        self._index_files([file_info])
+        return file_info
     
     def update_folder_names(self):
         items = self.list_files('root')
-        for item in items:
-            if item['mimeType'] == 'application/vnd.google-apps.folder' and item['name'] != "Weirdos":
-                new_name = f"blacklist-{item['name']}"
-                file_metadata = {'name': new_name}
-                self.service.files().update(fileId=item['id'], body=file_metadata).execute()
-                print(f'Folder ID: {item["id"]} updated to {new_name}')
+        folders = [item for item in items if item['mimeType'] == FOLDER_MIME_TYPE and item['name'] != "Weirdos"]
+        requests = [self.service.files().update(fileId=item['id'], body={'name': f"blacklist-{item['name']}"}, fields=INDEX_FILE_FIELDS) for item in folders]
+        for item, result in zip(folders, self.execute_batch(requests)):
+            if isinstance(result, HttpError):
+                print(f'Failed to rename folder ID: {item["id"]}: {result}')
+            else:
+                self._index_files([result])
+                print(f'Folder ID: {item["id"]} updated to blacklist-{item["name"]}')
                 
     def retrieve_folder_ids(self):
         folders_list = []
         items = self.list_files('root')
         for item in items:
-            if item['mimeType'] == 'application/vnd.google-apps.folder':
+            if item['mimeType'] == FOLDER_MIME_TYPE:
                 if item['name'] != "Weirdos":
                     folders_list.append((item['name'], item['id']))
         with open('folders_list.txt', 'w') as file:
@@ -211,13 +476,13 @@ class Drive:
         
     def set_all_folders_to_everyone(self):
         items = self.list_files('root')
-        for item in items:
-            if item['mimeType'] == 'application/vnd.google-apps.folder':
-                permission = {
-                    'type': 'anyone',
-                    'role': 'reader'
-                }
-                self.service.permissions().create(fileId=item['id'], body=permission).execute()
+        folders = [item for item in items if item['mimeType'] == FOLDER_MIME_TYPE]
+        requests = [self.service.permissions().create(fileId=item['id'], body=ANYONE_READER_PERMISSION) for item in folders]
+        for item, result in zip(folders, self.execute_batch(requests)):
+            if isinstance(result, HttpError):
+                print(f'Failed to share folder ID: {item["id"]}: {result}')
+            else:
+                self.public_folders.add(item['id'])
                 print(f'Folder ID: {item["id"]} set to everyone')
     
     def get_direct_image_url(self, file_id):
@@ -259,23 +524,165 @@ class Drive:
             print(f"Error downloading folder: {str(e)}")
             return None
     
-    def list_folders(self):
-        results = self.service.files().list(q="mimeType='application/vnd.google-apps.folder'", fields='files(id, name)').execute()
-        return results.get('files', [])
+    def list_folders(self, name_prefix=None):
+        """
+        Lists every folder as {'id', 'name'} dictionaries. name_prefix filters on the server
+        with "name contains", which matches word prefixes, so callers needing an exact
+        prefix should still check the names.
+        """
+        query = f"mimeType='{FOLDER_MIME_TYPE}'"
+        if name_prefix:
+            query += f" and name contains {quote_query_value(name_prefix)}"
+        return list(self.iter_files(query, fields='id, name'))
     
     def download_all_blacklist_folders(self, base_path="/root/blacklistimages"):
         try:
-            folders = self.list_folders()
-            blacklist_folders = [folder for folder in folders if folder['name'].startswith('blacklist-')]
-            print(f"Found {len(blacklist_folders)} blacklist folders")
-            for folder in blacklist_folders:
-                print(f"\nProcessing folder: {folder['name']}")
-                self.download_folder_images(folder['id'], base_path)
-            print("\nCompleted downloading all blacklist folders")
+            counts = self.mirror_blacklist_folders(base_path)
+            print(f"\nCompleted downloading all blacklist folders: {counts['downloaded']} downloaded, {counts['skipped']} unchanged, {counts['failed']} failed")
         except Exception as e:
             print(f"Error in download_all_blacklist_folders: {str(e)}")
 
+    def mirror_blacklist_folders(self, base_path="/root/blacklistimages", max_workers=MIRROR_WORKERS):
+        """
+        Mirrors the images of every blacklist- folder to base_path/<folder name>/. Folders are
+        listed MIRROR_PARENTS_PER_QUERY at a time and files downloaded on max_workers threads.
+        A manifest in base_path records each file's md5Checksum and modifiedTime, so files
+        that did not change are skipped and an interrupted run resumes where it stopped.
+        Returns the number of downloaded, skipped (unchanged) and failed files.
+        """
+        os.makedirs(base_path, exist_ok=True)
+        folders = {folder['id']: folder['name'] for folder in self.list_folders(name_prefix='blacklist-') if folder['name'].startswith('blacklist-')}
+        print(f"Found {len(folders)} blacklist folders")
+        manifest = MirrorManifest(os.path.join(base_path, MIRROR_MANIFEST))
+        counts = {'downloaded': 0, 'skipped': 0, 'failed': 0}
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='mirror')
+        try:
+            folder_ids = list(folders)
+            chunks = [folder_ids[start:start + MIRROR_PARENTS_PER_QUERY] for start in range(0, len(folder_ids), MIRROR_PARENTS_PER_QUERY)]
+            # A file with parents in two chunks is listed once per chunk
+            files = {file['id']: file for listing in executor.map(self._list_folder_images, chunks) for file in listing}
+            futures = [
+                executor.submit(self._mirror_file, file, relative_path, base_path, manifest)
+                for file, relative_path in self._mirror_paths(files.values(), folders)
+            ]
+            for future in as_completed(futures):
+                counts[future.result()] += 1
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            manifest.save()
+        return counts
+
+    def _list_folder_images(self, folder_ids):
+        parents = " or ".join(f"{quote_query_value(folder_id)} in parents" for folder_id in folder_ids)
+        return list(self.iter_files(f"({parents}) and mimeType contains 'image/'", fields=MIRROR_FILE_FIELDS))
+
+    def _mirror_paths(self, files, folders):
+        """
+        Yields (file, path relative to the mirror root) pairs. Files sharing a name within a
+        folder get their file ID appended so that they do not overwrite each other. Files no
+        longer in any of the folders are skipped.
+        """
+        used = set()
+        for file in sorted(files, key=lambda file: file['id']):
+            folder_id = next((parent for parent in file.get('parents', []) if parent in folders), None)
+            if folder_id is None:
+                continue
+            relative_path = os.path.join(_safe_name(folders[folder_id]), _safe_name(file['name']))
+            if relative_path in used:
+                stem, extension = os.path.splitext(relative_path)
+                relative_path = f"{stem}-{file['id']}{extension}"
+            used.add(relative_path)
+            yield file, relative_path
+
+    def _mirror_file(self, file, relative_path, base_path, manifest):
+        if manifest.is_current(file, relative_path, base_path):
+            return 'skipped'
+        path = os.path.join(base_path, relative_path)
+        try:
+            # A copy left by a run that stopped before saving the manifest is kept if it matches
+            if os.path.exists(path) and str(os.path.getsize(path)) == file.get('size') and _file_md5(path) == file.get('md5Checksum'):
+                manifest.record(file, relative_path)
+                return 'skipped'
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Download next to the target and rename, so a partial file never looks complete
+            partial_path = f"{path}.part"
+            self.download_file(file['id'], partial_path, verbose=False)
+            os.replace(partial_path, path)
+            manifest.record(file, relative_path)
+            return 'downloaded'
+        except Exception as e:
+            print(f"Failed to mirror {relative_path} ({file['id']}): {e}")
+            return 'failed'
+
+
+class AsyncDrive:
+    """
+    Awaitable version of Drive with the same methods. Each call runs on a bounded thread
+    pool, so the event loop keeps serving commands and gateway events while Drive HTTP
+    requests are in flight.
+    """
+    # Pure helpers that never touch the network stay synchronous
+    SYNC_METHODS = {'clean_user_id', 'get_file_link', 'get_folder_link'}
+
+    def __init__(self, drive=None, max_workers=DRIVE_MAX_WORKERS):
+        self.drive = drive if drive is not None else Drive()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='drive')
+
+    async def watch_index(self, interval=DRIVE_INDEX_SYNC_INTERVAL):
+        """
+        Keeps the wrapped Drive's metadata index current by running sync_index every
+        interval seconds. Runs until cancelled, so start it as a background task; returns
+        right away if the Drive has no index.
+        """
+        if self.drive.index is None:
+            return
+        while True:
+            try:
+                changes = await self.sync_index()
+                if changes:
+                    print(f"Drive index: applied {changes} changes")
+            except Exception as e:
+                print(f"Error syncing the Drive index: {e}")
+            await asyncio.sleep(interval)
+
+    async def iter_files(self, query, fields=FILE_FIELDS, page_size=DRIVE_PAGE_SIZE):
+        """
+        Async version of Drive.iter_files: each page is fetched on the thread pool.
+        """
+        page_token = None
+        while True:
+            files, page_token = await self.list_files_page(query, fields, page_size, page_token)
+            for file in files:
+                yield file
+            if not page_token:
+                return
+
+    def __getattr__(self, name):
+        method = getattr(self.drive, name)
+        if not callable(method) or name in self.SYNC_METHODS:
+            return method
+
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(method, *args, **kwargs))
+        return call
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
 
 if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Google Drive maintenance")
+    subparsers = parser.add_subparsers(dest="command")
+    mirror_parser = subparsers.add_parser("mirror", help="Mirror the images of every blacklist- folder, skipping unchanged files")
+    mirror_parser.add_argument("path", nargs="?", default="/root/blacklistimages")
+    mirror_parser.add_argument("--workers", type=int, default=MIRROR_WORKERS)
+    args = parser.parse_args()
+
     drive = Drive()
+    if args.command == "mirror":
+        counts = drive.mirror_blacklist_folders(args.path, max_workers=args.workers)
+        print(f"{counts['downloaded']} downloaded, {counts['skipped']} unchanged, {counts['failed']} failed")
     
\ No newline at end of file
@@ -1,32 +1,99 @@
-from hashlib import sha256
-import os
+import asyncio
+import hashlib
 import re
-import tempfile
+import time
 import aiohttp
 from interactions import Extension, Modal, OptionType, ShortText, SlashContext, Embed, EmbedField, EmbedFooter, Color, component_callback, modal_callback
 from interactions.ext.paginators import Paginator
-from database import RedisDB
+from database import AsyncRedisDB
 import aiohttp
 from datetime import datetime
 import interactions
-from drive import Drive
+from drive import DRIVE_INDEX_PATH, AsyncDrive, Drive
 
 
 class BlacklistExtension(Extension):
     WHITELIST_KEY = "whitelisted_users"
     FORCE_OVERRIDE_USER_ID = ["686107711829704725", "708812851229229208", "1259678639159644292", "1168346688969252894"]
     BLACKLIST_CHANNEL_PATTERN = re.compile(r".*blacklist*.", re.IGNORECASE)
+    EXPIRES_FIELD_PATTERN = re.compile(r"<t:(\d+)")
+    EXPIRY_SWEEP_INTERVAL = 60
+    EXPIRY_UNBAN_CONCURRENCY = 5
+    # Discord's limit of embeds per message; /list sends one message per page
+    LIST_PAGE_SIZE = 10
     
     def __init__(self, bot):
         self.bot = bot
-        self.drive = Drive()
-        self.db_blacklist = RedisDB(db=0)
-        self.db_whitelist = RedisDB(db=1)
-        self.db_servers = RedisDB(db=2)
+        self.drive = AsyncDrive(Drive(index_path=DRIVE_INDEX_PATH))
+        self.db_blacklist = AsyncRedisDB(db=0)
+        self.db_whitelist = AsyncRedisDB(db=1)
+        self.db_servers = AsyncRedisDB(db=2)
+        self.blacklist_watcher = None
+        self.expiry_sweeper = None
+        self.drive_index_watcher = None
+
+    @interactions.listen()
+    async def on_startup(self):
+        # Keeps an in-memory copy of the blacklist so membership checks in sync loops are I/O free
+        self.blacklist_watcher = asyncio.create_task(self.db_blacklist.watch_blacklist())
+        self.expiry_sweeper = asyncio.create_task(self.sweep_expired_blacklists())
+        # Answers Drive metadata lookups locally; see Drive.sync_index
+        self.drive_index_watcher = asyncio.create_task(self.drive.watch_index())
+
+    async def sweep_expired_blacklists(self):
+        """
+        Lifts time-limited blacklists once they expire. Each pass drains the due entries in
+        batches, so a quiet pass costs a single Redis call.
+        """
+        while True:
+            try:
+                while expired := await self.db_blacklist.expire_due_users():
+                    await self.unban_expired_users(expired)
+            except Exception as e:
+                print(f"Error sweeping expired blacklists: {e}")
+            await asyncio.sleep(self.EXPIRY_SWEEP_INTERVAL)
+
+    async def unban_expired_users(self, records):
+        semaphore = asyncio.Semaphore(self.EXPIRY_UNBAN_CONCURRENCY)
+
+        async def unban(guild, user_id):
+            async with semaphore:
+                try:
+                    await guild.unban(int(user_id), reason="Blacklist expired")
+                except Exception as e:
+                    print(f"Failed to unban expired user {user_id} in guild {guild.name}: {e}")
+
+        await asyncio.gather(*(unban(guild, record.user_id) for record in records for guild in self.bot.guilds))
+        print(f"Lifted {len(records)} expired blacklists")
         
+    async def upload_proof(self, data, file_name, folder_id, mime_type):
+        """
+        Stores a proof attachment in the folder, deduplicated by the sha256 of its bytes: a
+        proof already on Drive becomes a shortcut to the existing file instead of a new copy.
+        Returns the Drive ID of the file or shortcut, or None on failure.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        existing_id = await self.db_blacklist.get_proof_file(digest)
+        if existing_id:
+            try:
+                shortcut_id = await self.drive.create_shortcut(existing_id, folder_id, file_name)
+            except FileNotFoundError:
+                # The original was deleted or trashed; this upload becomes the new original
+                await self.db_blacklist.forget_proof_file(digest, existing_id)
+            else:
+                if shortcut_id:
+                    return shortcut_id
+                # Drive refused the shortcut (e.g. rate limited): store a plain copy and keep
+                # the existing file as the original
+                return await self.drive.upload_bytes(data, file_name, folder_id, mime_type=mime_type, app_properties={'sha256': digest})
+        file_id = await self.drive.upload_bytes(data, file_name, folder_id, mime_type=mime_type, app_properties={'sha256': digest})
+        if file_id:
+            await self.db_blacklist.set_proof_file(digest, file_id)
+        return file_id
+
     async def is_user_whitelisted(self, user_id):
         if str(user_id) in [str(id) for id in self.FORCE_OVERRIDE_USER_ID]: return True
-        return self.db_whitelist.redis.sismember(self.WHITELIST_KEY, str(user_id))
+        return await self.db_whitelist.redis.sismember(self.WHITELIST_KEY, str(user_id))
         
     @interactions.slash_command(name="whitelist", description="Whitelist a user")
     @interactions.slash_option(
@@ -39,7 +106,7 @@ class BlacklistExtension(Extension):
         if not await self.is_user_whitelisted(ctx.author.id):
             await ctx.send("You are not authorized to modify the whitelist.", ephemeral=True)
             return
-        self.db_whitelist.redis.sadd(self.WHITELIST_KEY, str(user.id))
+        await self.db_whitelist.redis.sadd(self.WHITELIST_KEY, str(user.id))
         await ctx.send(f"User <@{user.id}> has been added to the whitelist.", ephemeral=True)
 
     @interactions.slash_command(name="unwhitelist", description="Unwhitelist a user")
@@ -53,22 +120,22 @@ class BlacklistExtension(Extension):
         if not await self.is_user_whitelisted(ctx.author.id):
             await ctx.send("You are not authorized to modify the whitelist.", ephemeral=True)
             return
-        if not self.db_whitelist.redis.sismember(self.WHITELIST_KEY, str(user.id)):
+        if not await self.db_whitelist.redis.sismember(self.WHITELIST_KEY, str(user.id)):
             await ctx.send(f"User <@{user.id}> is not whitelisted.", ephemeral=True)
         else:
-            self.db_whitelist.redis.srem(self.WHITELIST_KEY, str(user.id))
+            await self.db_whitelist.redis.srem(self.WHITELIST_KEY, str(user.id))
             await ctx.send(f"User <@{user.id}> has been removed from the whitelist.", ephemeral=True)
 
     @interactions.slash_command(name="search", description="Search for a blacklisted user")
     @interactions.slash_option(
         name="pattern",
-        description="Pattern to search for in the blacklist",
+        description="Pattern to search for in the blacklist (1-2 characters match the start of names only)",
         required=True,
         opt_type=OptionType.STRING
     )
     async def search_blacklist(self, ctx: SlashContext, pattern: str):
         print(f"Searching for pattern: {pattern}")
-        matched_data = self.db_blacklist.search_users(pattern)        
+        matched_data = await self.db_blacklist.search_users(pattern)        
         if not matched_data:
             await ctx.send(f"No blacklisted user found with the pattern `{pattern}`", ephemeral=True)
             return
@@ -99,7 +166,7 @@ class BlacklistExtension(Extension):
             await ctx.send("You are not whitelisted!", ephemeral=True)
             return
         
-        whitelisted_ids = self.db_whitelist.redis.smembers(self.WHITELIST_KEY)
+        whitelisted_ids = await self.db_whitelist.redis.smembers(self.WHITELIST_KEY)
         if not whitelisted_ids:
             await ctx.send("There are no whitelisted users.", ephemeral=True)
             return
@@ -129,13 +196,40 @@ class BlacklistExtension(Extension):
             await ctx.send("You are not whitelisted!", ephemeral=True)
             return
         
-        keys_values = self.db_blacklist.list_all_users_info()
-        if not keys_values:
+        total_users = await self.db_blacklist.count_users()
+        if not total_users:
             await ctx.send("There are no blacklisted users.", ephemeral=True)
             return
         
+        await ctx.defer(ephemeral=True)
+        await self.send_blacklist_page(ctx, 0, 0, total_users)
+
+    @component_callback(re.compile(r"list_blacklist:.*"))
+    async def list_blacklist_next(self, ctx):
+        if not await self.is_user_whitelisted(ctx.author.id):
+            await ctx.send("You are not whitelisted!", ephemeral=True)
+            return
+        _, cursor, shown = ctx.custom_id.split(":")
+        await ctx.defer(ephemeral=True)
+        await self.send_blacklist_page(ctx, int(cursor), int(shown), await self.db_blacklist.count_users())
+
+    async def send_blacklist_page(self, ctx, cursor, shown, total_users):
+        """
+        Sends the users of the next SSCAN step from cursor, so only one page is held in memory.
+        The "Next" button carries the cursor and the number of users shown so far.
+        """
+        users = {}
+        while not users:
+            cursor, users = await self.db_blacklist.scan_users_info(cursor, count=self.LIST_PAGE_SIZE)
+            if not cursor:
+                break
+        if not users:
+            await ctx.send("There are no more blacklisted users.", ephemeral=True)
+            return
+
         embeds = []
-        for index, (user_id, user_info) in enumerate(keys_values.items()):
+        for user_id, user_info in users.items():
+            index = shown + len(embeds)
             username = user_info.get("username", "N/A")
             reason = user_info.get("reason", "N/A")
             proof_link = user_info.get("proof_link", "N/A")
@@ -151,13 +245,23 @@ class BlacklistExtension(Extension):
                     EmbedField(name="🔗 Proof Link", value=f"[Click Here]({proof_link})", inline=False),
                     EmbedField(name="Folder ID", value=f"`{folder_id}`", inline=True),
                 ],
-                footer=EmbedFooter(text=f"Blacklist System | Page {index + 1} of {len(keys_values)}"),
+                footer=EmbedFooter(text=f"Blacklist System | User {index + 1} of {total_users}"),
                 timestamp=datetime.now().isoformat()
             )
             embeds.append(embed)
-        
-        paginator = Paginator.create_from_embeds(self.bot, *embeds)
-        await paginator.send(ctx, ephemeral=True)
+
+        # SSCAN may return more users than asked for, so a page can span several messages
+        chunks = [embeds[start:start + self.LIST_PAGE_SIZE] for start in range(0, len(embeds), self.LIST_PAGE_SIZE)]
+        for index, chunk in enumerate(chunks):
+            components = []
+            if cursor and index == len(chunks) - 1:
+                next_button = interactions.Button(
+                    style=interactions.ButtonStyle.PRIMARY,
+                    label="Next",
+                    custom_id=f"list_blacklist:{cursor}:{shown + len(embeds)}"
+                )
+                components = [interactions.ActionRow(next_button)]
+            await ctx.send(embeds=chunk, components=components, ephemeral=True)
     
     @interactions.slash_command(name="blacklist", description="Blacklist a user")
     @interactions.slash_option(
@@ -214,13 +318,20 @@ class BlacklistExtension(Extension):
         required=False,
         opt_type=OptionType.ATTACHMENT,
     )
-    async def blacklist(self, ctx: SlashContext, user: interactions.User, reason: str, msn: bool, aliases: str = None, file1: interactions.Attachment=None, file2: interactions.Attachment=None, file3: interactions.Attachment=None, file4: interactions.Attachment=None, file5: interactions.Attachment=None):
+    @interactions.slash_option(
+        name="days",
+        description="Lift the blacklist after this many days (default: permanent)",
+        required=False,
+        opt_type=OptionType.INTEGER,
+        min_value=1,
+    )
+    async def blacklist(self, ctx: SlashContext, user: interactions.User, reason: str, msn: bool, aliases: str = None, file1: interactions.Attachment=None, file2: interactions.Attachment=None, file3: interactions.Attachment=None, file4: interactions.Attachment=None, file5: interactions.Attachment=None, days: int = None):
         if not await self.is_user_whitelisted(ctx.author.id):
             await ctx.send("You are not whitelisted!", ephemeral=True)
             return
         
         await ctx.defer(ephemeral=True)
-        folder_id = self.drive.create_folder(f"blacklist-{user.username}")
+        folder_id = await self.drive.create_folder(f"blacklist-{user.username}")
         folder_link = f"https://drive.google.com/drive/folders/{folder_id}"
 
         files = [file1, file2, file3, file4, file5]
@@ -232,13 +343,7 @@ class BlacklistExtension(Extension):
                     if resp.status != 200 or resp.content_type not in ["image/png", "image/jpeg", "image/gif"]:
                         print(f"Failed to download image or invalid content type for {image.url}")
                         continue
-                    fd, path = tempfile.mkstemp(suffix=".png")
-                    try:
-                        with os.fdopen(fd, 'wb') as tmp:
-                            tmp.write(await resp.read())
-                        self.drive.upload_file(path, folder_id)
-                    finally:
-                        os.unlink(path)
+                    await self.upload_proof(await resp.read(), image.filename, folder_id, resp.content_type)
 
         # Create basic embed fields
         embed_fields = [
@@ -248,6 +353,10 @@ class BlacklistExtension(Extension):
             EmbedField(name="Proof Link", value=folder_link, inline=False),
             EmbedField(name="MSN", value=str(msn), inline=True),
         ]
+        if days:
+            # Counted from the request; approve_blacklist reads the timestamp back from this field
+            expires_at = int(time.time()) + days * 86400
+            embed_fields.append(EmbedField(name="Expires", value=f"<t:{expires_at}:f>", inline=True))
 
         # If aliases exist, add them to embed
         if aliases:
@@ -325,6 +434,7 @@ class BlacklistExtension(Extension):
         username = None
         folder_id = None
         msn_check = False
+        expires_at = None
         for field in ctx.message.embeds[0].fields:
             print(f"Field: {field.name} - {field.value}")
             if field.name == "Proof Link":
@@ -336,18 +446,25 @@ class BlacklistExtension(Extension):
                 user_id = str(field.value).strip("`")
             elif field.name == "MSN":
                 msn_check = field.value.lower() == "true"
+            elif field.name == "Expires":
+                match = self.EXPIRES_FIELD_PATTERN.match(str(field.value))
+                expires_at = int(match.group(1)) if match else None
         if not all([user_id, reason, proof_link]):
             await ctx.send("Missing required information from embed!", ephemeral=True)
             return
         username = f"user_{user_id}"
         try:
-            self.db_blacklist.set_user(
+            current_sync_hash = await self.db_blacklist.set_user(
                 user_id=str(user_id),
                 username=str(username),
                 reason=str(reason),
                 proof_link=str(proof_link),
-                folder_id=str(folder_id)
+                folder_id=str(folder_id),
+                expires_at=expires_at
             )
+            if current_sync_hash is None:
+                await ctx.send("Failed to store the blacklist, please try again.", ephemeral=True)
+                return
             original_embed = ctx.message.embeds[0]
             approved_embed = Embed(
                 title=original_embed.title,
@@ -400,11 +517,10 @@ class BlacklistExtension(Extension):
                 notification_row.components.extend([view_images_link_button, view_images_direct_button])
 
             # Always perform bans
-            keys_values = self.db_blacklist.list_all_users_info()
-            current_sync_hash = sha256(str(keys_values).encode('utf-8')).hexdigest()
             successful_bans = 0
             failed_bans = 0
             ban_errors = []
+            synced_guild_ids = []
             for guild in self.bot.guilds:
                 try:
                     if not guild.me.guild_permissions.BAN_MEMBERS:
@@ -413,7 +529,7 @@ class BlacklistExtension(Extension):
                         failed_bans += 1
                         continue
                     await guild.ban(int(user_id), reason=f"Blacklisted: {reason}")
-                    self.db_servers.set_last_sync_details(str(guild.id), current_sync_hash)
+                    synced_guild_ids.append(str(guild.id))
                     successful_bans += 1
                     print(f"Successfully banned user {user_id} in guild: {guild.name} ({guild.id})")
                     
@@ -434,6 +550,7 @@ class BlacklistExtension(Extension):
                     print(f"Failed to ban in guild {guild.name} ({guild.id}): {e}")
                     ban_errors.append(f"Failed in {guild.name}: {str(e)}")
                     failed_bans += 1
+            await self.db_servers.set_last_sync_hashes(synced_guild_ids, current_sync_hash)
             total_guilds = len(self.bot.guilds)
             ban_status = f"Ban Results:\n✅ Successful: {successful_bans}/{total_guilds} guilds"
             if failed_bans > 0:
@@ -506,13 +623,13 @@ class BlacklistExtension(Extension):
         folder_id = ctx.message.embeds[0].fields[2].value
         folder_id = folder_id.split("/")[-1].rstrip(")")
         await ctx.send("Processing images...", ephemeral=True)
-        image_files = self.drive.list_files(folder_id, images_only=True)
+        image_files = await self.drive.list_files(folder_id, images_only=True)
         if not image_files:
             await ctx.send("No images found in the folder.", ephemeral=True)
             return
         image_files = image_files[:10]
         if len(image_files) == 1:
-            direct_url = self.drive.get_direct_image_url(image_files[0]['id'])
+            direct_url = await self.drive.get_direct_image_url(image_files[0]['id'])
             embed = Embed(
                 title="Blacklist Image",
                 color=Color.random(),
@@ -523,8 +640,8 @@ class BlacklistExtension(Extension):
             await ctx.send(embed=embed, ephemeral=True)
         else:
             embeds = []
-            for index, image_file in enumerate(image_files):
-                direct_url = self.drive.get_direct_image_url(image_file['id'])
+            direct_urls = await asyncio.gather(*(self.drive.get_direct_image_url(image_file['id']) for image_file in image_files))
+            for index, direct_url in enumerate(direct_urls):
                 embed = Embed(
                     title=f"Blacklist Image {index + 1}/{len(image_files)}",
                     color=Color.random(),
@@ -548,10 +665,10 @@ class BlacklistExtension(Extension):
             await ctx.send("You are not whitelisted!", ephemeral=True)
             return
         
-        if not self.db_blacklist.exists(str(user.id)):
+        if not await self.db_blacklist.exists(str(user.id)):
             await ctx.send(f"User <@{user.id}> is not blacklisted.", ephemeral=True)
         else:
-            self.db_blacklist.delete_user(str(user.id))
+            await self.db_blacklist.delete_user(str(user.id))
             await ctx.send(f"User <@{user.id}> has been removed from the blacklist.", ephemeral=True)
         for guild in self.bot.guilds:
             try:
@@ -586,9 +703,6 @@ class BlacklistExtension(Extension):
                     data = await resp.json()
                     new_members = data['new_member_ids']
 
-            keys_values = self.db_blacklist.list_all_users_info()
-            current_sync_hash = sha256(str(keys_values).encode('utf-8')).hexdigest()
-            
             ban_results = {
                 "success": 0,
                 "failed": 0,
@@ -600,17 +714,17 @@ class BlacklistExtension(Extension):
             for user_id in new_members:
                 try:
                     # Check if user is already in database
-                    if self.db_blacklist.exists(str(user_id)):
+                    if await self.db_blacklist.exists(str(user_id)):
                         continue
                         
                     user = await self.bot.fetch_user(int(user_id))
                     
                     # Create folder in Google Drive
-                    folder_id = self.drive.create_folder(f"blacklist-{user.username}")
+                    folder_id = await self.drive.create_folder(f"blacklist-{user.username}")
                     folder_link = f"https://drive.google.com/drive/folders/{folder_id}"
                     
                     # Add user to database
-                    self.db_blacklist.set_user(
+                    current_sync_hash = await self.db_blacklist.set_user(
                         user_id=str(user_id),
                         username=str(user.username),
                         reason="Member of target server",
@@ -634,6 +748,7 @@ class BlacklistExtension(Extension):
                     )
 
                     # Ban user from all guilds and send embed to blacklist channels
+                    synced_guild_ids = []
                     for guild in self.bot.guilds:
                         try:
                             if not guild.me.guild_permissions.BAN_MEMBERS:
@@ -642,7 +757,7 @@ class BlacklistExtension(Extension):
                                 continue
                                 
                             await guild.ban(int(user_id), reason="Blacklisted: Target server member")
-                            self.db_servers.set_last_sync_details(str(guild.id), current_sync_hash)
+                            synced_guild_ids.append(str(guild.id))
                             ban_results["success"] += 1
                             
                             # Send embed to blacklist channel
@@ -658,6 +773,7 @@ class BlacklistExtension(Extension):
                         except Exception as e:
                             ban_results["failed"] += 1
                             ban_results["errors"].append(f"Failed in {guild.name}: {str(e)}")
+                    await self.db_servers.set_last_sync_hashes(synced_guild_ids, current_sync_hash)
                     
                 except Exception as e:
                     print(f"Error processing user {user_id}: {e}")
@@ -20,7 +20,7 @@ from interactions import (
     ButtonStyle,
     ComponentContext,
 )
-from database import RedisDB
+from database import AsyncRedisDB
 
 class ColorConverter:
     @staticmethod
@@ -63,15 +63,15 @@ class EmbedExtension(Extension):
 
     def __init__(self, bot):
         self.bot = bot
-        self.db = RedisDB(db=122)
-        self.db_whitelist = RedisDB(db=1)
+        self.db = AsyncRedisDB(db=122)
+        self.db_whitelist = AsyncRedisDB(db=1)
         self.embed_limit = 100
         self.WHITELIST_KEY = "whitelisted_users"
     
     async def get(self, key):
         """Get a value from Redis and parse it as JSON."""
         try:
-            value = self.db.redis.get(key)
+            value = await self.db.redis.get(key)
             if value:
                 import json
                 return json.loads(value.decode('utf-8'))
@@ -80,25 +80,25 @@ class EmbedExtension(Extension):
             print(f"Error getting key {key} from Redis: {e}")
             return None
 
-    def set(self, key, value):
+    async def set(self, key, value):
         """Set a value in Redis after converting it to JSON."""
         try:
             import json
-            self.db.redis.set(key, json.dumps(value))
+            await self.db.redis.set(key, json.dumps(value))
         except Exception as e:
             print(f"Error setting key {key} in Redis: {e}")
 
-    def list_keys(self, pattern):
+    async def list_keys(self, pattern):
         """List all keys matching the given pattern."""
         try:
-            return [key.decode('utf-8') for key in self.db.redis.scan_iter(pattern)]
+            return [key.decode('utf-8') async for key in self.db.redis.scan_iter(pattern)]
         except Exception as e:
             print(f"Error listing keys with pattern {pattern}: {e}")
             return []
 
     async def is_user_whitelisted(self, user_id):
         if str(user_id) in [str(id) for id in self.FORCE_OVERRIDE_USER_ID]: return True
-        return self.db_whitelist.redis.sismember(self.WHITELIST_KEY, str(user_id))
+        return await self.db_whitelist.redis.sismember(self.WHITELIST_KEY, str(user_id))
 
     def get_embed_buttons(self, name: str) -> list[ActionRow]:
         row1 = ActionRow(
@@ -294,7 +294,7 @@ class EmbedExtension(Extension):
             return
         await ctx.defer(ephemeral=True)
         pattern = f"embed:{ctx.author.id}:*"
-        embed_keys = self.list_keys(pattern)
+        embed_keys = await self.list_keys(pattern)
         if not embed_keys:
             await ctx.send("No saved embed templates found.", ephemeral=True)
             return
@@ -335,12 +335,12 @@ class EmbedExtension(Extension):
             await ctx.send("You don't have permission to flush the embed database.", ephemeral=True)
             return
         pattern = f"embed:{ctx.author.id}:*"
-        embed_keys = self.list_keys(pattern)
+        embed_keys = await self.list_keys(pattern)
         if not embed_keys:
             await ctx.send("No saved embed templates to flush.", ephemeral=True)
             return
         for key in embed_keys:
-            self.db.redis.delete(key)
+            await self.db.redis.delete(key)
         await ctx.send(f"Successfully deleted {len(embed_keys)} embed templates.", ephemeral=True)
 
     @embed.subcommand(
@@ -575,7 +575,7 @@ class EmbedExtension(Extension):
             embed_data = self.serialize_embed(embed)
         if event_type == "none":
             if "event_config" in embed_data: del embed_data["event_config"]
-            self.set(key, embed_data)
+            await self.set(key, embed_data)
             await ctx.send("Event registration removed. This is now a standard embed.", ephemeral=True)
             return
         try:
@@ -597,7 +597,7 @@ class EmbedExtension(Extension):
             "is_finalized": False
         }
         embed_data["event_config"] = event_data
-        self.set(key, embed_data)
+        await self.set(key, embed_data)
         await ctx.send(f"Event registered! This embed will be sent to <#{channel_id}> when new members join.", ephemeral=True)
     
     @modal_callback(re.compile(r"embed_images_modal:(.+)"))
@@ -749,7 +749,7 @@ class EmbedExtension(Extension):
             finalize_message = "Embed finalized with event configuration!"
         else:
             finalize_message = "Embed finalized!"
-        self.set(key, embed_data)
+        await self.set(key, embed_data)
         await message.edit(
             embed=embed,
             components=[]
@@ -770,7 +770,7 @@ class EmbedExtension(Extension):
             return
         data = self.serialize_embed(embed)
         key = self.get_embed_key(str(ctx.author.id), embed_name)
-        self.set(key, data)
+        await self.set(key, data)
         await ctx.send(f"Embed template saved as '{embed_name}'!", ephemeral=True)
     
     @listen("member_add")
@@ -779,7 +779,7 @@ class EmbedExtension(Extension):
         member = event.member
         print(f"Member join event triggered for {member} in guild {guild_id}")
         pattern = "embed:*"
-        embed_keys = self.list_keys(pattern)
+        embed_keys = await self.list_keys(pattern)
         print(f"Found {len(embed_keys)} total embed keys")
         for key in embed_keys:
             try:
@@ -3,7 +3,7 @@ from interactions import Extension, slash_command, SlashContext, OptionType, sla
 from typing import Dict
 import re
 import interactions
-from database import RedisDB
+from database import AsyncRedisDB
 
 class GrokExtension(Extension):
     def __init__(self, bot):
@@ -19,7 +19,7 @@ class GrokExtension(Extension):
         Provide only one or two sentences as response."""
         
         # Whitelist setup
-        self.db_whitelist = RedisDB(db=1)
+        self.db_whitelist = AsyncRedisDB(db=1)
         self.WHITELIST_KEY = "whitelist"
         self.FORCE_OVERRIDE_USER_ID = [
             "686107711829704725", 
@@ -31,7 +31,7 @@ class GrokExtension(Extension):
     async def is_user_whitelisted(self, user_id):
         if str(user_id) in self.FORCE_OVERRIDE_USER_ID:
             return True
-        return self.db_whitelist.redis.sismember(self.WHITELIST_KEY, str(user_id))
+        return await self.db_whitelist.redis.sismember(self.WHITELIST_KEY, str(user_id))
 
     def truncate_to_complete_sentence(self, text: str) -> str:
         sentence_endings = list(re.finditer(r'[.!?][\s"\')]?', text))
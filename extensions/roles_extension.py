@@ -3,7 +3,7 @@ from interactions import Extension, slash_command, Embed, Button, ButtonStyle, C
     ComponentContext
 from typing import Optional
 
-from database import RedisDB
+from database import AsyncRedisDB
 
 class RolesExtension(Extension):
     FORCE_OVERRIDE_USER_ID = ["686107711829704725", "708812851229229208", "1259678639159644292", "1168346688969252894"]
@@ -11,7 +11,7 @@ class RolesExtension(Extension):
 
     def __init__(self, bot):
         self.bot = bot
-        self.db_whitelist = RedisDB(db=1)
+        self.db_whitelist = AsyncRedisDB(db=1)
         self.role_type_map = {
             "Buyer": 1273737954874884176,
             "Seller": 1273738137897799782,
@@ -44,7 +44,7 @@ class RolesExtension(Extension):
 
     async def is_user_whitelisted(self, user_id):
         if str(user_id) in [str(id) for id in self.FORCE_OVERRIDE_USER_ID]: return True
-        return self.db_whitelist.redis.sismember(self.WHITELIST_KEY, str(user_id))
+        return await self.db_whitelist.redis.sismember(self.WHITELIST_KEY, str(user_id))
 
     @slash_command(
         name="sendfancyroles",
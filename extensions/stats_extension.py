@@ -0,0 +1,71 @@
+from datetime import datetime
+from interactions import Embed, EmbedFooter, Extension, Color, OptionType, SlashContext
+from interactions.ext.paginators import Paginator
+import interactions
+
+from database import DATABASES, LATENCY, AsyncRedisDB, async_keyspace_report
+
+class StatsExtension(Extension):
+    WHITELIST_KEY = "whitelisted_users"
+    FORCE_OVERRIDE_USER_ID = ["686107711829704725", "708812851229229208", "1259678639159644292", "1168346688969252894"]
+    FAMILIES_PER_EMBED = 15
+    METHODS_PER_EMBED = 20
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.db_whitelist = AsyncRedisDB(db=1)
+
+    async def is_user_whitelisted(self, user_id):
+        if str(user_id) in [str(id) for id in self.FORCE_OVERRIDE_USER_ID]: return True
+        return await self.db_whitelist.redis.sismember(self.WHITELIST_KEY, str(user_id))
+
+    def keyspace_embed(self, report):
+        lines = [
+            f"{family['family'][:28]:<28} {family['keys']:>8} {family['bytes_per_key']:>7.0f}B ~{family['estimated_bytes'] / 1024:>8.1f}K {'/'.join(family['encodings'])}"
+            for family in report["families"][:self.FAMILIES_PER_EMBED]
+        ]
+        if len(report["families"]) > self.FAMILIES_PER_EMBED:
+            lines.append(f"...and {len(report['families']) - self.FAMILIES_PER_EMBED} more families")
+        return Embed(
+            title=f"db {report['db']} ({report['name']})",
+            description=f"**{report['keys']}** keys, ~**{report['estimated_bytes'] / 1024:.1f} KiB**\n```\n" + ("\n".join(lines) or "empty") + "\n```",
+            color=Color.random(),
+            footer=EmbedFooter(text="family / keys / bytes per key / estimated total / encodings"),
+            timestamp=datetime.now().isoformat()
+        )
+
+    def latency_embed(self):
+        stats = list(LATENCY.stats().items())[:self.METHODS_PER_EMBED]
+        lines = [
+            f"{name.split('.', 1)[-1][:24]:<24} {entry['calls']:>7} {entry['p50']:>7.2f} {entry['p95']:>7.2f} {entry['p99']:>7.2f}"
+            for name, entry in stats
+        ]
+        return Embed(
+            title="RedisDB latency",
+            description=f"```\n{'method':<24} {'calls':>7} {'p50':>7} {'p95':>7} {'p99':>7}\n" + ("\n".join(lines) or "no calls yet") + "\n```",
+            color=Color.random(),
+            footer=EmbedFooter(text=f"Milliseconds over the last {LATENCY.window} calls per method, since the bot started"),
+            timestamp=datetime.now().isoformat()
+        )
+
+    @interactions.slash_command(name="db_stats", description="Show Redis key counts, memory per key family and RedisDB latencies")
+    @interactions.slash_option(
+        name="sample_size",
+        description="Keys sampled per key family (default: 20)",
+        required=False,
+        opt_type=OptionType.INTEGER,
+        min_value=1,
+        max_value=500,
+    )
+    async def db_stats(self, ctx: SlashContext, sample_size: int = 20):
+        if not await self.is_user_whitelisted(ctx.author.id):
+            await ctx.send("You are not whitelisted!", ephemeral=True)
+            return
+        await ctx.defer(ephemeral=True)
+        embeds = [self.latency_embed()]
+        for db in DATABASES:
+            report = await async_keyspace_report(db, sample_size=sample_size)
+            if report:
+                embeds.append(self.keyspace_embed(report))
+        paginator = Paginator.create_from_embeds(self.bot, *embeds)
+        await paginator.send(ctx, ephemeral=True)
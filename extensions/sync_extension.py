@@ -1,26 +1,61 @@
-from hashlib import sha256
+import asyncio
 import datetime
 import re
-from typing import Dict
-from interactions import Button, ButtonStyle, Embed, EmbedField, Extension, Color
+from interactions import Button, ButtonStyle, Embed, EmbedField, EmbedFooter, Extension, Color
+from interactions.ext.paginators import Paginator
 import interactions
 
-from database import RedisDB
+from database import SYNC_CLAIM_TTL, AsyncRedisDB, collapse_changes
 
 class SyncBlacklistsExtension(Extension):
     WHITELIST_KEY = "whitelisted_users"
     FORCE_OVERRIDE_USER_ID = "708812851229229208"
     BLACKLIST_CHANNEL_PATTERN = re.compile(r'.*blacklist*.', re.IGNORECASE)
+    GUILDS_PER_STATUS_PAGE = 15
+    # Claims are renewed well before SYNC_CLAIM_TTL runs out, however long the ban loop takes
+    CLAIM_RENEW_INTERVAL = SYNC_CLAIM_TTL / 3
     
     def __init__(self, bot):
         self.bot = bot
-        self.db = RedisDB(db=0)
-        self.db_whitelist = RedisDB(db=1)
-        self.db_servers = RedisDB(db=2)
+        self.db = AsyncRedisDB(db=0)
+        self.db_whitelist = AsyncRedisDB(db=1)
+        self.db_servers = AsyncRedisDB(db=2)
         
     async def is_user_whitelisted(self, user_id):
         if str(user_id) == self.FORCE_OVERRIDE_USER_ID: return True
-        return self.db_whitelist.redis.sismember(self.WHITELIST_KEY, str(user_id))
+        return await self.db_whitelist.redis.sismember(self.WHITELIST_KEY, str(user_id))
+
+    async def get_pending_users(self, consumer):
+        """
+        Returns (head_id, users) where users is an async iterator of (user_id, info) for the
+        users the consumer still has to process: the users added since its changelog offset,
+        or the whole blacklist (streamed in batches) when it has no offset yet or the
+        changelog no longer reaches back that far.
+        Pass head_id to set_changelog_offset once the users have been processed.
+        """
+        head_id = await self.db.get_changelog_head()
+        last_id = await self.db.get_changelog_offset(consumer)
+        if last_id is not None:
+            changes = await self.db.get_changes_since(last_id, until=head_id)
+            if changes is not None:
+                added = [user_id for user_id, op in collapse_changes(changes).items() if op == "add"]
+                return head_id, self._iter_items(await self.db.get_users_info(added))
+        return head_id, self.db.iter_users_info()
+
+    async def renew_claim(self, guild_id, claim_token):
+        """
+        Keeps a guild sync claim alive while the sync runs; cancel it once the sync is done.
+        """
+        while True:
+            await asyncio.sleep(self.CLAIM_RENEW_INTERVAL)
+            if not await self.db_servers.renew_guild_sync(guild_id, claim_token):
+                print(f"Lost the sync claim of guild {guild_id}")
+                return
+
+    @staticmethod
+    async def _iter_items(mapping):
+        for item in mapping.items():
+            yield item
     
     @interactions.slash_command(
         name="sync_blacklists",
@@ -34,12 +69,7 @@ class SyncBlacklistsExtension(Extension):
         await ctx.defer(ephemeral=True)
         msg = await ctx.send("Syncing blacklists...")
 
-        keys_values = self.db.list_all_users_info()
-        if not keys_values:
-            await ctx.send("There are no blacklisted users.", ephemeral=True)
-            return
-
-        current_sync_hash = sha256(str(keys_values).encode('utf-8')).hexdigest()
+        current_sync_hash = await self.db.get_blacklist_version()
         print(f"current_sync_hash: {current_sync_hash}")
 
         guild = ctx.guild
@@ -51,30 +81,48 @@ class SyncBlacklistsExtension(Extension):
             await ctx.send("I do not have permission to ban members in this server.", ephemeral=True)
             return
 
-        if self.db_servers.check_if_guild_synced(str(guild.id), current_sync_hash):
-            sync_details = self.db_servers.get_sync_details(str(guild.id))
+        status, claim_token, sync_details = await self.db_servers.claim_guild_sync(str(guild.id), current_sync_hash)
+        if status == "synced":
             users_synced = sync_details.get("count", 'N/A')
             channel_id = sync_details.get("channel_id", 'N/A')
             await ctx.send(f"Blacklist in this guild is already up to date. Channel ID: {channel_id}, Users Synced: {users_synced}", ephemeral=True)
             return
+        if status == "busy":
+            await ctx.send("A blacklist sync is already running in this guild.", ephemeral=True)
+            return
+
+        renewer = asyncio.create_task(self.renew_claim(str(guild.id), claim_token))
+        try:
+            await self.run_blacklist_sync(ctx, msg, guild, current_sync_hash, claim_token)
+        finally:
+            renewer.cancel()
+            # No-op once commit_guild_sync has released the claim
+            await self.db_servers.release_guild_sync(str(guild.id), claim_token)
+
+    async def run_blacklist_sync(self, ctx, msg, guild, current_sync_hash, claim_token):
+        consumer = f"sync_blacklists:{guild.id}"
+        head_id, keys_values = await self.get_pending_users(consumer)
+        total_users = await self.db.count_users()
+        if not total_users:
+            await ctx.send("There are no blacklisted users.", ephemeral=True)
+            return
 
         guild_synced_count = 0
 
-        for user_id in keys_values.keys():
+        blacklist_channels = [channel for channel in guild.channels if self.BLACKLIST_CHANNEL_PATTERN.match(channel.name) or channel.name in ["blacklist", "blacklists"]]
+        print(blacklist_channels)
+
+        # Single pass over the (possibly streamed) users: ban, then post to the blacklist channels
+        async for user_id, user_info in keys_values:
             try:
                 await guild.ban(user_id, reason="Blacklisted by the bot.")
                 guild_synced_count += 1
             except Exception as e:
                 print(f"Error banning user {user_id} in guild {guild.id}: {e}")
 
-        blacklist_channels = [channel for channel in guild.channels if self.BLACKLIST_CHANNEL_PATTERN.match(channel.name) or channel.name in ["blacklist", "blacklists"]]
-        if not blacklist_channels:
-            print(f"Blacklist channel not found in guild {guild.id}.")
-            await ctx.send(f"Blacklist channel not found in this guild.", ephemeral=True)
-            return
-        print(blacklist_channels)
+            if not blacklist_channels:
+                continue
 
-        for user_id, user_info in keys_values.items():
             embed = Embed(
                 title=f"{user_info.get('username', 'N/A')} has been blacklisted!",
                 description=f"Here's some detailed information about the blacklist:",
@@ -110,13 +158,18 @@ class SyncBlacklistsExtension(Extension):
 
             for blacklist_channel in blacklist_channels:
                 await blacklist_channel.send(embed=embed, components=[action_row])
-        
+
+        if not blacklist_channels:
+            print(f"Blacklist channel not found in guild {guild.id}.")
+            await ctx.send(f"Blacklist channel not found in this guild.", ephemeral=True)
+            return
+
         if blacklist_channels:
             first_blacklist_channel_id = blacklist_channels[0].id
-            self.db_servers.set_last_sync_details(str(guild.id), current_sync_hash)
-            self.db_servers.record_sync_details(str(guild.id), first_blacklist_channel_id, str(len(keys_values)))
+            await self.db_servers.commit_guild_sync(str(guild.id), current_sync_hash, first_blacklist_channel_id, str(total_users), claim_token)
+            await self.db.set_changelog_offset(consumer, head_id)
 
-        await ctx.send(f"Synced {guild_synced_count} blacklisted users in this guild. Channel ID: {blacklist_channel.id}", ephemeral=True)
+        await ctx.send(f"Synced {guild_synced_count} blacklisted users in this guild. Channel ID: {blacklist_channels[0].id}", ephemeral=True)
         await ctx.edit(content="Syncing blacklists completed.", message=msg)
 
     async def try_ban(self,guild,user_id):
@@ -132,22 +185,67 @@ class SyncBlacklistsExtension(Extension):
         if not await self.is_user_whitelisted(ctx.author.id):
             return await ctx.send("You are not whitelisted!", ephemeral=True)
         await ctx.defer(ephemeral=True)
-        keys_values: Dict[str, Dict[str, str]] = self.db.list_all_users_info()
-        if not keys_values: return await ctx.send("There are no blacklisted users.", ephemeral=True)
         guild = ctx.guild
         if not guild: return await ctx.send("This command cannot be used in DMs.", ephemeral=True)
         if not guild.me.guild_permissions.BAN_MEMBERS: return await ctx.send("I do not have permission to ban members in this server.", ephemeral=True)
-        current_sync_hash: str = sha256(str(keys_values).encode('utf-8')).hexdigest()
+        current_sync_hash: str = await self.db.get_blacklist_version()
         print(f"current_sync_hash: {current_sync_hash}")
-        if self.db_servers.check_if_guild_synced(str(guild.id), current_sync_hash):
-            sync_details: Dict[str, str] = self.db_servers.get_sync_details(str(guild.id))
+        status, claim_token, sync_details = await self.db_servers.claim_guild_sync(str(guild.id), current_sync_hash)
+        if status == "synced":
             print(f"sync_details: {sync_details}")
             return await ctx.send(f"Blacklist in this guild is already up to date. Channel ID: {sync_details.get('channel_id', 'N/A')}, Users Synced: {sync_details.get('count', 'N/A')}", ephemeral=True)
-        guild_synced_count: int = 0
-        for user_id in keys_values.keys():
-            if not await self.is_user_whitelisted(user_id):
-                if await self.try_ban(guild, user_id): guild_synced_count += 1
+        if status == "busy": return await ctx.send("A blacklist sync is already running in this guild.", ephemeral=True)
+        renewer = asyncio.create_task(self.renew_claim(str(guild.id), claim_token))
+        try:
+            consumer: str = f"syncbans:{guild.id}"
+            head_id, keys_values = await self.get_pending_users(consumer)
+            if not await self.db.count_users(): return await ctx.send("There are no blacklisted users.", ephemeral=True)
+            guild_synced_count: int = 0
+            async for user_id, _ in keys_values:
+                if not await self.is_user_whitelisted(user_id):
+                    if await self.try_ban(guild, user_id): guild_synced_count += 1
+            await self.db.set_changelog_offset(consumer, head_id)
+        finally:
+            renewer.cancel()
+            await self.db_servers.release_guild_sync(str(guild.id), claim_token)
         await ctx.send(f"Synced {guild_synced_count} blacklisted users in this guild.", ephemeral=True)
+
+    @interactions.slash_command(name="sync_status", description="Shows the blacklist sync state of every guild the bot is in.")
+    async def sync_status(self, ctx: interactions.SlashContext):
+        if not await self.is_user_whitelisted(ctx.author.id):
+            return await ctx.send("You are not whitelisted!", ephemeral=True)
+        await ctx.defer(ephemeral=True)
+        version = await self.db.get_blacklist_version()
+        guilds = {str(guild.id): guild for guild in self.bot.guilds}
+        states = await self.db_servers.get_guild_sync_states(guilds.keys())
+        if not states: return await ctx.send("No guild sync state found.", ephemeral=True)
+        up_to_date = sum(state.is_current(version) for state in states)
+
+        lines = []
+        for state in states:
+            if state.channel_id is None:
+                status = "❌ Never synced"
+            elif state.is_current(version):
+                status = "✅ Up to date"
+            else:
+                status = f"⚠️ Behind (synced version {state.sync_hash or 'N/A'})"
+            users_synced = state.count if state.count is not None else "N/A"
+            synced_at = f"<t:{state.synced_at}:R>" if state.synced_at else "N/A"
+            lines.append(f"**{guilds[state.guild_id].name}** (`{state.guild_id}`)\n{status} · Users Synced: {users_synced} · Last Sync: {synced_at}")
+
+        pages = [lines[start:start + self.GUILDS_PER_STATUS_PAGE] for start in range(0, len(lines), self.GUILDS_PER_STATUS_PAGE)]
+        embeds = [
+            Embed(
+                title="Blacklist Sync Status",
+                description="\n\n".join(page),
+                color=Color.random(),
+                footer=EmbedFooter(text=f"Blacklist version {version} | {up_to_date}/{len(states)} guilds up to date | Page {index + 1} of {len(pages)}"),
+                timestamp=datetime.datetime.now().isoformat()
+            )
+            for index, page in enumerate(pages)
+        ]
+        paginator = Paginator.create_from_embeds(self.bot, *embeds)
+        await paginator.send(ctx, ephemeral=True)
     
     @interactions.slash_command(name="purge", description="purges all embeds and messages in channel")
     async def purge(self, ctx: interactions.SlashContext):
@@ -172,14 +270,13 @@ class SyncBlacklistsExtension(Extension):
         
         msg = await ctx.send("Syncing blacklists...", ephemeral=True)
         
-        keys_values = self.db.list_all_users_info()
-        if not keys_values:
+        total_users = await self.db.count_users()
+        if not total_users:
             await ctx.send("There are no blacklisted users.", ephemeral=True)
             return
         
-        current_sync_hash = sha256(str(keys_values).encode('utf-8')).hexdigest()
+        current_sync_hash = await self.db.get_blacklist_version()
         print(f"current_sync_hash: {current_sync_hash}")
-        total_users = len(keys_values)
         synced_count = 0
         synced_details = {}
         users_attempted_sync = set()
@@ -187,9 +284,9 @@ class SyncBlacklistsExtension(Extension):
         for guild in self.bot.guilds:
             if not guild.me.guild_permissions.BAN_MEMBERS: continue
             
-            if self.db_servers.check_if_guild_synced(str(guild.id), current_sync_hash):
+            if await self.db_servers.check_if_guild_synced(str(guild.id), current_sync_hash):
                 await ctx.send(f"Blacklist in guild {guild.id} is already up to date.", ephemeral=True)
-                sync_details = self.db_servers.get_sync_details(str(guild.id))
+                sync_details = await self.db_servers.get_sync_details(str(guild.id))
                 users_synced = sync_details.get("count", 'N/A')
                 channel_id = sync_details.get("channel_id", 'N/A')
                 synced_details[guild.id] = {"channel_id": channel_id, "count": users_synced}
@@ -197,7 +294,7 @@ class SyncBlacklistsExtension(Extension):
             
             guild_synced_count = 0
             
-            for user_id in keys_values.keys():
+            async for user_id, _ in self.db.iter_users_info():
                 try:
                     await guild.ban(user_id, reason="Blacklisted by the bot.")
                     users_attempted_sync.add(user_id)
@@ -213,7 +310,7 @@ class SyncBlacklistsExtension(Extension):
                 await ctx.send(f"Blacklist channel not found in guild {guild.id}.", ephemeral=True)
                 continue
             print(blacklist_channel)
-            for user_id, user_info in keys_values.items():
+            async for user_id, user_info in self.db.iter_users_info():
                 embed = Embed(
                     title=f"{user_info.get('username', 'N/A')} has been blacklisted!",
                     description=f"Here's some detailed information about the blacklist:",
@@ -241,8 +338,8 @@ class SyncBlacklistsExtension(Extension):
                 action_row = interactions.ActionRow(view_images_link_button, view_images_direct_button)
                 await blacklist_channel.send(embed=embed, components=[action_row])
                 
-            self.db_servers.set_last_sync_details(str(guild.id), current_sync_hash)
-            self.db_servers.record_sync_details(str(guild.id), blacklist_channel.id, str(guild_synced_count))
+            await self.db_servers.set_last_sync_details(str(guild.id), current_sync_hash)
+            await self.db_servers.record_sync_details(str(guild.id), blacklist_channel.id, str(guild_synced_count))
             synced_details[guild.id] = {"channel_id": blacklist_channel.id, "count": str(guild_synced_count)}
         
         total_unique_users = len(users_attempted_sync)
@@ -0,0 +1,164 @@
+import sqlite3
+import threading
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+SHORTCUT_MIME_TYPE = 'application/vnd.google-apps.shortcut'
+# Drive file fields the index stores, as requested from files().list and changes().list
+INDEX_FILE_FIELDS = 'id, name, mimeType, modifiedTime, size, md5Checksum, parents, trashed, shortcutDetails(targetId, targetMimeType)'
+# Bump when _SCHEMA changes; an index with another version is dropped and reloaded
+SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    mime_type TEXT NOT NULL,
+    modified_time TEXT,
+    size TEXT,
+    md5 TEXT,
+    target_id TEXT,
+    target_mime_type TEXT
+);
+CREATE INDEX IF NOT EXISTS files_name ON files (name);
+CREATE TABLE IF NOT EXISTS parents (
+    file_id TEXT NOT NULL,
+    parent_id TEXT NOT NULL,
+    PRIMARY KEY (file_id, parent_id)
+);
+CREATE INDEX IF NOT EXISTS parents_parent ON parents (parent_id);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class DriveIndex:
+    """
+    Local SQLite copy of Drive file metadata (names, MIME types, sizes, parents), kept
+    current by Drive.sync_index through the changes API. Lookups return dictionaries shaped
+    like Drive API file resources, or None when the index cannot answer. One connection is
+    shared by all threads behind a lock.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            if self.connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                self.connection.executescript("DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS parents; DROP TABLE IF EXISTS state;")
+                self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self.connection.executescript(_SCHEMA)
+
+    # Sync state
+
+    def get_state(self, key):
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key, value):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def page_token(self):
+        return self.get_state("page_token")
+
+    @property
+    def ready(self):
+        """
+        True once a full listing has been loaded, so that a missing row means the file
+        does not exist rather than that it was never indexed.
+        """
+        return self.page_token is not None
+
+    # Writes
+
+    def apply(self, files=(), removed_ids=(), page_token=None):
+        """
+        Upserts Drive file resources (trashed ones are removed) and deletes removed_ids in one
+        transaction, storing page_token with them so that the index and its position in
+        the changes feed never disagree.
+        """
+        upserts = [file for file in files if not file.get('trashed')]
+        removed = [file['id'] for file in files if file.get('trashed')] + list(removed_ids)
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO files (id, name, mime_type, modified_time, size, md5, target_id, target_mime_type) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (file['id'], file.get('name', ''), file.get('mimeType', ''), file.get('modifiedTime'), file.get('size'), file.get('md5Checksum'),
+                     file.get('shortcutDetails', {}).get('targetId'), file.get('shortcutDetails', {}).get('targetMimeType'))
+                    for file in upserts
+                ]
+            )
+            self.connection.executemany("DELETE FROM parents WHERE file_id = ?", [(file['id'],) for file in upserts if 'parents' in file])
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO parents (file_id, parent_id) VALUES (?, ?)",
+                [(file['id'], parent) for file in upserts for parent in file.get('parents', [])]
+            )
+            self.connection.executemany("DELETE FROM files WHERE id = ?", [(file_id,) for file_id in removed])
+            self.connection.executemany("DELETE FROM parents WHERE file_id = ?", [(file_id,) for file_id in removed])
+            if page_token is not None:
+                self.connection.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('page_token', ?)", (page_token,))
+
+    def clear(self):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM files")
+            self.connection.execute("DELETE FROM parents")
+            self.connection.execute("DELETE FROM state")
+
+    # Lookups
+
+    @staticmethod
+    def _resource(row):
+        file_id, name, mime_type, modified_time, size, _, target_id, target_mime_type = row
+        resource = {'id': file_id, 'name': name, 'mimeType': mime_type, 'modifiedTime': modified_time}
+        if size is not None:
+            resource['size'] = size
+        if target_id is not None:
+            resource['shortcutDetails'] = {'targetId': target_id, 'targetMimeType': target_mime_type}
+        return resource
+
+    def get_file(self, file_id):
+        with self.lock:
+            row = self.connection.execute("SELECT * FROM files WHERE id = ?", (file_id,)).fetchone()
+        return self._resource(row) if row else None
+
+    def list_children(self, parent_id, images_only=False):
+        """
+        Returns the files in a folder, or None if the folder is not indexed (or the index is
+        not loaded yet).
+        """
+        if not self.ready:
+            return None
+        query = "SELECT files.* FROM parents JOIN files ON files.id = parents.file_id WHERE parents.parent_id = ?"
+        if images_only:
+            query += " AND (files.mime_type LIKE 'image/%' OR files.target_mime_type LIKE 'image/%')"
+        with self.lock:
+            known = self.connection.execute(
+                "SELECT 1 FROM files WHERE id = ? AND mime_type = ?", (parent_id, FOLDER_MIME_TYPE)
+            ).fetchone()
+            if not known:
+                return None
+            rows = self.connection.execute(query, (parent_id,)).fetchall()
+        return [self._resource(row) for row in rows]
+
+    def find_id(self, name, mime_type=None, parent_id=None):
+        query = "SELECT files.id FROM files"
+        arguments = []
+        if parent_id is not None:
+            query += " JOIN parents ON parents.file_id = files.id AND parents.parent_id = ?"
+            arguments.append(parent_id)
+        query += " WHERE files.name = ?"
+        arguments.append(name)
+        if mime_type is not None:
+            query += " AND files.mime_type = ?"
+            arguments.append(mime_type)
+        with self.lock:
+            row = self.connection.execute(query + " LIMIT 1", arguments).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
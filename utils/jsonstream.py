@@ -0,0 +1,87 @@
+import json
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+def iter_ndjson(fp):
+    """
+    Yields one decoded object per non-empty line of a newline-delimited JSON stream.
+    """
+    for _, value in iter_ndjson_lines(fp):
+        yield value
+
+def iter_ndjson_lines(fp):
+    """
+    Like iter_ndjson, but yields (line number, decoded object) pairs.
+    """
+    for line_number, line in enumerate(fp, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON on line {line_number}: {e}") from e
+
+def iter_json_object_items(fp, chunk_size=65536):
+    """
+    Yields the (key, value) pairs of a top-level JSON object one at a time, reading fp in
+    chunks so the whole document never has to be held in memory.
+    """
+    buffer = ""
+    position = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[position:] + chunk
+        position = 0
+
+    def skip_whitespace():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            if position < len(buffer) or eof:
+                return
+            fill()
+
+    def expect(chars):
+        nonlocal position
+        skip_whitespace()
+        if position >= len(buffer) or buffer[position] not in chars:
+            found = buffer[position] if position < len(buffer) else "end of input"
+            raise ValueError(f"Expected one of {chars!r} in JSON object, found {found!r}")
+        position += 1
+        return buffer[position - 1]
+
+    def decode():
+        nonlocal position
+        skip_whitespace()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(buffer, position)
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(buffer) or eof or not isinstance(value, (int, float)):
+                    position = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            fill()
+
+    expect("{")
+    skip_whitespace()
+    if position < len(buffer) and buffer[position] == "}":
+        return
+    while True:
+        key = decode()
+        if not isinstance(key, str):
+            raise ValueError(f"Expected a string key in JSON object, found {key!r}")
+        expect(":")
+        yield key, decode()
+        if expect(",}") == "}":
+            return
@@ -0,0 +1,222 @@
+# Commands that take no key, passed through untouched
+_KEYLESS_COMMANDS = {
+    "publish", "pubsub", "pipeline", "execute", "reset", "register_script", "ping", "info",
+    "memory_stats", "close", "aclose", "get_encoder", "script_load", "time",
+}
+# Every positional argument is a key
+_ALL_KEYS_COMMANDS = {"delete", "exists", "unlink", "touch"}
+# The first argument is a key or a list of keys, any further positional arguments are keys
+_KEY_LIST_COMMANDS = {"sinter", "sunion", "sdiff", "mget"}
+# The first two positional arguments are keys
+_TWO_KEY_COMMANDS = {"rename", "renamenx", "smove"}
+# The second positional argument is the key (OBJECT ENCODING key)
+_SECOND_ARG_KEY_COMMANDS = {"object"}
+# Commands Redis Cluster refuses inside a pipeline; the pipeline wrapper runs them right after it
+_CLUSTER_DEFERRED_COMMANDS = {"publish"}
+
+def db_key_prefix(db):
+    """
+    Returns the key prefix a numbered database maps onto. The braces make it a hash tag, so
+    all keys of one database live in the same cluster slot and multi-key commands and Lua
+    scripts keep working. MULTI pipelines do not: redis-py's cluster pipeline sends the
+    queued commands without MULTI/EXEC, so writes that must be atomic go through Lua scripts.
+    """
+    return f"{{db{db}}}:"
+
+def _prefix_key(prefix, key):
+    if isinstance(key, bytes):
+        return prefix.encode('utf-8') + key
+    return f"{prefix}{key}"
+
+def _prefix_args(prefix, name, args, kwargs):
+    if name in _KEYLESS_COMMANDS:
+        return args, kwargs
+    if name in _ALL_KEYS_COMMANDS:
+        return tuple(_prefix_key(prefix, key) for key in args), kwargs
+    if name in _KEY_LIST_COMMANDS and args:
+        first = args[0]
+        first = [_prefix_key(prefix, key) for key in first] if isinstance(first, (list, tuple, set)) else _prefix_key(prefix, first)
+        return (first, *(_prefix_key(prefix, key) for key in args[1:])), kwargs
+    if name in _TWO_KEY_COMMANDS:
+        return tuple(_prefix_key(prefix, key) for key in args[:2]) + tuple(args[2:]), kwargs
+    if name in _SECOND_ARG_KEY_COMMANDS and len(args) > 1:
+        return (args[0], _prefix_key(prefix, args[1]), *args[2:]), kwargs
+    if args:
+        return (_prefix_key(prefix, args[0]), *args[1:]), kwargs
+    if "name" in kwargs:
+        return args, {**kwargs, "name": _prefix_key(prefix, kwargs["name"])}
+    return args, kwargs
+
+class PrefixedRedis:
+    """
+    Wraps a redis-py client (typically a shared RedisCluster) so that every key is stored
+    under db_key_prefix(db): code written for numbered databases runs unchanged on a single
+    keyspace. SCAN results have the prefix stripped, FLUSHDB only removes this database's
+    keys and close() leaves the shared client open.
+    """
+    def __init__(self, client, prefix, pubsub_client=None):
+        self.client = client
+        self.prefix = prefix
+        self.pubsub_client = pubsub_client
+
+    def __getattr__(self, name):
+        command = getattr(self.client, name)
+        if not callable(command):
+            return command
+
+        def call(*args, **kwargs):
+            args, kwargs = _prefix_args(self.prefix, name, args, kwargs)
+            return command(*args, **kwargs)
+        return call
+
+    def _match(self, match):
+        return _prefix_key(self.prefix, match if match is not None else "*")
+
+    def _strip(self, key):
+        return key[len(self.prefix):] if isinstance(key, str) else key[len(self.prefix.encode('utf-8')):]
+
+    def scan_iter(self, match=None, count=None, _type=None):
+        for key in self.client.scan_iter(match=self._match(match), count=count, _type=_type):
+            yield self._strip(key)
+
+    def flushdb(self, asynchronous=False):
+        batch = []
+        for key in self.client.scan_iter(match=self._match(None), count=1000):
+            batch.append(key)
+            if len(batch) >= 1000:
+                self.client.delete(*batch)
+                batch = []
+        if batch:
+            self.client.delete(*batch)
+        return True
+
+    def dbsize(self):
+        return sum(1 for _ in self.client.scan_iter(match=self._match(None), count=1000))
+
+    def register_script(self, script):
+        return PrefixedScript(self.client.register_script(script), self.prefix)
+
+    def pipeline(self, *args, **kwargs):
+        return PrefixedPipeline(self.client.pipeline(*args, **kwargs), self)
+
+    def pubsub(self, **kwargs):
+        return (self.pubsub_client or self.client).pubsub(**kwargs)
+
+    def close(self):
+        pass
+
+class AsyncPrefixedRedis(PrefixedRedis):
+    """
+    PrefixedRedis for redis.asyncio clients.
+    """
+    async def scan_iter(self, match=None, count=None, _type=None):
+        async for key in self.client.scan_iter(match=self._match(match), count=count, _type=_type):
+            yield self._strip(key)
+
+    async def flushdb(self, asynchronous=False):
+        batch = []
+        async for key in self.client.scan_iter(match=self._match(None), count=1000):
+            batch.append(key)
+            if len(batch) >= 1000:
+                await self.client.delete(*batch)
+                batch = []
+        if batch:
+            await self.client.delete(*batch)
+        return True
+
+    async def dbsize(self):
+        return len([key async for key in self.client.scan_iter(match=self._match(None), count=1000)])
+
+    def pipeline(self, *args, **kwargs):
+        return AsyncPrefixedPipeline(self.client.pipeline(*args, **kwargs), self)
+
+    async def aclose(self):
+        pass
+
+    async def close(self):
+        pass
+
+class PrefixedScript:
+    def __init__(self, script, prefix):
+        self.script = script
+        self.prefix = prefix
+
+    def __call__(self, keys=[], args=[], client=None):
+        return self.script(keys=[_prefix_key(self.prefix, key) for key in keys], args=args)
+
+class PrefixedPipeline:
+    """
+    Prefixes the keys of queued commands. Commands a cluster pipeline refuses (PUBLISH) are
+    held back and sent through the client after the batch, with their replies spliced
+    into the results at their queued positions.
+    """
+    def __init__(self, pipeline, owner):
+        self.pipeline = pipeline
+        self.owner = owner
+        self.deferred = []
+        self.queued = 0
+
+    def __getattr__(self, name):
+        command = getattr(self.pipeline, name)
+        if name in _CLUSTER_DEFERRED_COMMANDS:
+            def defer(*args, **kwargs):
+                self.deferred.append((self.queued, name, args, kwargs))
+                self.queued += 1
+                return self
+            return defer
+
+        def queue(*args, **kwargs):
+            args, kwargs = _prefix_args(self.owner.prefix, name, args, kwargs)
+            command(*args, **kwargs)
+            self.queued += 1
+            return self
+        return queue
+
+    def __len__(self):
+        return self.queued
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.reset()
+
+    def reset(self):
+        self.pipeline.reset()
+        self.deferred = []
+        self.queued = 0
+
+    def _splice(self, results, deferred_results):
+        results = list(results)
+        for (position, *_), result in zip(self.deferred, deferred_results):
+            results.insert(position, result)
+        return results
+
+    def execute(self, raise_on_error=True):
+        results = self.pipeline.execute(raise_on_error=raise_on_error)
+        deferred_results = [getattr(self.owner, name)(*args, **kwargs) for _, name, args, kwargs in self.deferred]
+        results = self._splice(results, deferred_results)
+        self.deferred = []
+        self.queued = 0
+        return results
+
+class AsyncPrefixedPipeline(PrefixedPipeline):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.reset()
+
+    async def reset(self):
+        # redis.asyncio's ClusterPipeline has no reset(); both pipeline types clear on __aexit__
+        await self.pipeline.__aexit__(None, None, None)
+        self.deferred = []
+        self.queued = 0
+
+    async def execute(self, raise_on_error=True):
+        results = await self.pipeline.execute(raise_on_error=raise_on_error)
+        deferred_results = [await getattr(self.owner, name)(*args, **kwargs) for _, name, args, kwargs in self.deferred]
+        results = self._splice(results, deferred_results)
+        self.deferred = []
+        self.queued = 0
+        return results
@@ -0,0 +1,86 @@
+import inspect
+import time
+from collections import deque
+from functools import wraps
+from threading import Lock
+
+class LatencyTracker:
+    """
+    Records call durations per operation name, keeping the most recent window samples of
+    each in a ring buffer, and reports call counts and latency percentiles.
+    """
+    def __init__(self, window=1024):
+        self.window = window
+        self._samples = {}
+        self._calls = {}
+        self._lock = Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+                self._calls[name] = 0
+            samples.append(seconds)
+            self._calls[name] += 1
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._calls.clear()
+
+    def stats(self, percentiles=(50, 95, 99)):
+        """
+        Returns {name: {"calls": ..., "p50": ms, ..., "max": ms}} over the recent samples of
+        every operation, ordered slowest first by the last requested percentile.
+        """
+        with self._lock:
+            snapshot = {name: (self._calls[name], sorted(samples)) for name, samples in self._samples.items()}
+        report = {}
+        for name, (calls, samples) in snapshot.items():
+            entry = {"calls": calls}
+            for percentile in percentiles:
+                index = min(len(samples) - 1, int(round(percentile / 100 * (len(samples) - 1))))
+                entry[f"p{percentile}"] = samples[index] * 1000
+            entry["max"] = samples[-1] * 1000
+            report[name] = entry
+        key = f"p{percentiles[-1]}" if percentiles else "max"
+        return dict(sorted(report.items(), key=lambda item: item[1][key], reverse=True))
+
+def instrument_methods(tracker, prefix=None, exclude=()):
+    """
+    Class decorator timing every public method but those in exclude into tracker as
+    "<prefix>.<method>" (prefix defaults to the class name). Coroutine methods are timed
+    until they complete; generator methods are left alone since their cost is spread over
+    the caller's iteration.
+    """
+    def decorate(cls):
+        label = prefix or cls.__name__
+        for name, method in list(vars(cls).items()):
+            if name.startswith("_") or name in exclude or not inspect.isfunction(method):
+                continue
+            if inspect.isgeneratorfunction(method) or inspect.isasyncgenfunction(method):
+                continue
+            setattr(cls, name, _timed(tracker, f"{label}.{name}", method))
+        return cls
+    return decorate
+
+def _timed(tracker, name, func):
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                tracker.record(name, time.perf_counter() - start)
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            tracker.record(name, time.perf_counter() - start)
+    return wrapper
@@ -0,0 +1,707 @@
+import asyncio
+import re
+import threading
+import time
+import redis
+
+_stores = {}
+_script_implementations = {}
+
+def get_memory_store(db=0):
+    """
+    Returns the process-wide in-memory store for a database number, creating it on first use,
+    so that every MemoryRedis/AsyncMemoryRedis client of the same db sees the same data.
+    """
+    if db not in _stores:
+        _stores[db] = MemoryStore()
+    return _stores[db]
+
+def script_implementation(script):
+    """
+    Registers a Python function as the in-memory equivalent of a Lua script, for
+    MemoryRedis.register_script. The function is called as func(client, keys, args) while
+    the store lock is held, so it runs atomically like the script would.
+    """
+    def decorator(func):
+        _script_implementations[script] = func
+        return func
+    return decorator
+
+def _encode(value):
+    # Mirrors redis-py's Encoder so replies have the same types as a real server's
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, bool) or value is None:
+        raise redis.DataError(f"Invalid input of type: '{type(value).__name__}'. Convert to a bytes, string, int or float first.")
+    if isinstance(value, (int, float)):
+        return repr(value).encode('utf-8')
+    return str(value).encode('utf-8')
+
+def _glob_to_regex(pattern):
+    """
+    Compiles a Redis glob pattern (*, ?, [...], [^...], backslash escapes) to a bytes regex.
+    """
+    pattern = _encode(pattern)
+    parts = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i:i + 1]
+        if char == b"*":
+            parts.append(b".*")
+        elif char == b"?":
+            parts.append(b".")
+        elif char == b"\\" and i + 1 < len(pattern):
+            i += 1
+            parts.append(re.escape(pattern[i:i + 1]))
+        elif char == b"[" and pattern.find(b"]", i + 1) != -1:
+            end = pattern.find(b"]", i + 1)
+            body = pattern[i + 1:end]
+            negate = body.startswith(b"^")
+            if negate:
+                body = body[1:]
+            members = b"".join(b"-" if body[j:j + 1] == b"-" else re.escape(body[j:j + 1]) for j in range(len(body)))
+            parts.append(b"[" + (b"^" if negate else b"") + members + b"]")
+            i = end
+        else:
+            parts.append(re.escape(char))
+        i += 1
+    return re.compile(b"".join(parts) + rb"\Z", re.DOTALL)
+
+def _stream_id(value, default_sequence):
+    value = _encode(value).decode('utf-8')
+    if value == "-":
+        return (0, 0)
+    if value == "+":
+        return (float("inf"), float("inf"))
+    milliseconds, _, sequence = value.partition("-")
+    return int(milliseconds), int(sequence) if sequence else default_sequence
+
+class _SortedSet(dict):
+    pass
+
+class _Stream(list):
+    def __init__(self):
+        super().__init__()
+        self.last_id = (0, 0)
+        self.max_deleted_id = (0, 0)
+
+_TYPE_NAMES = {bytes: b"string", dict: b"hash", set: b"set", _SortedSet: b"zset", _Stream: b"stream"}
+
+class MemoryStore:
+    """
+    The data behind one in-memory database: keys, expiry deadlines and pub/sub subscribers.
+    Every command runs under lock, and pipelines hold it for their whole batch.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.data = {}
+        self.expires = {}
+        self.subscribers = {}
+
+class MemoryRedis:
+    """
+    In-process stand-in for a redis-py client (decode_responses=False), implementing the
+    command subset database.py and the extensions use, with the same reply types.
+    Lua scripts are served by the Python equivalents registered with script_implementation.
+    Clients of the same db share a store, so data outlives the client like it would on a server.
+    """
+    def __init__(self, store=None):
+        self.store = store if store is not None else MemoryStore()
+
+    # Keyspace helpers
+
+    def _value(self, key):
+        key = _encode(key)
+        deadline = self.store.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.store.data.pop(key, None)
+            del self.store.expires[key]
+        return self.store.data.get(key)
+
+    def _typed(self, key, value_type, create=False):
+        value = self._value(key)
+        if value is None:
+            if not create:
+                return None
+            value = self.store.data[_encode(key)] = value_type()
+        elif type(value) is not value_type:
+            raise redis.ResponseError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def _drop_if_empty(self, key, value):
+        if value is not None and not value:
+            self._delete(_encode(key))
+
+    def _delete(self, key):
+        self.store.expires.pop(key, None)
+        return self.store.data.pop(key, None) is not None
+
+    def _live_keys(self):
+        return [key for key in list(self.store.data) if self._value(key) is not None]
+
+    # Generic commands
+
+    def delete(self, *names):
+        with self.store.lock:
+            return sum(self._value(name) is not None and self._delete(_encode(name)) for name in names)
+
+    def exists(self, *names):
+        with self.store.lock:
+            return sum(self._value(name) is not None for name in names)
+
+    def type(self, name):
+        with self.store.lock:
+            value = self._value(name)
+            return _TYPE_NAMES[type(value)] if value is not None else b"none"
+
+    def renamenx(self, src, dst):
+        with self.store.lock:
+            value = self._value(src)
+            if value is None:
+                raise redis.ResponseError("no such key")
+            if self._value(dst) is not None:
+                return False
+            deadline = self.store.expires.pop(_encode(src), None)
+            self._delete(_encode(src))
+            self.store.data[_encode(dst)] = value
+            if deadline is not None:
+                self.store.expires[_encode(dst)] = deadline
+            return True
+
+    def pexpire(self, name, time_ms):
+        with self.store.lock:
+            if self._value(name) is None:
+                return False
+            self.store.expires[_encode(name)] = time.monotonic() + int(time_ms) / 1000
+            return True
+
+    def scan_iter(self, match=None, count=None, _type=None):
+        with self.store.lock:
+            keys = self._live_keys()
+        regex = _glob_to_regex(match) if match is not None else None
+        for key in keys:
+            if regex is not None and not regex.match(key):
+                continue
+            if _type is not None and self.type(key) != _encode(_type).lower():
+                continue
+            yield key
+
+    def dbsize(self):
+        with self.store.lock:
+            return len(self._live_keys())
+
+    def flushdb(self, asynchronous=False):
+        with self.store.lock:
+            self.store.data.clear()
+            self.store.expires.clear()
+            return True
+
+    def memory_usage(self, key, samples=None):
+        """
+        Rough per-key estimate from payload sizes plus fixed overheads; not allocator numbers.
+        """
+        with self.store.lock:
+            value = self._value(key)
+            if value is None:
+                return None
+            size = 56 + len(_encode(key))
+            if isinstance(value, bytes):
+                return size + len(value)
+            if isinstance(value, _Stream):
+                return size + sum(len(entry_id) + sum(len(k) + len(v) for k, v in fields.items()) for _, entry_id, fields in value)
+            if isinstance(value, dict):
+                return size + sum(len(k) + len(_encode(v)) + 16 for k, v in value.items())
+            return size + sum(len(member) + 16 for member in value)
+
+    def object(self, infotype, key):
+        """
+        Supports OBJECT ENCODING only: the encoding Redis would pick for the value under its
+        default size thresholds.
+        """
+        if str(infotype).lower() != "encoding":
+            raise redis.ResponseError(f"OBJECT {infotype} is not supported by the memory backend")
+        with self.store.lock:
+            value = self._value(key)
+            if value is None:
+                return None
+            if isinstance(value, bytes):
+                if len(value) <= 20 and value.lstrip(b"-").isdigit():
+                    return b"int"
+                return b"embstr" if len(value) <= 44 else b"raw"
+            if isinstance(value, _Stream):
+                return b"stream"
+            small = len(value) <= 128 and all(len(item) <= 64 for item in value) and \
+                (not isinstance(value, dict) or isinstance(value, _SortedSet) or all(len(item) <= 64 for item in value.values()))
+            if isinstance(value, _SortedSet):
+                return b"listpack" if small else b"skiplist"
+            if isinstance(value, set) and len(value) <= 512 and all(item.lstrip(b"-").isdigit() for item in value):
+                return b"intset"
+            return b"listpack" if small else b"hashtable"
+
+    # Strings
+
+    def get(self, name):
+        with self.store.lock:
+            return self._typed(name, bytes)
+
+    def set(self, name, value, ex=None, px=None, nx=False, xx=False, keepttl=False):
+        with self.store.lock:
+            exists = self._value(name) is not None
+            if (nx and exists) or (xx and not exists):
+                return None
+            key = _encode(name)
+            self.store.data[key] = _encode(value)
+            if ex is not None or px is not None:
+                self.store.expires[key] = time.monotonic() + (float(ex) if ex is not None else float(px) / 1000)
+            elif not keepttl:
+                self.store.expires.pop(key, None)
+            return True
+
+    def incr(self, name, amount=1):
+        with self.store.lock:
+            value = int(self._typed(name, bytes) or 0) + amount
+            self.store.data[_encode(name)] = _encode(value)
+            return value
+
+    # Hashes
+
+    def hset(self, name, key=None, value=None, mapping=None, items=None):
+        with self.store.lock:
+            pairs = list(mapping.items()) if mapping else []
+            if key is not None:
+                pairs.append((key, value))
+            if items:
+                pairs.extend(zip(items[::2], items[1::2]))
+            if not pairs:
+                raise redis.DataError("'hset' with no key value pairs")
+            encoded = [(_encode(k), _encode(v)) for k, v in pairs]
+            hash_value = self._typed(name, dict, create=True)
+            added = 0
+            for k, v in encoded:
+                added += k not in hash_value
+                hash_value[k] = v
+            return added
+
+    def hsetnx(self, name, key, value):
+        with self.store.lock:
+            hash_value = self._typed(name, dict, create=True)
+            if _encode(key) in hash_value:
+                return False
+            hash_value[_encode(key)] = _encode(value)
+            return True
+
+    def hget(self, name, key):
+        with self.store.lock:
+            return (self._typed(name, dict) or {}).get(_encode(key))
+
+    def hmget(self, name, keys, *args):
+        keys = ([keys] if isinstance(keys, (str, bytes)) else list(keys)) + list(args)
+        with self.store.lock:
+            hash_value = self._typed(name, dict) or {}
+            return [hash_value.get(_encode(key)) for key in keys]
+
+    def hgetall(self, name):
+        with self.store.lock:
+            return dict(self._typed(name, dict) or {})
+
+    def hdel(self, name, *keys):
+        with self.store.lock:
+            hash_value = self._typed(name, dict)
+            if hash_value is None:
+                return 0
+            removed = sum(hash_value.pop(_encode(key), None) is not None for key in keys)
+            self._drop_if_empty(name, hash_value)
+            return removed
+
+    def hlen(self, name):
+        with self.store.lock:
+            return len(self._typed(name, dict) or {})
+
+    # Sets
+
+    def sadd(self, name, *values):
+        with self.store.lock:
+            encoded = [_encode(value) for value in values]
+            members = self._typed(name, set, create=True)
+            before = len(members)
+            members.update(encoded)
+            return len(members) - before
+
+    def srem(self, name, *values):
+        with self.store.lock:
+            members = self._typed(name, set)
+            if members is None:
+                return 0
+            before = len(members)
+            members.difference_update(_encode(value) for value in values)
+            removed = before - len(members)
+            self._drop_if_empty(name, members)
+            return removed
+
+    def smembers(self, name):
+        with self.store.lock:
+            return set(self._typed(name, set) or ())
+
+    def sismember(self, name, value):
+        with self.store.lock:
+            return _encode(value) in (self._typed(name, set) or ())
+
+    def scard(self, name):
+        with self.store.lock:
+            return len(self._typed(name, set) or ())
+
+    def srandmember(self, name, number=None):
+        with self.store.lock:
+            members = list(self._typed(name, set) or ())
+        if number is None:
+            return members[0] if members else None
+        return members[:number] if number >= 0 else [members[i % len(members)] for i in range(-number)] if members else []
+
+    def sinter(self, keys, *args):
+        keys = ([keys] if isinstance(keys, (str, bytes)) else list(keys)) + list(args)
+        with self.store.lock:
+            sets = [self._typed(key, set) or set() for key in keys]
+        return set.intersection(*sets) if sets else set()
+
+    def sscan(self, name, cursor=0, match=None, count=None):
+        # The cursor is an offset into the sorted members; 0 again once the scan is complete
+        with self.store.lock:
+            members = sorted(self._typed(name, set) or ())
+        regex = _glob_to_regex(match) if match is not None else None
+        cursor = int(cursor)
+        end = cursor + (count or 10)
+        page = [member for member in members[cursor:end] if regex is None or regex.match(member)]
+        return (end if end < len(members) else 0), page
+
+    def sscan_iter(self, name, match=None, count=None):
+        with self.store.lock:
+            members = list(self._typed(name, set) or ())
+        regex = _glob_to_regex(match) if match is not None else None
+        for member in members:
+            if regex is None or regex.match(member):
+                yield member
+
+    # Sorted sets
+
+    def zadd(self, name, mapping, nx=False, xx=False, ch=False, incr=False, gt=False, lt=False):
+        with self.store.lock:
+            encoded = [(_encode(member), float(score)) for member, score in mapping.items()]
+            scores = self._typed(name, _SortedSet, create=True)
+            changed = 0
+            for member, score in encoded:
+                old = scores.get(member)
+                if (nx and old is not None) or (xx and old is None):
+                    continue
+                if old is not None and ((gt and score <= old) or (lt and score >= old)):
+                    continue
+                scores[member] = score
+                changed += old is None or (ch and old != score)
+            self._drop_if_empty(name, scores)
+            return changed
+
+    def zrem(self, name, *values):
+        with self.store.lock:
+            scores = self._typed(name, _SortedSet)
+            if scores is None:
+                return 0
+            removed = sum(scores.pop(_encode(value), None) is not None for value in values)
+            self._drop_if_empty(name, scores)
+            return removed
+
+    def zscore(self, name, value):
+        with self.store.lock:
+            return (self._typed(name, _SortedSet) or {}).get(_encode(value))
+
+    def zcard(self, name):
+        with self.store.lock:
+            return len(self._typed(name, _SortedSet) or {})
+
+    def _sorted_members(self, name):
+        return sorted((self._typed(name, _SortedSet) or {}).items(), key=lambda item: (item[1], item[0]))
+
+    def zrangebyscore(self, name, min, max, start=None, num=None, withscores=False):
+        def bound(value, inclusive_default):
+            value = _encode(value).decode('utf-8')
+            if value in ("-inf", "+inf", "inf"):
+                return float(value), True
+            if value.startswith("("):
+                return float(value[1:]), False
+            return float(value), inclusive_default
+
+        (low, low_inclusive), (high, high_inclusive) = bound(min, True), bound(max, True)
+        with self.store.lock:
+            items = [
+                (member, score) for member, score in self._sorted_members(name)
+                if (score > low or (low_inclusive and score == low)) and (score < high or (high_inclusive and score == high))
+            ]
+        if start is not None and num is not None:
+            items = items[start:start + num] if num >= 0 else items[start:]
+        return items if withscores else [member for member, _ in items]
+
+    def zrangebylex(self, name, min, max, start=None, num=None):
+        def bound(value):
+            value = _encode(value)
+            if value in (b"-", b"+"):
+                return value, True
+            return value[1:], value.startswith(b"[")
+
+        (low, low_inclusive), (high, high_inclusive) = bound(min), bound(max)
+        with self.store.lock:
+            members = sorted((self._typed(name, _SortedSet) or {}).keys())
+        items = [
+            member for member in members
+            if (low == b"-" or member > low or (low_inclusive and member == low))
+            and (high == b"+" or member < high or (high_inclusive and member == high))
+        ]
+        if start is not None and num is not None:
+            items = items[start:start + num] if num >= 0 else items[start:]
+        return items
+
+    def zscan_iter(self, name, match=None, count=None, score_cast_func=float):
+        with self.store.lock:
+            items = self._sorted_members(name)
+        regex = _glob_to_regex(match) if match is not None else None
+        for member, score in items:
+            if regex is None or regex.match(member):
+                yield member, score_cast_func(score)
+
+    # Streams
+
+    def xadd(self, name, fields, id="*", maxlen=None, approximate=True, nomkstream=False, minid=None, limit=None):
+        with self.store.lock:
+            if nomkstream and self._value(name) is None:
+                return None
+            stream = self._typed(name, _Stream, create=True)
+            if id == "*":
+                milliseconds = int(time.time() * 1000)
+                if milliseconds <= stream.last_id[0]:
+                    entry_id = (stream.last_id[0], stream.last_id[1] + 1)
+                else:
+                    entry_id = (milliseconds, 0)
+            else:
+                entry_id = _stream_id(id, 0)
+                if entry_id <= stream.last_id:
+                    raise redis.ResponseError("The ID specified in XADD is equal or smaller than the target stream top item")
+            stream.last_id = entry_id
+            entry_key = f"{entry_id[0]}-{entry_id[1]}".encode('utf-8')
+            stream.append((entry_id, entry_key, {_encode(k): _encode(v) for k, v in fields.items()}))
+            if maxlen is not None and len(stream) > maxlen:
+                stream.max_deleted_id = stream[len(stream) - maxlen - 1][0]
+                del stream[:len(stream) - maxlen]
+            return entry_key
+
+    def _stream_range(self, name, min, max):
+        min_exclusive, max_exclusive = _encode(min).startswith(b"("), _encode(max).startswith(b"(")
+        low = _stream_id(_encode(min).lstrip(b"("), 0)
+        high = _stream_id(_encode(max).lstrip(b"("), float("inf"))
+        return [
+            (entry_key, dict(fields)) for entry_id, entry_key, fields in self._typed(name, _Stream) or ()
+            if (entry_id > low if min_exclusive else entry_id >= low) and (entry_id < high if max_exclusive else entry_id <= high)
+        ]
+
+    def xrange(self, name, min="-", max="+", count=None):
+        with self.store.lock:
+            entries = self._stream_range(name, min, max)
+        return entries[:count] if count is not None else entries
+
+    def xrevrange(self, name, max="+", min="-", count=None):
+        with self.store.lock:
+            entries = self._stream_range(name, min, max)[::-1]
+        return entries[:count] if count is not None else entries
+
+    def xlen(self, name):
+        with self.store.lock:
+            return len(self._typed(name, _Stream) or ())
+
+    def xinfo_stream(self, name):
+        with self.store.lock:
+            stream = self._typed(name, _Stream)
+            if stream is None:
+                raise redis.ResponseError("no such key")
+            return {
+                "length": len(stream),
+                "last-generated-id": "{}-{}".format(*stream.last_id).encode('utf-8'),
+                "max-deleted-entry-id": "{}-{}".format(*stream.max_deleted_id).encode('utf-8'),
+                "first-entry": (stream[0][1], dict(stream[0][2])) if stream else None,
+                "last-entry": (stream[-1][1], dict(stream[-1][2])) if stream else None,
+            }
+
+    # Pub/sub and scripting
+
+    def publish(self, channel, message):
+        channel, message = _encode(channel), _encode(message)
+        with self.store.lock:
+            subscribers = list(self.store.subscribers.get(channel, ()))
+        for subscriber in subscribers:
+            subscriber._deliver(channel, message)
+        return len(subscribers)
+
+    def register_script(self, script):
+        if script not in _script_implementations:
+            raise redis.ResponseError("NOSCRIPT No in-memory implementation registered for this script")
+        return MemoryScript(self, _script_implementations[script])
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return MemoryPipeline(self)
+
+    def close(self):
+        pass
+
+class MemoryScript:
+    def __init__(self, client, func):
+        self.client = client
+        self.func = func
+
+    def __call__(self, keys=[], args=[], client=None):
+        with self.client.store.lock:
+            return self.func(self.client, list(keys), list(args))
+
+class MemoryPipeline:
+    """
+    Buffers commands and runs them back to back under the store lock, which gives the
+    all-or-nothing visibility of MULTI/EXEC whether or not transaction was requested.
+    Like redis-py, execute() raises the first command error after running the batch.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.command_stack = []
+
+    def __getattr__(self, name):
+        command = getattr(self.client, name)
+
+        def queue(*args, **kwargs):
+            self.command_stack.append((command, args, kwargs))
+            return self
+        return queue
+
+    def __len__(self):
+        return len(self.command_stack)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.reset()
+
+    def reset(self):
+        self.command_stack = []
+
+    def execute(self, raise_on_error=True):
+        results = []
+        with self.client.store.lock:
+            for command, args, kwargs in self.command_stack:
+                try:
+                    result = command(*args, **kwargs)
+                    # Scan commands are generators; a pipeline can only hold concrete replies
+                    results.append(list(result) if hasattr(result, "__next__") else result)
+                except redis.ResponseError as e:
+                    results.append(e)
+        self.reset()
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, redis.ResponseError):
+                    raise result
+        return results
+
+class MemoryPubSub:
+    """
+    redis.asyncio-style PubSub over a MemoryStore: subscribe, then iterate listen().
+    Messages published from any thread are handed to the subscribing event loop.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.channels = set()
+        self._queue = asyncio.Queue()
+        self._loop = None
+
+    async def subscribe(self, *channels):
+        self._loop = asyncio.get_running_loop()
+        for channel in channels:
+            channel = _encode(channel)
+            with self.store.lock:
+                self.store.subscribers.setdefault(channel, set()).add(self)
+            self.channels.add(channel)
+            self._queue.put_nowait({"type": "subscribe", "pattern": None, "channel": channel, "data": len(self.channels)})
+
+    async def unsubscribe(self, *channels):
+        for channel in [_encode(channel) for channel in channels] or list(self.channels):
+            with self.store.lock:
+                self.store.subscribers.get(channel, set()).discard(self)
+            self.channels.discard(channel)
+
+    def _deliver(self, channel, message):
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, {"type": "message", "pattern": None, "channel": channel, "data": message})
+
+    async def listen(self):
+        while self.channels or not self._queue.empty():
+            yield await self._queue.get()
+
+    async def aclose(self):
+        await self.unsubscribe()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+class AsyncMemoryRedis:
+    """
+    redis.asyncio-style wrapper around MemoryRedis: the same commands as coroutines, async
+    scan iterators, async pipelines and scripts, and pub/sub.
+    """
+    def __init__(self, store=None):
+        self.client = MemoryRedis(store)
+        self.store = self.client.store
+
+    def __getattr__(self, name):
+        command = getattr(self.client, name)
+
+        async def call(*args, **kwargs):
+            return command(*args, **kwargs)
+        return call
+
+    async def scan_iter(self, *args, **kwargs):
+        for key in self.client.scan_iter(*args, **kwargs):
+            yield key
+
+    async def sscan_iter(self, *args, **kwargs):
+        for member in self.client.sscan_iter(*args, **kwargs):
+            yield member
+
+    async def zscan_iter(self, *args, **kwargs):
+        for item in self.client.zscan_iter(*args, **kwargs):
+            yield item
+
+    def register_script(self, script):
+        return AsyncMemoryScript(self.client.register_script(script))
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return AsyncMemoryPipeline(self.client)
+
+    def pubsub(self):
+        return MemoryPubSub(self.store)
+
+    async def aclose(self):
+        pass
+
+    async def close(self):
+        pass
+
+class AsyncMemoryScript:
+    def __init__(self, script):
+        self.script = script
+
+    async def __call__(self, keys=[], args=[], client=None):
+        return self.script(keys=keys, args=args)
+
+class AsyncMemoryPipeline(MemoryPipeline):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.reset()
+
+    async def execute(self, raise_on_error=True):
+        return MemoryPipeline.execute(self, raise_on_error)